@@ -12,10 +12,10 @@ class BaseAndroidAgent(ABC):
     def __init__(self, env):
         """
         Initialize the agent.
-        :param env: AndroidDeviceEnv instance this agent will act on.
+        :param env: AndroidDeviceEnv instance this agent will act on, or a wrapper around one.
         """
 
-        assert isinstance(env, AndroidDeviceEnv), \
+        assert isinstance(env.unwrapped, AndroidDeviceEnv), \
             'Agent must be initialized with an environment that is an instance of AndroidDeviceEnv.'
 
         self.env = env
@@ -0,0 +1,164 @@
+"""
+Benchmark of the memory allocated per step by decoding observations and computing rewards, once the way every step
+used to, allocating new images and reward temporaries, and once through the frame pool and reward scratch buffers of
+the environment.
+
+Allocations are traced with tracemalloc, which sees numpy arrays and python objects but not the pixel buffers PIL
+allocates internally while decoding PNG images. The peak is the largest amount of memory a step holds at once on top
+of what was allocated before it, and kept is what a step leaves allocated when it returns, e.g. a new image replacing
+the previous one.
+
+No redis-server is needed. Run from the Multivac project directory:
+```bash
+export PYTHONPATH="${PYTHONPATH}:$(pwd)" &&
+python benchmarks/allocation_benchmark.py --num-steps 1000
+```
+"""
+
+import argparse
+import numpy as np
+import tracemalloc
+import zlib
+
+from io import BytesIO
+from PIL import Image
+
+from environment.android_device_env import AndroidDeviceEnv
+from environment.mean_pixel_difference_env import MeanPixelDifferenceEnv
+from eventobjects.observation import Observation, COMPRESSION_NONE, COMPRESSION_ZLIB, IMAGE_FORMAT_PNG, \
+    IMAGE_FORMAT_RAW_RGB
+
+# Cmd line parameters
+NUM_STEPS = "num-steps"
+NUM_WARMUP_STEPS = "num-warmup-steps"
+IMAGE_HEIGHT = "image-height"
+IMAGE_WIDTH = "image-width"
+
+
+def create_observations(image_height, image_width, image_format, compression):
+    """
+    Create two observations of random images, which the benchmarked steps alternate between.
+    :param image_height: height of the images in pixels.
+    :param image_width: width of the images in pixels.
+    :param image_format: IMAGE_FORMAT_PNG or IMAGE_FORMAT_RAW_RGB.
+    :param compression: compression of the payload, one of the COMPRESSION_* constants.
+    :return: list of two Observation objects.
+    """
+
+    observations = []
+    for _ in range(2):
+        image = np.random.randint(0, 256, size=(image_height, image_width, 3), dtype=np.uint8)
+
+        if image_format == IMAGE_FORMAT_PNG:
+            output = BytesIO()
+            Image.fromarray(image).save(output, format='png')
+            payload = output.getvalue()
+        else:
+            payload = image.tobytes()
+
+        if compression == COMPRESSION_ZLIB:
+            payload = zlib.compress(payload, 1)
+
+        observations.append(Observation(payload, image_format, compression, image_height, image_width))
+
+    return observations
+
+
+def allocating_step(environment, observation):
+    """
+    Decode an observation into a new array and compute the mean pixel difference reward with new temporaries.
+    :param environment: AndroidDeviceEnv object.
+    :param observation: Observation object.
+    """
+
+    new_observation = np.array(AndroidDeviceEnv.process_image_from_observation(observation))
+    np.mean(np.absolute(new_observation - environment.most_recent_observation))
+    environment.most_recent_observation = new_observation
+
+
+def pooled_step(environment, observation):
+    """
+    Decode an observation into the frame pool and compute the reward in the scratch buffers.
+    :param environment: AndroidDeviceEnv object.
+    :param observation: Observation object.
+    """
+
+    environment.finish_step(environment.process_observation(observation))
+
+
+def measure_allocations(step_fn, environment, observations, num_steps, num_warmup_steps):
+    """
+    Measure the memory allocated by steps.
+    :param step_fn: function taking (environment, observation) and taking one step.
+    :param environment: AndroidDeviceEnv object, reset to the first observation.
+    :param observations: list of Observation objects to step through in turn.
+    :param num_steps: number of measured steps.
+    :param num_warmup_steps: number of steps before the measurement, filling pools and caches.
+    :return: (mean peak bytes, max peak bytes, mean kept bytes) tuple over the steps.
+    """
+
+    environment.finish_reset(environment.process_observation(observations[0]))
+
+    for step in range(num_warmup_steps):
+        step_fn(environment, observations[(step + 1) % len(observations)])
+
+    tracemalloc.start()
+
+    peaks = []
+    kept = []
+    for step in range(num_steps):
+        # Clearing the traces also resets the peak, so every step is measured on its own.
+        tracemalloc.clear_traces()
+        step_fn(environment, observations[(step + 1) % len(observations)])
+        current, peak = tracemalloc.get_traced_memory()
+        peaks.append(peak)
+        kept.append(current)
+
+    tracemalloc.stop()
+
+    return np.mean(peaks), np.max(peaks), np.mean(kept)
+
+
+def parse_args():
+    """
+    Parse cmd line arguments.
+    :return: arguments that are accessible as args.PARAM_NAME
+    """
+
+    parser = argparse.ArgumentParser()
+
+    parser.add_argument('--' + NUM_STEPS, type=int, required=False, default=1000,
+                        help="Number of measured steps per format.")
+    parser.add_argument('--' + NUM_WARMUP_STEPS, type=int, required=False, default=10,
+                        help="Number of steps taken before measuring.")
+    parser.add_argument('--' + IMAGE_HEIGHT, type=int, required=False, default=1920,
+                        help="Height of the observation image in pixels.")
+    parser.add_argument('--' + IMAGE_WIDTH, type=int, required=False, default=1080,
+                        help="Width of the observation image in pixels.")
+
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    params = parse_args()
+
+    formats = [
+        ('png', IMAGE_FORMAT_PNG, COMPRESSION_NONE),
+        ('raw', IMAGE_FORMAT_RAW_RGB, COMPRESSION_NONE),
+        ('raw-zlib', IMAGE_FORMAT_RAW_RGB, COMPRESSION_ZLIB)
+    ]
+
+    frame_bytes = params.image_height * params.image_width * 3
+    print("frame size: {:.1f} MB".format(frame_bytes / 1e6))
+
+    for format_name, image_format, compression in formats:
+        observations = create_observations(params.image_height, params.image_width, image_format, compression)
+
+        for step_name, step_fn in [('allocating', allocating_step), ('pooled', pooled_step)]:
+            env = MeanPixelDifferenceEnv(None, None, params.image_height, params.image_width)
+            mean_peak, max_peak, mean_kept = measure_allocations(step_fn, env, observations, params.num_steps,
+                                                                params.num_warmup_steps)
+
+            print("{} {}: {:.2f} frames peak per step (max {:.2f}), {:.0f} bytes kept per step".format(
+                format_name, step_name, mean_peak / frame_bytes, max_peak / frame_bytes, mean_kept
+            ))
@@ -0,0 +1,161 @@
+"""
+Benchmark of the steps/sec a single event loop achieves with async_step() as the number of concurrently driven devices
+grows. Every device is simulated by a coroutine that answers each action with a fixed observation after a fixed
+latency, standing in for the tap and screenshot round trip of a real device. Devices are kept apart by session id.
+
+For comparison, the sync step() can drive a single device at no more than 1 / device latency steps/sec.
+
+Run from the Multivac project directory with a redis-server listening on the given port:
+```bash
+export PYTHONPATH="${PYTHONPATH}:$(pwd)" &&
+python benchmarks/async_env_benchmark.py --num-steps 50 --num-devices 1 2 4 8 16 32
+```
+"""
+
+import argparse
+import asyncio
+import numpy as np
+import time
+
+from buffers.action_buffer import ActionBuffer
+from buffers.async_buffer import AsyncBuffer, create_async_redis_client
+from buffers.buffer import delete_session_keys
+from buffers.observation_buffer import ObservationBuffer
+from buffers.redis_connection import create_redis_client
+from environment.mean_pixel_difference_env import MeanPixelDifferenceEnv
+from eventobjects.observation import Observation, IMAGE_FORMAT_RAW_RGB
+
+# Cmd line parameters
+NUM_STEPS = "num-steps"
+NUM_DEVICES = "num-devices"
+DEVICE_LATENCY = "device-latency"
+IMAGE_HEIGHT = "image-height"
+IMAGE_WIDTH = "image-width"
+REDIS_PORT = "redis-port"
+
+
+async def simulate_device(async_action_buffer, async_observation_buffer, observation, device_latency, stop_event):
+    """
+    Answer every action with the observation after device_latency seconds, until stop_event is set.
+    :param async_action_buffer: AsyncBuffer of the actions sent to the device.
+    :param async_observation_buffer: AsyncBuffer the observations are sent to.
+    :param observation: Observation object to send.
+    :param device_latency: time in seconds between an action and its observation.
+    :param stop_event: asyncio.Event signalling the end of the benchmark.
+    """
+
+    while not stop_event.is_set():
+        actions = await async_action_buffer.blocking_read_elems(1, timeout=1)
+        if not actions:
+            continue
+
+        await asyncio.sleep(device_latency)
+
+        # Observations carry the sequence id of the action they answer.
+        await async_observation_buffer.put_elem(Observation(observation.image_bytes, observation.image_format,
+                                                            observation.compression, observation.height,
+                                                            observation.width, actions[0].sequence_id))
+
+
+async def run_environment(environment, num_steps):
+    """
+    Reset the environment and take num_steps random actions on it.
+    :param environment: AndroidDeviceEnv object.
+    :param num_steps: number of steps to take.
+    """
+
+    await environment.async_reset()
+    for _ in range(num_steps):
+        await environment.async_step(environment.action_space.sample())
+
+    await environment.aclose()
+
+
+async def measure_steps_per_sec(redis_client, num_devices, num_steps, observation, device_latency):
+    """
+    Measure the steps/sec of driving num_devices simulated devices concurrently from one event loop.
+    :param redis_client: Redis client for an active connection.
+    :param num_devices: number of devices.
+    :param num_steps: number of steps per device.
+    :param observation: Observation object the devices send.
+    :param device_latency: time in seconds between an action and its observation.
+    :return: total steps/sec over all devices.
+    """
+
+    async_redis_client = create_async_redis_client(redis_client)
+    stop_event = asyncio.Event()
+
+    environments = []
+    devices = []
+    for device in range(num_devices):
+        session_id = "benchmark-{}".format(device)
+        action_buffer = ActionBuffer(redis_client, session_id=session_id)
+        observation_buffer = ObservationBuffer(redis_client, session_id=session_id)
+
+        environments.append(MeanPixelDifferenceEnv(action_buffer, observation_buffer, observation.height,
+                                                   observation.width))
+        async_action_buffer = AsyncBuffer(action_buffer, async_redis_client)
+        devices.append(asyncio.ensure_future(simulate_device(
+            async_action_buffer,
+            AsyncBuffer(observation_buffer, async_redis_client),
+            observation,
+            device_latency,
+            stop_event
+        )))
+
+    start = time.perf_counter()
+    await asyncio.gather(*[run_environment(environment, num_steps) for environment in environments])
+    elapsed = time.perf_counter() - start
+
+    stop_event.set()
+    await asyncio.gather(*devices)
+
+    # All devices share the asyncio client.
+    await async_action_buffer.aclose()
+
+    for device in range(num_devices):
+        delete_session_keys(redis_client, "benchmark-{}".format(device))
+
+    return num_devices * num_steps / elapsed
+
+
+def parse_args():
+    """
+    Parse cmd line arguments.
+    :return: arguments that are accessible as args.PARAM_NAME
+    """
+
+    parser = argparse.ArgumentParser()
+
+    parser.add_argument('--' + NUM_STEPS, type=int, required=False, default=50,
+                        help="Number of steps to take per device.")
+    parser.add_argument('--' + NUM_DEVICES, type=int, nargs='+', required=False, default=[1, 2, 4, 8, 16, 32],
+                        help="Numbers of concurrent devices to measure.")
+    parser.add_argument('--' + DEVICE_LATENCY, type=float, required=False, default=0.05,
+                        help="Time in seconds a simulated device takes to answer an action.")
+    parser.add_argument('--' + IMAGE_HEIGHT, type=int, required=False, default=192,
+                        help="Height of the observation image in pixels.")
+    parser.add_argument('--' + IMAGE_WIDTH, type=int, required=False, default=108,
+                        help="Width of the observation image in pixels.")
+    parser.add_argument('--' + REDIS_PORT, type=int, required=False, default=6379,
+                        help="Port of the local redis-server.")
+
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    params = parse_args()
+
+    client = create_redis_client(params.redis_port)
+
+    image = np.random.randint(0, 256, size=(params.image_height, params.image_width, 3), dtype=np.uint8)
+    raw_observation = Observation(image.tobytes(), IMAGE_FORMAT_RAW_RGB, height=params.image_height,
+                                  width=params.image_width)
+
+    print("sync step() bound for one device: {:.1f} steps/sec".format(1.0 / params.device_latency))
+
+    for devices in params.num_devices:
+        steps_per_sec = asyncio.new_event_loop().run_until_complete(
+            measure_steps_per_sec(client, devices, params.num_steps, raw_observation, params.device_latency)
+        )
+        print("{} devices: {:.1f} steps/sec".format(devices, steps_per_sec))
@@ -0,0 +1,97 @@
+"""
+Micro-benchmark comparing per-element cost of single vs batched Buffer operations against a local redis-server.
+
+Run from the Multivac project directory with a redis-server listening on the given port:
+```bash
+export PYTHONPATH="${PYTHONPATH}:$(pwd)" &&
+python benchmarks/buffer_benchmark.py --num-elems 5000
+```
+"""
+
+import argparse
+import time
+
+from buffers.action_buffer import ActionBuffer
+from buffers.redis_connection import create_redis_client
+from eventobjects.action import Action
+
+# Cmd line parameters
+NUM_ELEMS = "num-elems"
+BATCH_SIZE = "batch-size"
+REDIS_PORT = "redis-port"
+
+
+def time_fn(fn):
+    """
+    Time a single invocation of fn.
+    :param fn: function taking no arguments.
+    :return: elapsed wall clock time in seconds.
+    """
+
+    start = time.perf_counter()
+    fn()
+    return time.perf_counter() - start
+
+
+def run_benchmark(buffer, num_elems, batch_size):
+    """
+    Push and drain num_elems actions through the buffer, once element by element and once in batches.
+    :param buffer: Buffer to benchmark. It is cleared before each phase.
+    :param num_elems: Number of elements to move through the buffer per phase.
+    :param batch_size: Max number of elements per batched read.
+    :return: dict mapping phase name to per-element cost in microseconds.
+    """
+
+    elems = [Action((i, i)) for i in range(num_elems)]
+
+    def single_put():
+        for elem in elems:
+            buffer.put_elem(elem)
+
+    def single_read():
+        for _ in range(num_elems):
+            buffer.read_elem()
+
+    def batched_put():
+        buffer.put_elems(elems)
+
+    def batched_read():
+        remaining = num_elems
+        while remaining > 0:
+            remaining -= len(buffer.blocking_read_elems(batch_size, timeout=1))
+
+    results = {}
+    buffer.clearall()
+    for name, fn in [('single put_elem', single_put), ('single read_elem', single_read),
+                     ('batched put_elems', batched_put), ('batched blocking_read_elems', batched_read)]:
+        results[name] = time_fn(fn) * 1e6 / num_elems
+
+    buffer.clearall()
+    return results
+
+
+def parse_args():
+    """
+    Parse cmd line arguments.
+    :return: arguments that are accessible as args.PARAM_NAME
+    """
+
+    parser = argparse.ArgumentParser()
+
+    parser.add_argument('--' + NUM_ELEMS, type=int, required=False, default=5000,
+                        help="Number of elements to move through the buffer per phase.")
+    parser.add_argument('--' + BATCH_SIZE, type=int, required=False, default=1000,
+                        help="Max number of elements drained per batched read.")
+    parser.add_argument('--' + REDIS_PORT, type=int, required=False, default=6379,
+                        help="Port of the local redis-server.")
+
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    params = parse_args()
+
+    action_buffer = ActionBuffer(create_redis_client(params.redis_port))
+
+    for phase, cost in run_benchmark(action_buffer, params.num_elems, params.batch_size).items():
+        print("{:<30} {:>10.2f} us/elem".format(phase, cost))
@@ -0,0 +1,112 @@
+"""
+Benchmark of the time each registered environment takes to compute the reward of a step at phone resolutions. Frames
+alternate between two screens, part of which differ, so the reward is computed on realistic changes.
+
+No redis-server is needed. Run from the Multivac project directory:
+```bash
+export PYTHONPATH="${PYTHONPATH}:$(pwd)" &&
+python benchmarks/reward_benchmark.py --num-steps 200
+```
+"""
+
+import argparse
+import numpy as np
+import time
+
+from environment.environment_registry import ENVIRONMENTS
+
+# Cmd line parameters
+NUM_STEPS = "num-steps"
+RESOLUTIONS = "resolutions"
+BUDGET_MS = "budget-ms"
+
+
+def create_screens(image_height, image_width):
+    """
+    Create two screens: a random one and a copy with a new block of content in its middle third.
+    :param image_height: height of the screens in pixels.
+    :param image_width: width of the screens in pixels.
+    :return: list of two numpy arrays (H x W x 3).
+    """
+
+    screen = np.random.randint(0, 256, size=(image_height, image_width, 3), dtype=np.uint8)
+
+    changed_screen = screen.copy()
+    changed_screen[image_height // 3:2 * image_height // 3] = np.random.randint(
+        0, 256, size=(2 * image_height // 3 - image_height // 3, image_width, 3), dtype=np.uint8)
+
+    return [screen, changed_screen]
+
+
+def measure_reward_time(environment, screens, num_steps):
+    """
+    Measure the mean time of compute_reward() as taken within steps alternating between screens.
+    :param environment: AndroidDeviceEnv object.
+    :param screens: list of numpy arrays to step through in turn.
+    :param num_steps: number of measured steps.
+    :return: mean time in milliseconds.
+    """
+
+    environment.reset_state()
+    environment.finish_reset(screens[0])
+
+    # A first step allocates the scratch buffers.
+    environment.finish_step(screens[1])
+
+    elapsed = 0.0
+    for step in range(num_steps):
+        screen = screens[step % len(screens)]
+
+        start = time.perf_counter()
+        environment.finish_step(screen)
+        elapsed += time.perf_counter() - start
+
+    return 1000.0 * elapsed / num_steps
+
+
+def parse_resolution(resolution):
+    """
+    Parse a WIDTHxHEIGHT resolution.
+    :param resolution: string such as 1080x1920.
+    :return: (height, width) tuple.
+    """
+
+    width, height = resolution.split('x')
+
+    return int(height), int(width)
+
+
+def parse_args():
+    """
+    Parse cmd line arguments.
+    :return: arguments that are accessible as args.PARAM_NAME
+    """
+
+    parser = argparse.ArgumentParser()
+
+    parser.add_argument('--' + NUM_STEPS, type=int, required=False, default=200,
+                        help="Number of measured steps per environment and resolution.")
+    parser.add_argument('--' + RESOLUTIONS, type=str, nargs='+', required=False,
+                        default=['720x1280', '1080x1920', '1440x2560'],
+                        help="Screen resolutions as WIDTHxHEIGHT.")
+    parser.add_argument('--' + BUDGET_MS, type=float, required=False, default=1.0,
+                        help="Reward time per step in milliseconds to flag environments against.")
+
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    params = parse_args()
+
+    for resolution in params.resolutions:
+        image_height, image_width = parse_resolution(resolution)
+        screens = create_screens(image_height, image_width)
+
+        print(resolution)
+        for environment_name in sorted(ENVIRONMENTS):
+            env = ENVIRONMENTS[environment_name](None, None, image_height, image_width)
+            reward_ms = measure_reward_time(env, screens, params.num_steps)
+
+            print("  {:<26} {:7.2f} ms/step{}".format(
+                environment_name, reward_ms, "" if reward_ms <= params.budget_ms else "  (over budget)"
+            ))
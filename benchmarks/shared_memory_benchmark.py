@@ -0,0 +1,117 @@
+"""
+Benchmark comparing the list-based ObservationBuffer with the SharedMemoryObservationBuffer on step latency, i.e.
+putting a full-size observation as the connection client does and reading and decoding it as the environment does,
+and on the redis memory held by a backlog of observations.
+
+Run from the Multivac project directory with a redis-server listening on the given port:
+```bash
+export PYTHONPATH="${PYTHONPATH}:$(pwd)" &&
+python benchmarks/shared_memory_benchmark.py --num-steps 200
+```
+"""
+
+import argparse
+import numpy as np
+import time
+
+from buffers.observation_buffer import ObservationBuffer
+from buffers.redis_connection import create_redis_client
+from buffers.shared_memory_observation_buffer import DEFAULT_NUM_SLOTS, SharedMemoryObservationBuffer
+from environment.android_device_env import AndroidDeviceEnv
+from eventobjects.observation import Observation, IMAGE_FORMAT_RAW_RGB
+
+# Cmd line parameters
+NUM_STEPS = "num-steps"
+IMAGE_HEIGHT = "image-height"
+IMAGE_WIDTH = "image-width"
+REDIS_PORT = "redis-port"
+RING_PATH = "ring-path"
+
+
+def measure_step_latencies(observation_buffer, observation, num_steps):
+    """
+    Measure the latency of handing observations through the buffer one step at a time.
+    :param observation_buffer: ObservationBuffer to benchmark.
+    :param observation: Observation object to send each step.
+    :param num_steps: number of steps to measure.
+    :return: numpy array of per step latencies in seconds.
+    """
+
+    observation_buffer.clearall()
+
+    latencies = np.zeros(num_steps)
+    for step in range(num_steps):
+        start = time.perf_counter()
+        observation_buffer.put_elem(observation)
+        AndroidDeviceEnv.process_image_from_observation(observation_buffer.blocking_read_elem())
+        latencies[step] = time.perf_counter() - start
+
+    return latencies
+
+
+def measure_backlog_memory(redis_client, observation_buffer, observation, backlog):
+    """
+    Measure the redis memory held by unread observations.
+    :param redis_client: Redis client the buffer is connected to.
+    :param observation_buffer: ObservationBuffer to benchmark.
+    :param observation: Observation object to send.
+    :param backlog: number of observations to leave unread.
+    :return: redis used memory growth in bytes.
+    """
+
+    observation_buffer.clearall()
+    used_memory = redis_client.info('memory')['used_memory']
+
+    for _ in range(backlog):
+        observation_buffer.put_elem(observation)
+
+    used_memory_growth = redis_client.info('memory')['used_memory'] - used_memory
+    observation_buffer.clearall()
+
+    return used_memory_growth
+
+
+def parse_args():
+    """
+    Parse cmd line arguments.
+    :return: arguments that are accessible as args.PARAM_NAME
+    """
+
+    parser = argparse.ArgumentParser()
+
+    parser.add_argument('--' + NUM_STEPS, type=int, required=False, default=200,
+                        help="Number of steps to measure per buffer.")
+    parser.add_argument('--' + IMAGE_HEIGHT, type=int, required=False, default=1920,
+                        help="Height of the observation image in pixels.")
+    parser.add_argument('--' + IMAGE_WIDTH, type=int, required=False, default=1080,
+                        help="Width of the observation image in pixels.")
+    parser.add_argument('--' + REDIS_PORT, type=int, required=False, default=6379,
+                        help="Port of the local redis-server.")
+    parser.add_argument('--' + RING_PATH, type=str, required=False, default='/tmp/multivac_benchmark_ring',
+                        help="Path to the ring file of the shared memory buffer.")
+
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    params = parse_args()
+
+    client = create_redis_client(params.redis_port)
+
+    image = np.random.randint(0, 256, size=(params.image_height, params.image_width, 3), dtype=np.uint8)
+    raw_observation = Observation(image.tobytes(), IMAGE_FORMAT_RAW_RGB, height=params.image_height,
+                                  width=params.image_width)
+
+    buffers = [
+        ('redis list', ObservationBuffer(client)),
+        ('shared memory ring', SharedMemoryObservationBuffer(client, params.ring_path))
+    ]
+
+    for name, buffer in buffers:
+        step_latencies = measure_step_latencies(buffer, raw_observation, params.num_steps) * 1000
+        memory_growth = measure_backlog_memory(client, buffer, raw_observation, DEFAULT_NUM_SLOTS)
+
+        print("{}: step latency mean {:.2f} ms, p50 {:.2f} ms, p99 {:.2f} ms; redis memory for {} unread "
+              "observations {:.1f} KB".format(name, np.mean(step_latencies), np.percentile(step_latencies, 50),
+                                              np.percentile(step_latencies, 99), DEFAULT_NUM_SLOTS,
+                                              memory_growth / 1024.0))
@@ -0,0 +1,152 @@
+"""
+Load test of the full pipeline against simulated devices: every device is a simulated connection client in its own
+process, rendering synthetic screens and answering actions through redis exactly like a device would, while this
+process drives one environment per device from a thread. Reports the total steps/sec and the median and tail latencies
+of the steps, as the number of devices grows.
+
+Run from the Multivac project directory with a redis-server listening on the given port:
+```bash
+export PYTHONPATH="${PYTHONPATH}:$(pwd)" &&
+python benchmarks/simulated_device_benchmark.py --num-steps 100 --num-devices 1 4 16
+```
+"""
+
+import argparse
+import numpy as np
+import threading
+import time
+
+from buffers.buffer import delete_session_keys
+from buffers.buffer_factory import create_buffers
+from buffers.redis_connection import create_redis_client
+from device.observation_codecs import CODECS
+from device.simulated_connection_client import DEFAULT_LATENCY_DISTRIBUTION, LATENCY_DISTRIBUTIONS
+from environment.mean_pixel_difference_env import MeanPixelDifferenceEnv
+from session.session_starter import start_simulated_connection_client
+
+# Cmd line parameters
+NUM_STEPS = "num-steps"
+NUM_DEVICES = "num-devices"
+IMAGE_HEIGHT = "image-height"
+IMAGE_WIDTH = "image-width"
+OBSERVATION_CODEC = "observation-codec"
+LATENCY_DISTRIBUTION = "latency-distribution"
+LATENCY = "latency"
+LATENCY_JITTER = "latency-jitter"
+SCREENSHOT_FAILURE_RATE = "screenshot-failure-rate"
+REDIS_PORT = "redis-port"
+
+
+def run_environment(environment, num_steps, step_latencies):
+    """
+    Reset the environment and take num_steps random actions on it, appending the latency of every step.
+    :param environment: AndroidDeviceEnv object.
+    :param num_steps: number of steps to take.
+    :param step_latencies: list the latencies in seconds are appended to.
+    """
+
+    environment.reset()
+    for _ in range(num_steps):
+        start = time.perf_counter()
+        environment.step(environment.action_space.sample())
+        step_latencies.append(time.perf_counter() - start)
+
+
+def measure_load(redis_client, redis_port, num_devices, num_steps, device_options):
+    """
+    Drive num_devices simulated devices concurrently.
+    :param redis_client: Redis client for an active connection.
+    :param redis_port: port of the redis server, for the simulated devices to connect to.
+    :param num_devices: number of devices.
+    :param num_steps: number of steps per device.
+    :param device_options: dict of keyword arguments of start_simulated_connection_client().
+    :return: (total steps/sec, list of the latencies in seconds of all steps) tuple.
+    """
+
+    session_ids = ["load-{}".format(device) for device in range(num_devices)]
+    device_processes = [
+        start_simulated_connection_client(redis_port, 0, session_id=session_id, **device_options)
+        for session_id in session_ids
+    ]
+
+    try:
+        environments = []
+        for session_id in session_ids:
+            action_buffer, observation_buffer = create_buffers(redis_client, session_id=session_id)
+            height, width = device_options['screen_size']
+            environments.append(MeanPixelDifferenceEnv(action_buffer, observation_buffer, height, width))
+
+        step_latencies = []
+        threads = [
+            threading.Thread(target=run_environment, args=(environment, num_steps, step_latencies))
+            for environment in environments
+        ]
+
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - start
+    finally:
+        for device_process in device_processes:
+            device_process.terminate()
+            device_process.wait()
+        for session_id in session_ids:
+            delete_session_keys(redis_client, session_id)
+
+    return num_devices * num_steps / elapsed, step_latencies
+
+
+def parse_args():
+    """
+    Parse cmd line arguments.
+    :return: arguments that are accessible as args.PARAM_NAME
+    """
+
+    parser = argparse.ArgumentParser()
+
+    parser.add_argument('--' + NUM_STEPS, type=int, required=False, default=100,
+                        help="Number of steps to take per device.")
+    parser.add_argument('--' + NUM_DEVICES, type=int, nargs='+', required=False, default=[1, 4, 16],
+                        help="Numbers of concurrent simulated devices to measure.")
+    parser.add_argument('--' + IMAGE_HEIGHT, type=int, required=False, default=1920,
+                        help="Height of the simulated screens in pixels.")
+    parser.add_argument('--' + IMAGE_WIDTH, type=int, required=False, default=1080,
+                        help="Width of the simulated screens in pixels.")
+    parser.add_argument('--' + OBSERVATION_CODEC, type=str, required=False, default='raw', choices=sorted(CODECS),
+                        help="Codec the simulated devices encode screenshots with.")
+    parser.add_argument('--' + LATENCY_DISTRIBUTION, type=str, required=False, default=DEFAULT_LATENCY_DISTRIBUTION,
+                        choices=sorted(LATENCY_DISTRIBUTIONS.keys()),
+                        help="Distribution of the screenshot latencies of the simulated devices.")
+    parser.add_argument('--' + LATENCY, type=float, required=False, default=100,
+                        help="Mean screenshot latency in milliseconds.")
+    parser.add_argument('--' + LATENCY_JITTER, type=float, required=False, default=50,
+                        help="Standard deviation of the screenshot latency in milliseconds.")
+    parser.add_argument('--' + SCREENSHOT_FAILURE_RATE, type=float, required=False, default=0.0,
+                        help="Probability of a screenshot failing and being retried.")
+    parser.add_argument('--' + REDIS_PORT, type=int, required=False, default=6379,
+                        help="Port of the local redis-server.")
+
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    params = parse_args()
+
+    client = create_redis_client(params.redis_port)
+
+    options = {
+        'observation_codec': params.observation_codec,
+        'screen_size': (params.image_height, params.image_width),
+        'latency_distribution': params.latency_distribution,
+        'latency': params.latency,
+        'latency_jitter': params.latency_jitter,
+        'screenshot_failure_rate': params.screenshot_failure_rate
+    }
+
+    for devices in params.num_devices:
+        steps_per_sec, latencies = measure_load(client, params.redis_port, devices, params.num_steps, options)
+        p50, p99 = np.percentile(latencies, [50, 99]) * 1000
+        print("{} devices: {:.1f} steps/sec, step latency p50 {:.1f} ms, p99 {:.1f} ms, max {:.1f} ms".format(
+            devices, steps_per_sec, p50, p99, max(latencies) * 1000))
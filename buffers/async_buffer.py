@@ -0,0 +1,176 @@
+"""
+asyncio counterpart of the Buffer, so that one event loop can drive many devices concurrently. This module is only
+used on the Multivac side, as it requires CPython and the asyncio client of redis-py.
+"""
+
+import asyncio
+import redis.asyncio
+
+from buffers.buffer import BLOCK_POLL_INTERVAL
+from buffers.stream_buffer import StreamBuffer
+
+
+def create_async_redis_client(redis_client):
+    """
+    Create an asyncio redis client connected to the same server as a sync client.
+    :param redis_client: sync Redis client.
+    :return: redis.asyncio.Redis client.
+    """
+
+    connection_kwargs = redis_client.connection_pool.connection_kwargs
+
+    if 'path' in connection_kwargs:
+        return redis.asyncio.Redis(
+            unix_socket_path=connection_kwargs['path'],
+            db=connection_kwargs.get('db', 0),
+            password=connection_kwargs.get('password')
+        )
+
+    return redis.asyncio.Redis(
+        host=connection_kwargs.get('host', 'localhost'),
+        port=connection_kwargs.get('port', 6379),
+        db=connection_kwargs.get('db', 0),
+        password=connection_kwargs.get('password')
+    )
+
+
+class AsyncBuffer(object):
+    """
+    The AsyncBuffer provides the operations of a Buffer as coroutines on an asyncio redis client.
+
+    It wraps a sync Buffer, whose redis key, capacity, overflow policy and (de)serialization it shares, so both can
+    be used on the same buffer. Only list backed buffers are supported.
+    """
+
+    def __init__(self, buffer, redis_client):
+        """
+        Initialize the AsyncBuffer.
+        :param buffer: Buffer object to wrap.
+        :param redis_client: redis.asyncio.Redis client for an active connection.
+        """
+
+        if isinstance(buffer, StreamBuffer):
+            raise Exception("AsyncBuffer does not support stream backed buffers")
+
+        self.buffer = buffer
+        self.buffer_name = buffer.buffer_name
+        self.redis_client = redis_client
+
+    async def read_elem(self):
+        """
+        Read elem from the redis list.
+        :return: elem.
+        """
+        read_str = await self.redis_client.lpop(self.buffer_name)
+        return self.buffer.deserialize_elem(read_str)
+
+    async def read_elems(self, max_n):
+        """
+        Read up to max_n elems from the redis list in a single round trip, see Buffer.read_elems().
+        :param max_n: maximum number of elements to read.
+        :return: list of elems in the order successive read_elem() calls would have returned them.
+        """
+        if max_n <= 0:
+            return []
+
+        pipeline = self.redis_client.pipeline()
+        pipeline.lrange(self.buffer_name, 0, max_n - 1)
+        pipeline.ltrim(self.buffer_name, max_n, -1)
+        read_strs, _ = await pipeline.execute()
+
+        return [self.buffer.deserialize_elem(read_str) for read_str in read_strs]
+
+    async def blocking_read_elem(self):
+        """
+        Blocking read from the redis list. Only this coroutine waits; the event loop keeps running others.
+        :return: elem.
+        """
+        _, read_str = await self.redis_client.blpop(self.buffer_name)
+        return self.buffer.deserialize_elem(read_str)
+
+    async def blocking_read_elems(self, max_n, timeout=0):
+        """
+        Blocking drain of the redis list, see Buffer.blocking_read_elems().
+        :param max_n: maximum number of elements to read.
+        :param timeout: time in seconds to wait for the first element; 0 blocks indefinitely.
+        :return: list of elems, empty if the timeout expired.
+        """
+        if max_n <= 0:
+            return []
+
+        response = await self.redis_client.blpop(self.buffer_name, timeout=timeout)
+        if response is None:
+            return []
+
+        _, read_str = response
+        return [self.buffer.deserialize_elem(read_str)] + await self.read_elems(max_n - 1)
+
+    async def put_elem(self, elem):
+        """
+        Places elem into the Buffer.
+        :param elem: element to be placed at the end.
+        :return: number of elements dropped to respect the capacity of the buffer.
+        """
+        return await self.push_serialized_elems([self.buffer.serialize_elem(elem)])
+
+    async def put_elems(self, elems):
+        """
+        Places all elems into the Buffer, see Buffer.put_elems().
+        :param elems: list of elements to be placed at the end.
+        :return: number of elements dropped to respect the capacity of the buffer.
+        """
+        if not elems:
+            return 0
+
+        return await self.push_serialized_elems([self.buffer.serialize_elem(elem) for elem in elems])
+
+    async def push_serialized_elems(self, serialized_elems):
+        """
+        Push serialized elems onto the redis list, applying the overflow policy of the wrapped buffer, see
+        Buffer.push_steps().
+        :param serialized_elems: list of serialized elements in the order they are placed.
+        :return: number of elements dropped.
+        """
+        steps = self.buffer.push_steps(serialized_elems)
+        step = steps.send(None)
+        while isinstance(step, list):
+            results = None
+            if step:
+                pipeline = self.redis_client.pipeline(transaction=len(step) > 1)
+                for command, args in step:
+                    getattr(pipeline, command)(*args)
+                results = await pipeline.execute()
+            else:
+                await asyncio.sleep(BLOCK_POLL_INTERVAL)
+            step = steps.send(results)
+
+        return step
+
+    async def depth(self):
+        """
+        Retrieve the number of elements currently held by the buffer.
+        :return: number of elements.
+        """
+        return await self.redis_client.llen(self.buffer_name)
+
+    async def num_dropped(self):
+        """
+        Retrieve the number of elements dropped by the overflow policy since the buffer was last cleared.
+        :return: number of dropped elements.
+        """
+        return int(await self.redis_client.get(self.buffer.dropped_key) or 0)
+
+    async def clearall(self):
+        """
+        Clears the buffer.
+        """
+        await self.redis_client.delete(self.buffer_name, self.buffer.dropped_key)
+
+    async def aclose(self):
+        """
+        Close the asyncio redis client, along with its connections. Other AsyncBuffers sharing the client cannot be
+        used afterwards.
+        """
+        # redis-py 5 renamed close() to aclose().
+        close = getattr(self.redis_client, 'aclose', None) or self.redis_client.close
+        await close()
@@ -1,16 +1,100 @@
+import time
+
+# Overflow policies of a bounded Buffer, i.e. what happens when an elem is put while the buffer is at capacity.
+# block: wait until a reader makes room. drop-oldest: evict the oldest elems. drop-newest: discard the elems being put.
+# keep-latest: drop-oldest with a capacity of one, so only the latest elem is ever held.
+OVERFLOW_BLOCK = "block"
+OVERFLOW_DROP_OLDEST = "drop-oldest"
+OVERFLOW_DROP_NEWEST = "drop-newest"
+OVERFLOW_KEEP_LATEST = "keep-latest"
+
+OVERFLOW_POLICIES = [OVERFLOW_BLOCK, OVERFLOW_DROP_OLDEST, OVERFLOW_DROP_NEWEST, OVERFLOW_KEEP_LATEST]
+
+# Time in seconds between checks for room in a full buffer with the block policy.
+BLOCK_POLL_INTERVAL = 0.01
+
+# Prefix of the redis keys of a session, so that many sessions can share one redis server.
+SESSION_KEY_PREFIX = "multivac:"
+
+# Characters with a special meaning in the key patterns of redis commands such as SCAN.
+GLOB_SPECIAL_CHARACTERS = "\\*?[]"
+
+
+def overflow_evicts(capacity, overflow_policy):
+    """
+    Check whether putting elems into a buffer may evict elems it holds, on which elems put later may build.
+    :param capacity: max number of elems held by the buffer, 0 for unbounded.
+    :param overflow_policy: one of OVERFLOW_POLICIES.
+    :return: True if elems held by the buffer may be evicted.
+    """
+    return overflow_policy == OVERFLOW_KEEP_LATEST or (capacity > 0 and overflow_policy == OVERFLOW_DROP_OLDEST)
+
+
+def session_key(name, session_id=None):
+    """
+    Scope a redis key to a session.
+    :param name: name of the key.
+    :param session_id: id of the session, None for the unscoped key.
+    :return: name of the redis key.
+    """
+    if session_id is None:
+        return name
+
+    return SESSION_KEY_PREFIX + str(session_id) + ":" + name
+
+
+def escape_glob(text):
+    """
+    Escape the characters of text that have a special meaning in redis key patterns.
+    :param text: text to match literally.
+    :return: pattern matching text.
+    """
+    return "".join(["\\" + c if c in GLOB_SPECIAL_CHARACTERS else c for c in text])
+
+
+def delete_session_keys(redis_client, session_id):
+    """
+    Delete all redis keys of a session, leaving the keys of other sessions untouched.
+    :param redis_client: Redis client for an active connection.
+    :param session_id: id of the session.
+    :return: number of deleted keys.
+    """
+    keys = list(redis_client.scan_iter(match=escape_glob(session_key("", session_id)) + "*"))
+    if not keys:
+        return 0
+
+    return redis_client.delete(*keys)
+
+
 class Buffer(object):
     """
-    The Buffer class abstracts away the underlying redis queues.
+    The Buffer class abstracts away the underlying redis queues. Elems are pushed onto the tail of a redis list and
+    read from its head, so they are read in the order they were put.
+
+    A Buffer may be bounded to a capacity, in which case its overflow policy decides what happens to elems put while
+    it is full. The number of dropped elems is kept in redis next to the buffer, so the producer and the reader in
+    another process see the same count.
     """
 
-    def __init__(self, buffer_name, redis_client):
+    def __init__(self, buffer_name, redis_client, capacity=0, overflow_policy=OVERFLOW_DROP_OLDEST):
         """
         Initialize the Buffer.
         :param buffer_name: Name of the redis list containing the elements of the buffer.
         :param redis_client: Redis client for an active connection.
+        :param capacity: Max number of elements held by the buffer, 0 for unbounded.
+        :param overflow_policy: one of OVERFLOW_POLICIES, applied when elements are put into a full buffer.
         """
+        if overflow_policy not in OVERFLOW_POLICIES:
+            raise Exception(str(overflow_policy) + " is not a valid overflow policy")
+
+        if overflow_policy == OVERFLOW_KEEP_LATEST:
+            capacity = 1
+
         self.buffer_name = buffer_name
         self.redis_client = redis_client
+        self.capacity = capacity
+        self.overflow_policy = overflow_policy
+        self.dropped_key = buffer_name + "_dropped"
 
     def read_elem(self):
         """
@@ -20,6 +104,23 @@ class Buffer(object):
         read_str = self.redis_client.lpop(self.buffer_name)
         return self.deserialize_elem(read_str)
 
+    def read_elems(self, max_n):
+        """
+        Read up to max_n elems from the redis list in a single round trip. The range read and the trim are sent as one
+        MULTI/EXEC transaction so no other reader can pop the same elements in between.
+        :param max_n: maximum number of elements to read.
+        :return: list of elems in the order successive read_elem() calls would have returned them.
+        """
+        if max_n <= 0:
+            return []
+
+        pipeline = self.redis_client.pipeline()
+        pipeline.lrange(self.buffer_name, 0, max_n - 1)
+        pipeline.ltrim(self.buffer_name, max_n, -1)
+        read_strs, _ = pipeline.execute()
+
+        return [self.deserialize_elem(read_str) for read_str in read_strs]
+
     def blocking_read_elem(self):
         """
         Blocking read from the redis list.
@@ -28,19 +129,130 @@ class Buffer(object):
         _, read_str = self.redis_client.blpop(self.buffer_name)
         return self.deserialize_elem(read_str)
 
+    def blocking_read_elems(self, max_n, timeout=0):
+        """
+        Blocking drain of the redis list. Blocks until at least one elem is available (or the timeout expires), then
+        reads up to max_n - 1 further elems that are already present without blocking again.
+        :param max_n: maximum number of elements to read.
+        :param timeout: time in seconds to wait for the first element; 0 blocks indefinitely.
+        :return: list of elems, empty if the timeout expired.
+        """
+        if max_n <= 0:
+            return []
+
+        response = self.redis_client.blpop(self.buffer_name, timeout=timeout)
+        if response is None:
+            return []
+
+        _, read_str = response
+        return [self.deserialize_elem(read_str)] + self.read_elems(max_n - 1)
+
     def put_elem(self, elem):
         """
         Places elem into the Buffer.
         :param elem: element to be placed at the end.
+        :return: number of elements dropped to respect the capacity of the buffer.
+        """
+        return self.push_serialized_elems([self.serialize_elem(elem)])
+
+    def put_elems(self, elems):
+        """
+        Places all elems into the Buffer with a single RPUSH. The resulting list is identical to calling put_elem() on
+        each elem in order.
+        :param elems: list of elements to be placed at the end.
+        :return: number of elements dropped to respect the capacity of the buffer.
+        """
+        if not elems:
+            return 0
+
+        return self.push_serialized_elems([self.serialize_elem(elem) for elem in elems])
+
+    def push_serialized_elems(self, serialized_elems):
+        """
+        Push serialized elems onto the redis list, applying the overflow policy if the buffer is bounded.
+        :param serialized_elems: list of serialized elements in the order they are placed.
+        :return: number of elements dropped.
+        """
+        steps = self.push_steps(serialized_elems)
+        step = steps.send(None)
+        while isinstance(step, list):
+            results = None
+            if step:
+                pipeline = self.redis_client.pipeline(transaction=len(step) > 1)
+                for command, args in step:
+                    getattr(pipeline, command)(*args)
+                results = pipeline.execute()
+            else:
+                time.sleep(BLOCK_POLL_INTERVAL)
+            step = steps.send(results)
+
+        return step
+
+    def push_steps(self, serialized_elems):
         """
-        serialized_elem = self.serialize_elem(elem)
-        self.redis_client.lpush(self.buffer_name, serialized_elem)
+        Generator of the steps pushing serialized elems onto the redis list under the overflow policy. It holds the
+        policy for both Buffer and AsyncBuffer, which only differ in how they run the steps.
+
+        A step is either a list of (command name, args) tuples to send as one pipeline, after which the list of their
+        results is sent into the generator, or an empty list to wait BLOCK_POLL_INTERVAL before going on. The last step
+        is the number of elements dropped.
+        :param serialized_elems: list of serialized elements in the order they are placed.
+        """
+        if not self.capacity:
+            yield [('rpush', [self.buffer_name] + serialized_elems)]
+            yield 0
+            return
+
+        if self.overflow_policy == OVERFLOW_BLOCK:
+            for serialized_elem in serialized_elems:
+                while (yield [('llen', [self.buffer_name])])[0] >= self.capacity:
+                    yield []
+                yield [('rpush', [self.buffer_name, serialized_elem])]
+            yield 0
+            return
+
+        if self.overflow_policy == OVERFLOW_DROP_NEWEST:
+            # Readers only ever shrink the list, so with a single producer the room found here is still there.
+            num_free = max(0, self.capacity - (yield [('llen', [self.buffer_name])])[0])
+            if num_free:
+                yield [('rpush', [self.buffer_name] + serialized_elems[:num_free])]
+            num_dropped = len(serialized_elems) - min(num_free, len(serialized_elems))
+        else:
+            # The oldest elems are at the head of the list, so trimming it to its last capacity elems evicts them.
+            length = (yield [('rpush', [self.buffer_name] + serialized_elems),
+                             ('ltrim', [self.buffer_name, -self.capacity, -1])])[0]
+            num_dropped = max(0, length - self.capacity)
+
+        if num_dropped:
+            yield [('incr', [self.dropped_key, num_dropped])]
+
+        yield num_dropped
+
+    def depth(self):
+        """
+        Retrieve the number of elements currently held by the buffer.
+        :return: number of elements.
+        """
+        return self.redis_client.llen(self.buffer_name)
+
+    def num_dropped(self):
+        """
+        Retrieve the number of elements dropped by the overflow policy since the buffer was last cleared.
+        :return: number of dropped elements.
+        """
+        return int(self.redis_client.get(self.dropped_key) or 0)
 
     def clearall(self):
         """
         Clears the buffer.
         """
-        self.redis_client.delete(self.buffer_name)
+        self.redis_client.delete(self.buffer_name, self.dropped_key)
+
+    def close(self):
+        """
+        Release the resources held by the buffer besides the redis client, which is shared.
+        """
+        pass
 
     def serialize_elem(self, elem):
         """
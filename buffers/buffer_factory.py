@@ -0,0 +1,90 @@
+"""
+File that contains helpers to create the buffers of a session, so that the connection client and the Multivac
+agree on how actions and observations are exchanged.
+"""
+
+from buffers.action_buffer import ActionBuffer
+from buffers.buffer import OVERFLOW_DROP_OLDEST, OVERFLOW_KEEP_LATEST
+from buffers.observation_buffer import ObservationBuffer
+from buffers.shared_memory_observation_buffer import DEFAULT_RING_PATH, SharedMemoryObservationBuffer
+from buffers.stream_buffer import StreamActionBuffer, StreamObservationBuffer, StreamSharedMemoryObservationBuffer
+
+# Buffer backends. Both are read in FIFO order: a list with an optional capacity, a stream with bounded length and a
+# cursor per reader.
+LIST_BACKEND = "list"
+STREAM_BACKEND = "stream"
+
+BUFFER_BACKENDS = [LIST_BACKEND, STREAM_BACKEND]
+
+# Observation transports. With redis, observations are held in the redis list. With shared memory, they are held in a
+# memory mapped ring on the local host and only references go through redis.
+REDIS_TRANSPORT = "redis"
+SHARED_MEMORY_TRANSPORT = "shared-memory"
+
+OBSERVATION_TRANSPORTS = [REDIS_TRANSPORT, SHARED_MEMORY_TRANSPORT]
+
+
+# Dict mapping from (buffer backend, observation transport) to the action and observation buffer classes.
+BUFFER_CLASSES = {
+    (LIST_BACKEND, REDIS_TRANSPORT): (ActionBuffer, ObservationBuffer),
+    (LIST_BACKEND, SHARED_MEMORY_TRANSPORT): (ActionBuffer, SharedMemoryObservationBuffer),
+    (STREAM_BACKEND, REDIS_TRANSPORT): (StreamActionBuffer, StreamObservationBuffer),
+    (STREAM_BACKEND, SHARED_MEMORY_TRANSPORT): (StreamActionBuffer, StreamSharedMemoryObservationBuffer)
+}
+
+
+def session_ring_path(ring_path, session_id=None):
+    """
+    Scope the ring file of the shared memory transport to a session.
+    :param ring_path: path to the ring file.
+    :param session_id: id of the session, None for the unscoped path.
+    :return: path to the ring file of the session.
+    """
+
+    if session_id is None:
+        return ring_path
+
+    return ring_path + "_" + str(session_id)
+
+
+def create_buffers(redis_client, observation_transport=REDIS_TRANSPORT, ring_path=DEFAULT_RING_PATH,
+                   buffer_backend=LIST_BACKEND, observation_capacity=0, overflow_policy=OVERFLOW_DROP_OLDEST,
+                   session_id=None):
+    """
+    Create the action and observation buffers of a session.
+    :param redis_client: Redis client for an active connection.
+    :param observation_transport: one of OBSERVATION_TRANSPORTS.
+    :param ring_path: path to the ring file used by the shared memory transport.
+    :param buffer_backend: one of BUFFER_BACKENDS.
+    :param observation_capacity: max number of observations held by the observation buffer, 0 for unbounded.
+    :param overflow_policy: one of OVERFLOW_POLICIES, applied when the observation buffer is full.
+    :param session_id: id of the session the buffers belong to, None for the unscoped buffers.
+    :return: (ActionBuffer, ObservationBuffer) tuple.
+    """
+
+    if (buffer_backend, observation_transport) not in BUFFER_CLASSES:
+        raise Exception(str(buffer_backend) + " backend with " + str(observation_transport) +
+                        " observation transport is not supported")
+
+    action_buffer_cls, observation_buffer_cls = BUFFER_CLASSES[(buffer_backend, observation_transport)]
+
+    observation_buffer_kwargs = dict(session_id=session_id)
+    if observation_transport == SHARED_MEMORY_TRANSPORT:
+        observation_buffer_kwargs['ring_path'] = session_ring_path(ring_path, session_id)
+
+    if buffer_backend == STREAM_BACKEND:
+        # A stream can only be bounded by trimming its oldest entries.
+        if overflow_policy == OVERFLOW_KEEP_LATEST:
+            observation_capacity = 1
+        elif observation_capacity and overflow_policy != OVERFLOW_DROP_OLDEST:
+            raise Exception(str(overflow_policy) + " overflow policy is not supported by the stream backend")
+
+        if observation_capacity:
+            observation_buffer_kwargs['max_len'] = observation_capacity
+            observation_buffer_kwargs['exact_trim'] = True
+    else:
+        observation_buffer_kwargs['capacity'] = observation_capacity
+        observation_buffer_kwargs['overflow_policy'] = overflow_policy
+
+    return action_buffer_cls(redis_client, session_id=session_id), \
+        observation_buffer_cls(redis_client, **observation_buffer_kwargs)
@@ -1,4 +1,4 @@
-from buffers.buffer import Buffer
+from buffers.buffer import Buffer, session_key
 from eventobjects.observation import Observation
 
 OBSERVATION_BUFFER_NAME = "observation_buffer"
@@ -10,13 +10,16 @@ class ObservationBuffer(Buffer):
     be taken on the device.
     """
 
-    def __init__(self, redis_client):
+    def __init__(self, redis_client, session_id=None, **kwargs):
         """
         Initialize the ObservationBuffer.
         :param redis_client: Redis client for an active connection.
+        :param session_id: Id of the session the buffer belongs to, None for the unscoped buffer.
+        :param kwargs: Further arguments of the Buffer implementation this is combined with, e.g. StreamBuffer.
         """
 
-        super(ObservationBuffer, self).__init__(OBSERVATION_BUFFER_NAME, redis_client)
+        super(ObservationBuffer, self).__init__(session_key(OBSERVATION_BUFFER_NAME, session_id), redis_client,
+                                                **kwargs)
 
     def serialize_elem(self, elem):
         return elem.serialize()
@@ -0,0 +1,132 @@
+"""
+File that contains the factory of the redis clients used by buffers, so that the connection client, the Multivac and
+the session starter connect to the redis server the same way.
+
+On the same host, a unix domain socket avoids the TCP stack for large observation payloads. Jython has no unix domain
+sockets, so there the factory falls back to TCP on the given port.
+"""
+
+import redis
+import socket
+
+DEFAULT_REDIS_HOST = "localhost"
+DEFAULT_REDIS_PORT = 6379
+
+# Path of the unix domain socket the session starter launches redis-server with.
+DEFAULT_REDIS_SOCKET_PATH = "/tmp/multivac_redis.sock"
+
+# Max number of connections of a client's pool. Every concurrently blocked read holds one connection.
+DEFAULT_MAX_CONNECTIONS = 16
+
+# Time in seconds to wait for a free connection of an exhausted pool before failing.
+DEFAULT_POOL_TIMEOUT = 20
+
+# Socket send and receive buffer sizes in bytes, large enough to hold a full screenshot.
+DEFAULT_SOCKET_BUFFER_SIZE = 4 * 1024 * 1024
+
+# Time in seconds to wait for the connection to the server. Reads have no timeout since reads from buffers block.
+DEFAULT_SOCKET_CONNECT_TIMEOUT = 5
+
+
+def supports_unix_sockets():
+    """
+    Check whether unix domain sockets are available to this interpreter.
+    :return: True if available.
+    """
+
+    return hasattr(socket, 'AF_UNIX')
+
+
+class SocketBufferSizeMixin(object):
+    """
+    Mixin for redis connection classes setting the socket send and receive buffer sizes on connect.
+    """
+
+    def __init__(self, socket_buffer_size=None, **kwargs):
+        """
+        Initialize the connection.
+        :param socket_buffer_size: size in bytes of the socket send and receive buffers, None for the OS default.
+        :param kwargs: arguments of the redis connection class.
+        """
+
+        super(SocketBufferSizeMixin, self).__init__(**kwargs)
+        self.socket_buffer_size = socket_buffer_size
+
+    def _connect(self):
+        sock = super(SocketBufferSizeMixin, self)._connect()
+
+        if self.socket_buffer_size:
+            try:
+                sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, self.socket_buffer_size)
+                sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, self.socket_buffer_size)
+            except socket.error:
+                # The sizes are a hint only; keep the OS defaults if they cannot be set.
+                pass
+
+        return sock
+
+
+class TcpConnection(SocketBufferSizeMixin, redis.Connection):
+    """
+    TCP redis connection with configurable socket buffer sizes.
+    """
+
+    pass
+
+
+class UnixSocketConnection(SocketBufferSizeMixin, redis.UnixDomainSocketConnection):
+    """
+    Unix domain socket redis connection with configurable socket buffer sizes.
+    """
+
+    pass
+
+
+def create_connection_pool(port=DEFAULT_REDIS_PORT, host=DEFAULT_REDIS_HOST, socket_path=None,
+                           max_connections=DEFAULT_MAX_CONNECTIONS, socket_buffer_size=DEFAULT_SOCKET_BUFFER_SIZE,
+                           socket_timeout=None, socket_connect_timeout=DEFAULT_SOCKET_CONNECT_TIMEOUT,
+                           pool_timeout=DEFAULT_POOL_TIMEOUT):
+    """
+    Create a connection pool to the redis server. Callers wait for a free connection rather than fail when the pool
+    is exhausted.
+    :param port: port of the redis server, used if no socket path is given or unix sockets are unavailable.
+    :param host: host of the redis server, used if no socket path is given or unix sockets are unavailable.
+    :param socket_path: path to the unix domain socket of the redis server, None to connect over TCP.
+    :param max_connections: max number of connections in the pool.
+    :param socket_buffer_size: size in bytes of the socket send and receive buffers, None for the OS default.
+    :param socket_timeout: time in seconds to wait for a response, None to wait indefinitely.
+    :param socket_connect_timeout: time in seconds to wait for a TCP connection to the server.
+    :param pool_timeout: time in seconds to wait for a free connection of the pool.
+    :return: redis.BlockingConnectionPool object.
+    """
+
+    connection_kwargs = {
+        'socket_buffer_size': socket_buffer_size,
+        'socket_timeout': socket_timeout
+    }
+
+    if socket_path and supports_unix_sockets():
+        # Unix domain socket connections of redispy < 3.2 take no connect timeout; connecting to a local socket does
+        # not wait on the network anyway.
+        connection_kwargs['connection_class'] = UnixSocketConnection
+        connection_kwargs['path'] = socket_path
+    else:
+        connection_kwargs['connection_class'] = TcpConnection
+        connection_kwargs['host'] = host
+        connection_kwargs['port'] = port
+        connection_kwargs['socket_connect_timeout'] = socket_connect_timeout
+
+    return redis.BlockingConnectionPool(max_connections=max_connections, timeout=pool_timeout, **connection_kwargs)
+
+
+def create_redis_client(port=DEFAULT_REDIS_PORT, host=DEFAULT_REDIS_HOST, socket_path=None, **kwargs):
+    """
+    Create a redis client backed by a connection pool, see create_connection_pool().
+    :param port: port of the redis server, used if no socket path is given or unix sockets are unavailable.
+    :param host: host of the redis server, used if no socket path is given or unix sockets are unavailable.
+    :param socket_path: path to the unix domain socket of the redis server, None to connect over TCP.
+    :param kwargs: further arguments of create_connection_pool().
+    :return: redis.Redis client.
+    """
+
+    return redis.Redis(connection_pool=create_connection_pool(port, host, socket_path, **kwargs))
@@ -0,0 +1,171 @@
+import os
+import struct
+import tempfile
+
+from buffers.observation_buffer import ObservationBuffer
+from eventobjects.observation import Observation
+
+try:
+    import mmap
+except ImportError:
+    # Jython has no mmap module; memory map the ring through java.nio instead.
+    mmap = None
+    from java.io import RandomAccessFile
+    from java.lang import String
+    from java.nio.channels import FileChannel
+
+# Directory backed by memory where available, so the ring never touches disk.
+if os.path.isdir('/dev/shm'):
+    DEFAULT_RING_PATH = '/dev/shm/multivac_observation_ring'
+else:
+    DEFAULT_RING_PATH = os.path.join(tempfile.gettempdir(), 'multivac_observation_ring')
+
+DEFAULT_NUM_SLOTS = 8
+DEFAULT_SLOT_SIZE = 16 * 1024 * 1024
+
+# Every slot starts with the sequence number and length of the serialized observation it holds.
+SLOT_HEADER_FORMAT = '>QI'
+SLOT_HEADER_SIZE = struct.calcsize(SLOT_HEADER_FORMAT)
+
+# Reference sent through redis in place of the observation: magic, slot index, sequence number and length.
+REFERENCE_MAGIC = 0x4D565253  # 'MVRS'
+REFERENCE_FORMAT = '>IIQI'
+REFERENCE_SIZE = struct.calcsize(REFERENCE_FORMAT)
+
+
+class MappedRing(object):
+    """
+    The MappedRing memory maps a file of fixed-size slots shared by the processes on one host.
+    """
+
+    def __init__(self, path, num_slots, slot_size):
+        """
+        Map the ring file, creating or growing it as needed.
+        :param path: path to the ring file.
+        :param num_slots: number of slots in the ring.
+        :param slot_size: max size in bytes of a serialized observation held by a slot.
+        """
+
+        self.num_slots = num_slots
+        self.slot_stride = SLOT_HEADER_SIZE + slot_size
+        size = num_slots * self.slot_stride
+
+        if mmap is not None:
+            fp = open(path, 'a+b')
+            try:
+                fp.seek(0, os.SEEK_END)
+                if fp.tell() < size:
+                    fp.truncate(size)
+                self.mapped = mmap.mmap(fp.fileno(), size)
+            finally:
+                fp.close()
+        else:
+            ring_file = RandomAccessFile(path, 'rw')
+            if ring_file.length() < size:
+                ring_file.setLength(size)
+            self.mapped = ring_file.getChannel().map(FileChannel.MapMode.READ_WRITE, 0, size)
+
+    def write(self, slot, sequence, data):
+        """
+        Write data with its slot header into a slot.
+        :param slot: index of the slot.
+        :param sequence: sequence number of data.
+        :param data: string to write.
+        """
+
+        offset = slot * self.slot_stride
+        header = struct.pack(SLOT_HEADER_FORMAT, sequence, len(data))
+
+        if mmap is not None:
+            self.mapped[offset:offset + SLOT_HEADER_SIZE] = header
+            self.mapped[offset + SLOT_HEADER_SIZE:offset + SLOT_HEADER_SIZE + len(data)] = data
+        else:
+            view = self.mapped.duplicate()
+            view.position(offset)
+            view.put(String(header + data).getBytes('ISO-8859-1'))
+
+    def read(self, slot, sequence):
+        """
+        Copy the data out of a slot. The writer reuses the slot after a lap around the ring, so the data is copied
+        rather than viewed, and the sequence number is checked again afterwards in case the writer came around while
+        copying.
+        :param slot: index of the slot.
+        :param sequence: expected sequence number of the data; a mismatch means the slot has been reused.
+        :return: string of the data.
+        """
+
+        offset = slot * self.slot_stride
+        slot_sequence, length = struct.unpack_from(SLOT_HEADER_FORMAT, self.mapped, offset)
+        self.check_sequence(slot, sequence, slot_sequence)
+
+        start = offset + SLOT_HEADER_SIZE
+        data = self.mapped[start:start + length]
+
+        self.check_sequence(slot, sequence, struct.unpack_from(SLOT_HEADER_FORMAT, self.mapped, offset)[0])
+
+        return data
+
+    @staticmethod
+    def check_sequence(slot, sequence, slot_sequence):
+        if slot_sequence != sequence:
+            raise Exception("Observation slot " + str(slot) + " has been overwritten before it was read.")
+
+    def close(self):
+        """
+        Unmap the ring. Under jython the mapping is released once it is garbage collected.
+        """
+
+        if mmap is not None:
+            self.mapped.close()
+
+
+class SharedMemoryObservationBuffer(ObservationBuffer):
+    """
+    The SharedMemoryObservationBuffer is an ObservationBuffer for a connection client and Multivac on the same host.
+
+    Serialized observations are written into a memory mapped ring of fixed-size slots; only a small reference of slot
+    index, sequence number and length goes through the redis list. Readers copy observations out of the mapping in
+    one go and decode them from the copy. A slot is reused after num_slots further observations, so readers must
+    not fall further behind than that. Observations that do not fit a slot are sent through redis as is.
+    """
+
+    def __init__(self, redis_client, ring_path=DEFAULT_RING_PATH, num_slots=DEFAULT_NUM_SLOTS,
+                 slot_size=DEFAULT_SLOT_SIZE, **kwargs):
+        """
+        Initialize the SharedMemoryObservationBuffer.
+        :param redis_client: Redis client for an active connection.
+        :param ring_path: path to the ring file shared by writer and reader.
+        :param num_slots: number of slots in the ring.
+        :param slot_size: max size in bytes of a serialized observation held by a slot.
+        :param kwargs: Further arguments of the Buffer implementation this is combined with, e.g. StreamBuffer.
+        """
+
+        super(SharedMemoryObservationBuffer, self).__init__(redis_client, **kwargs)
+
+        self.ring = MappedRing(ring_path, num_slots, slot_size)
+        self.slot_size = slot_size
+        self.next_sequence = 0
+
+    def serialize_elem(self, elem):
+        serialized_elem = elem.serialize()
+        if len(serialized_elem) > self.slot_size:
+            return serialized_elem
+
+        sequence = self.next_sequence
+        slot = sequence % self.ring.num_slots
+        self.ring.write(slot, sequence, serialized_elem)
+        self.next_sequence += 1
+
+        return struct.pack(REFERENCE_FORMAT, REFERENCE_MAGIC, slot, sequence, len(serialized_elem))
+
+    def deserialize_elem(self, elem_str):
+        if len(elem_str) != REFERENCE_SIZE or struct.unpack_from('>I', elem_str, 0)[0] != REFERENCE_MAGIC:
+            return Observation.deserialize(elem_str)
+
+        _, slot, sequence, _ = struct.unpack(REFERENCE_FORMAT, elem_str)
+
+        return Observation.deserialize(self.ring.read(slot, sequence))
+
+    def close(self):
+        super(SharedMemoryObservationBuffer, self).close()
+        self.ring.close()
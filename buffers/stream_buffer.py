@@ -0,0 +1,255 @@
+import redis
+import sys
+import time
+
+from buffers.action_buffer import ActionBuffer
+from buffers.buffer import Buffer
+from buffers.observation_buffer import ObservationBuffer
+from buffers.shared_memory_observation_buffer import SharedMemoryObservationBuffer
+
+# Field of the stream entries holding the serialized element.
+ELEM_FIELD = "elem"
+
+# Approximate max number of entries kept in a stream; older entries are trimmed on write.
+DEFAULT_MAX_LEN = 100
+
+
+def entry_id_to_timestamp(entry_id):
+    """
+    Convert a server assigned stream entry id to the time the entry was added.
+    :param entry_id: stream entry id of the form <milliseconds>-<sequence>.
+    :return: time in seconds since the epoch, as seen by the redis server.
+    """
+
+    if not isinstance(entry_id, str):
+        entry_id = entry_id.decode('ascii')
+
+    return int(entry_id.split('-')[0]) / 1000.0
+
+
+def parse_stream_entries(response):
+    """
+    Flatten an XREAD/XREADGROUP response. Older redispy versions return raw nested lists while newer ones parse the
+    fields of each entry into a dict, so both are accepted.
+    :param response: response of the read command, None if it timed out.
+    :return: list of (entry id, serialized elem) tuples.
+    """
+
+    if not response:
+        return []
+
+    if isinstance(response, dict):
+        response = response.items()
+
+    entries = []
+    for _, stream_entries in response:
+        for entry_id, fields in stream_entries:
+            if isinstance(fields, dict):
+                serialized_elem = list(fields.values())[0]
+            else:
+                serialized_elem = fields[1]
+            entries.append((entry_id, serialized_elem))
+
+    return entries
+
+
+class StreamBuffer(Buffer):
+    """
+    The StreamBuffer backs a Buffer with a redis stream instead of a list.
+
+    Elements are read in strict FIFO order, the stream is trimmed to roughly max_len entries so a stalled reader
+    cannot grow it without bound, and every element gets a server assigned id carrying the time it was added.
+
+    Without a consumer group, every StreamBuffer instance keeps its own cursor, so several readers, e.g. a recorder
+    and a learner, each see all elements. Readers sharing a consumer group split the elements between them instead.
+
+    The stream is bounded by max_len alone; trimmed entries are not counted as dropped, since readers with their own
+    cursor may have read them already.
+
+    Commands go through execute_command so that the jython compatible redispy, which predates streams, works too.
+    """
+
+    def __init__(self, buffer_name, redis_client, max_len=DEFAULT_MAX_LEN, group_name=None, consumer_name=None,
+                 exact_trim=False):
+        """
+        Initialize the StreamBuffer.
+        :param buffer_name: Name of the redis stream containing the elements of the buffer.
+        :param redis_client: Redis client for an active connection.
+        :param max_len: Approximate max number of entries kept in the stream, 0 for no trimming.
+        :param group_name: Name of the consumer group to read as, None to read with a private cursor.
+        :param consumer_name: Name of this reader within the consumer group.
+        :param exact_trim: Whether to trim the stream to exactly max_len entries, which is slower than approximately.
+        """
+
+        super(StreamBuffer, self).__init__(buffer_name, redis_client)
+
+        self.max_len = max_len
+        self.exact_trim = exact_trim
+        self.group_name = group_name
+        self.consumer_name = consumer_name or buffer_name + "_consumer"
+        self.group_created = False
+
+        # Id of the last entry read by this instance. For reads without a consumer group, this is the cursor.
+        self.last_read_id = '0'
+
+    def read_elem(self):
+        """
+        Read the next elem from the redis stream.
+        :return: elem, None if there is no unread elem.
+        """
+        elems = self.read_elems(1)
+        if not elems:
+            return None
+        return elems[0]
+
+    def read_elems(self, max_n):
+        if max_n <= 0:
+            return []
+
+        return self.read_entries(max_n, None)
+
+    def blocking_read_elem(self):
+        return self.blocking_read_elems(1)[0]
+
+    def blocking_read_elems(self, max_n, timeout=0):
+        if max_n <= 0:
+            return []
+
+        return self.read_entries(max_n, int(timeout * 1000))
+
+    def put_elem(self, elem):
+        self.redis_client.execute_command(*self.xadd_args(elem))
+        return 0
+
+    def put_elems(self, elems):
+        if not elems:
+            return 0
+
+        pipeline = self.redis_client.pipeline(transaction=False)
+        for elem in elems:
+            pipeline.execute_command(*self.xadd_args(elem))
+        pipeline.execute()
+        return 0
+
+    def depth(self):
+        return self.redis_client.execute_command('XLEN', self.buffer_name)
+
+    def clearall(self):
+        super(StreamBuffer, self).clearall()
+
+        # Deleting the stream also deletes its consumer groups.
+        self.group_created = False
+        self.last_read_id = '0'
+
+    def last_read_timestamp(self):
+        """
+        Retrieve the time the most recently read element was added to the stream, e.g. to measure latency.
+        :return: time in seconds since the epoch as seen by the redis server, None if nothing was read yet.
+        """
+
+        if self.last_read_id == '0':
+            return None
+
+        return entry_id_to_timestamp(self.last_read_id)
+
+    def last_read_age(self):
+        """
+        Retrieve how long the most recently read element waited between being added and now. This assumes the clocks
+        of this host and the redis server are in sync.
+        :return: age in seconds, None if nothing was read yet.
+        """
+
+        timestamp = self.last_read_timestamp()
+        if timestamp is None:
+            return None
+
+        return time.time() - timestamp
+
+    def xadd_args(self, elem):
+        """
+        Build the XADD command adding elem to the stream.
+        :param elem: element to be placed at the end.
+        :return: list of command arguments.
+        """
+
+        args = ['XADD', self.buffer_name]
+        if self.max_len:
+            if self.exact_trim:
+                args += ['MAXLEN', self.max_len]
+            else:
+                args += ['MAXLEN', '~', self.max_len]
+
+        return args + ['*', ELEM_FIELD, self.serialize_elem(elem)]
+
+    def read_entries(self, max_n, block_ms):
+        """
+        Read up to max_n elements following this reader's cursor or consumer group.
+        :param max_n: maximum number of elements to read.
+        :param block_ms: time in milliseconds to wait for the first element, 0 to wait indefinitely, None to not wait.
+        :return: list of elems, empty if none arrived in time.
+        """
+
+        if self.group_name is None:
+            args = ['XREAD']
+        else:
+            self.create_group()
+            args = ['XREADGROUP', 'GROUP', self.group_name, self.consumer_name]
+
+        args += ['COUNT', max_n]
+        if block_ms is not None:
+            args += ['BLOCK', block_ms]
+        if self.group_name is not None:
+            # Elements count as processed once delivered, so they are not tracked as pending.
+            args += ['NOACK']
+
+        cursor = self.last_read_id
+        if self.group_name is not None:
+            cursor = '>'
+        args += ['STREAMS', self.buffer_name, cursor]
+
+        entries = parse_stream_entries(self.redis_client.execute_command(*args))
+        if entries:
+            self.last_read_id = entries[-1][0]
+
+        return [self.deserialize_elem(serialized_elem) for _, serialized_elem in entries]
+
+    def create_group(self):
+        """
+        Create the consumer group, and the stream if needed, unless done already.
+        """
+
+        if self.group_created:
+            return
+
+        try:
+            self.redis_client.execute_command('XGROUP', 'CREATE', self.buffer_name, self.group_name, '0', 'MKSTREAM')
+        except redis.exceptions.ResponseError:
+            # BUSYGROUP: another reader created the group already. Any other error is passed on.
+            if not str(sys.exc_info()[1]).startswith('BUSYGROUP'):
+                raise
+
+        self.group_created = True
+
+
+class StreamActionBuffer(ActionBuffer, StreamBuffer):
+    """
+    ActionBuffer backed by a redis stream.
+    """
+
+    pass
+
+
+class StreamObservationBuffer(ObservationBuffer, StreamBuffer):
+    """
+    ObservationBuffer backed by a redis stream.
+    """
+
+    pass
+
+
+class StreamSharedMemoryObservationBuffer(SharedMemoryObservationBuffer, StreamBuffer):
+    """
+    SharedMemoryObservationBuffer passing its references through a redis stream.
+    """
+
+    pass
@@ -0,0 +1,280 @@
+"""
+File that contains the loop shared by the ConnectionClient and the SimulatedConnectionClient: reading actions from the
+action buffer and answering each with an encoded screenshot. It does not depend on monkeyrunner and stays python 2.5
+compatible, as the ConnectionClient runs under jython.
+"""
+
+import logging
+import redis
+import time
+
+from buffers.buffer import OVERFLOW_DROP_OLDEST, overflow_evicts, session_key
+from buffers.buffer_factory import LIST_BACKEND, REDIS_TRANSPORT, create_buffers
+from buffers.redis_connection import create_redis_client
+from buffers.shared_memory_observation_buffer import DEFAULT_RING_PATH
+from device.observation_codecs import AUTO_CODEC_NAME, CODECS, DEFAULT_CODEC_NAME, TILE_DELTA_CODEC_NAMES, \
+    create_codec, select_fastest_codec
+from device.screen_settle import CAPTURE_MODE_SETTLE, CAPTURE_MODE_SLEEP, CAPTURE_MODES, DEFAULT_SETTLE_FRAMES, \
+    DEFAULT_SETTLE_TIMEOUT, ScreenSettleDetector
+from eventobjects.observation import Observation
+
+try:
+    from environment.observation_decoding import decode_observation
+except ImportError:
+    # The decoders of the environment need numpy and PIL, which jython has not.
+    decode_observation = None
+
+
+class BaseConnectionClient(object):
+    """
+    The BaseConnectionClient maintains the two way interface between an ActionBuffer, ObservationBuffer pair and a
+    screen.
+
+    It listens for updates to the action buffer and takes action once an element arrives, blocking otherwise. When the
+    action is taken, it either waits for a predefined amount of time before taking a screenshot, or takes screenshots
+    until the screen settles, depending on the capture mode. The screenshot is then encoded and placed into the
+    observation buffer.
+
+    Subclasses carry out the actions and take the screenshots by implementing take_action() and take_screenshot().
+    """
+
+    # Max number of times to retry taking a screenshot.
+    MAX_SCREENSHOT_RETRY = 3
+
+    # Exception raised by take_screenshot() for a failed screenshot that may be retried.
+    SCREENSHOT_ERROR = Exception
+
+    # Redis key used to measure transfer latency when picking the observation codec automatically.
+    CODEC_PROBE_KEY = "observation_codec_probe"
+
+    # Level of the logger of the client.
+    LOG_LEVEL = logging.DEBUG
+
+    def __init__(self, redis_port, observation_delta=250, observation_codec=DEFAULT_CODEC_NAME,
+                 observation_transport=REDIS_TRANSPORT, ring_path=DEFAULT_RING_PATH, buffer_backend=LIST_BACKEND,
+                 observation_capacity=0, overflow_policy=OVERFLOW_DROP_OLDEST, session_id=None,
+                 capture_mode=CAPTURE_MODE_SLEEP, settle_frames=DEFAULT_SETTLE_FRAMES,
+                 settle_timeout=DEFAULT_SETTLE_TIMEOUT, redis_socket_path=None):
+        """
+        Initialize the client and setup the two buffers.
+        :param redis_port: Port to start the redis connection.
+        :param observation_delta: Time interval in milliseconds to wait after an action before taking a screenshot.
+        :param observation_codec: Name of the codec in CODECS used to encode screenshots, or AUTO_CODEC_NAME to pick
+        the codec with the lowest latency for the current link.
+        :param observation_transport: How observations are handed to the Multivac, one of OBSERVATION_TRANSPORTS.
+        :param ring_path: Path to the ring file used by the shared memory observation transport.
+        :param buffer_backend: Redis data structure backing the buffers, one of BUFFER_BACKENDS.
+        :param observation_capacity: Max number of observations held by the observation buffer, 0 for unbounded.
+        :param overflow_policy: What happens to observations sent while the observation buffer is full, one of
+        OVERFLOW_POLICIES.
+        :param session_id: Id of the session, scoping its redis keys so that many sessions can share one redis server.
+        :param capture_mode: When to take the screenshot after an action, one of CAPTURE_MODES.
+        :param settle_frames: Number of successive identical screenshots a settled screen takes, in settle mode.
+        :param settle_timeout: Max time in milliseconds to wait for the screen to settle, in settle mode.
+        :param redis_socket_path: Path to the unix domain socket of the redis server, None to connect over TCP.
+        """
+
+        assert observation_codec == AUTO_CODEC_NAME or observation_codec in CODECS, \
+            str(observation_codec) + " is not a valid observation codec"
+        assert capture_mode in CAPTURE_MODES, str(capture_mode) + " is not a valid capture mode"
+
+        # Tile deltas build on the observation before them, which must not be evicted from the observation buffer.
+        self.observation_buffer_evicts = overflow_evicts(observation_capacity, overflow_policy)
+        assert not (self.observation_buffer_evicts and observation_codec in TILE_DELTA_CODEC_NAMES), \
+            str(observation_codec) + " needs an observation buffer that does not evict observations, e.g. with the " + \
+            "drop-newest overflow policy"
+
+        self.name = self.__class__.__name__
+
+        self.logger = logging.getLogger(self.name)
+        self.logger.addHandler(logging.StreamHandler())
+        self.logger.setLevel(self.LOG_LEVEL)
+
+        # Start Redis connection on specified port or socket.
+        self.redis_client = create_redis_client(redis_port, socket_path=redis_socket_path)
+
+        # Initialize buffers.
+        self.action_buffer, self.observation_buffer = create_buffers(
+            self.redis_client,
+            observation_transport,
+            ring_path,
+            buffer_backend,
+            observation_capacity,
+            overflow_policy,
+            session_id
+        )
+        self.codec_probe_key = session_key(self.CODEC_PROBE_KEY, session_id)
+
+        self.observation_delta = observation_delta / 1000.0
+
+        self.capture_mode = capture_mode
+        self.screen_settle_detector = ScreenSettleDetector(
+            self.take_snapshot,
+            lambda snapshot_and_timestamp: snapshot_and_timestamp[0].signature(),
+            settle_frames,
+            settle_timeout
+        )
+
+        # Id of the next observation sent, incremented per screenshot unless set from the sequence id of an action.
+        self.step_id = 0
+
+        # Number of screenshots that failed, including retried ones.
+        self.num_failed_screenshots = 0
+
+        self.observation_codec_name = observation_codec
+        self.observation_codec = None
+        if observation_codec != AUTO_CODEC_NAME:
+            self.observation_codec = create_codec(observation_codec)
+
+    def start(self):
+        """
+        First, send a screenshot message to the observation buffer to provide an example image response. Then,
+        start an infinite cycle of listening to the action buffer and populating the observation buffer, until redis
+        goes away.
+
+        In each iteration, read action from the action_buffer and take it. Then either wait observation_delta
+        milliseconds and take a screenshot, or wait for the screen to settle.
+        """
+
+        try:
+            if self.observation_codec is None:
+                self.select_observation_codec()
+
+            # Initial step is to pass a screenshot into the observation buffer
+            self.logger.debug("Sending initial observation image")
+            self.gather_observation()
+
+            while True:
+                action = self.action_buffer.blocking_read_elem()
+                self.take_action(action)
+
+                # Observations answering numbered actions carry their sequence id, so that the environment can pair
+                # them up while several actions are in flight.
+                if action.sequence_id is not None:
+                    self.step_id = action.sequence_id
+
+                if self.capture_mode == CAPTURE_MODE_SETTLE:
+                    self.gather_settled_observation()
+                else:
+                    time.sleep(self.observation_delta)
+                    self.gather_observation()
+        except redis.connection.ConnectionError:
+            self.observation_buffer.close()
+            self.logger.info("Redis has been terminated, " + self.name + " is shut down.")
+
+    def take_action(self, action):
+        """
+        Takes the given action on the screen. Reset actions have to request a keyframe from the observation codec, as
+        the environment drops its frame state on reset.
+        :param action: Action object.
+        """
+
+        raise NotImplementedError
+
+    def take_screenshot(self):
+        """
+        Take a single screenshot.
+        :return: snapshot of the screen, as encoded by the observation codecs.
+        """
+
+        raise NotImplementedError
+
+    def select_observation_codec(self):
+        """
+        Pick the observation codec with the lowest latency of encoding a screenshot, moving it through redis and
+        decoding it the way the environment does. Where the decoders of the environment cannot run, i.e. under jython,
+        decoding is left out of the measurement.
+        """
+
+        def transfer(serialized_observation):
+            pipeline = self.redis_client.pipeline()
+            pipeline.set(self.codec_probe_key, serialized_observation)
+            pipeline.get(self.codec_probe_key)
+            pipeline.delete(self.codec_probe_key)
+            return pipeline.execute()[1]
+
+        decode = None
+        if decode_observation is not None:
+            # Every probe is encoded by a new codec and thereby a keyframe, which decodes without any frame state.
+            decode = lambda serialized_observation: decode_observation(Observation.deserialize(serialized_observation))
+        else:
+            self.logger.info("Observation decoders are not available, codecs are measured without decoding")
+
+        codec_names = sorted(CODECS.keys())
+        if self.observation_buffer_evicts:
+            codec_names = [codec_name for codec_name in codec_names if codec_name not in TILE_DELTA_CODEC_NAMES]
+
+        snapshot, _ = self.take_snapshot()
+        self.observation_codec_name, latencies = select_fastest_codec(snapshot, transfer, decode, codec_names)
+        self.observation_codec = create_codec(self.observation_codec_name)
+
+        for codec_name in sorted(latencies.keys()):
+            self.logger.debug("Codec " + codec_name + ": " + str(int(latencies[codec_name] * 1000)) + " ms")
+        self.logger.info("Selected observation codec: " + self.observation_codec_name)
+
+    def take_snapshot(self):
+        """
+        Take a screenshot, retrying on failures.
+        :return: (snapshot, capture timestamp) tuple.
+        """
+
+        num_retry = 0
+        while num_retry < self.MAX_SCREENSHOT_RETRY:
+            try:
+                return self.take_screenshot(), time.time()
+            except self.SCREENSHOT_ERROR:
+                self.logger.debug("Taking screenshot failed. Trying again.")
+                self.num_failed_screenshots += 1
+                num_retry += 1
+
+        self.logger.critical("Taking screenshot failed after max retries. Failing out.")
+        raise Exception("Taking screenshot failed.")
+
+    def gather_observation(self):
+        """
+        Take a screenshot, encode it with the observation codec and add it into the observation buffer.
+        """
+
+        snapshot, timestamp = self.take_snapshot()
+        self.send_observation(snapshot, timestamp)
+
+    def gather_settled_observation(self):
+        """
+        Take screenshots until the screen settles, and add the last one into the observation buffer along with the
+        measured settle time.
+        """
+
+        (snapshot, timestamp), settle_time, settled = self.screen_settle_detector.wait_for_settle()
+        if not settled:
+            self.logger.debug("Screen did not settle within " + str(int(settle_time * 1000)) + " ms")
+
+        self.send_observation(snapshot, timestamp, settle_time)
+
+    def send_observation(self, snapshot, timestamp, settle_time=0.0):
+        """
+        Encode a screenshot with the observation codec and add it into the observation buffer.
+        :param snapshot: snapshot of the screen.
+        :param timestamp: time in seconds since the epoch at which the screenshot was taken.
+        :param settle_time: time in seconds the screen took to settle, 0 if it was not measured.
+        """
+
+        observation = self.observation_codec.encode(snapshot)
+        observation.step_id = self.step_id
+        observation.timestamp = timestamp
+        observation.settle_time = settle_time
+
+        if self.observation_buffer.put_elem(observation):
+            # A dropped tile delta would leave the environment with a stale frame, so resync it.
+            self.observation_codec.request_keyframe()
+            self.logger.debug("Observation buffer full, dropped observations: " +
+                              str(self.observation_buffer.num_dropped()))
+        self.step_id += 1
+
+    def shutdown(self):
+        """
+        Shutdown the client.
+        """
+
+        self.observation_buffer.close()
+        self.logger.info(self.name + " shutting down after " + str(self.num_failed_screenshots) +
+                         " failed screenshots.")
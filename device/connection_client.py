@@ -1,85 +1,96 @@
-import logging
-import redis
 import time
 
 from com.android.monkeyrunner import MonkeyRunner, MonkeyDevice
 from com.android.ddmlib import TimeoutException
 
-from buffers.action_buffer import ActionBuffer
-from buffers.observation_buffer import ObservationBuffer
+from buffers.buffer import OVERFLOW_DROP_OLDEST
+from buffers.buffer_factory import LIST_BACKEND, REDIS_TRANSPORT
+from buffers.shared_memory_observation_buffer import DEFAULT_RING_PATH
 from device.adb_shell_cmds_manager import AdbShellCmdsManager
-from eventobjects.observation import Observation
+from device.base_connection_client import BaseConnectionClient
+from device.monkey_snapshot import MonkeySnapshot
+from device.observation_codecs import DEFAULT_CODEC_NAME
+from device.screen_settle import CAPTURE_MODE_SLEEP, DEFAULT_SETTLE_FRAMES, DEFAULT_SETTLE_TIMEOUT
+from eventobjects.action import GESTURE_DRAG, GESTURE_LONG_PRESS, GESTURE_SWIPE, GESTURE_TAP, GESTURE_WAIT
 
 
-class ConnectionClient:
+class ConnectionClient(BaseConnectionClient):
     """
     The ConnectionClient object manages I/O with a connected device via the monkeyrunner API.
     It maintains a two way interface between an ActionBuffer, ObservationBuffer pair and the device.
 
     Specifically, the client manages listening for updates to the action buffer and taking action once
-    an element arrives. It blocks otherwise. When the action is taken, it waits for a predefined amount of time
-    before taking a screenshot of the device. This is then placed into the observation buffer.
+    an element arrives. It blocks otherwise. When the action is taken, it either waits for a predefined amount of time
+    before taking a screenshot of the device, or takes screenshots until the screen settles, depending on the capture
+    mode. The screenshot is then placed into the observation buffer. See BaseConnectionClient for the loop.
     """
 
     # Time in seconds to wait to screenshot if a reset action is taken.
     RESET_TIME = 5
 
-    # Max number of times to retry taking device screenshot
-    MAX_SCREENSHOT_RETRY = 3
+    # Number of intermediate touch events of swipes and drags.
+    GESTURE_MOVE_STEPS = 10
 
-    def __init__(self, redis_port, observation_delta=250):
+    # Time in seconds a drag holds its start coordinate, so that the device registers a long press before the move.
+    DRAG_HOLD_TIME = 0.6
+
+    # Time in seconds to wait for a specific device to connect.
+    DEVICE_CONNECTION_TIMEOUT = 60
+
+    # Screenshots timing out are retried.
+    SCREENSHOT_ERROR = TimeoutException
+
+    def __init__(self, redis_port, observation_delta=250, observation_codec=DEFAULT_CODEC_NAME,
+                 observation_transport=REDIS_TRANSPORT, ring_path=DEFAULT_RING_PATH, buffer_backend=LIST_BACKEND,
+                 observation_capacity=0, overflow_policy=OVERFLOW_DROP_OLDEST, session_id=None, device_id=None,
+                 capture_mode=CAPTURE_MODE_SLEEP, settle_frames=DEFAULT_SETTLE_FRAMES,
+                 settle_timeout=DEFAULT_SETTLE_TIMEOUT, redis_socket_path=None):
         """
         Initialize the client. Verify connection with the device and setup the two buffers.
         :param redis_port: Port to start the redis connection.
         :param observation_delta: Time interval in milliseconds that the client should poll for an
         image from the device.
+        :param observation_codec: Name of the codec in CODECS used to encode screenshots, or AUTO_CODEC_NAME to pick
+        the codec with the lowest latency for the current link.
+        :param observation_transport: How observations are handed to the Multivac, one of OBSERVATION_TRANSPORTS.
+        :param ring_path: Path to the ring file used by the shared memory observation transport.
+        :param buffer_backend: Redis data structure backing the buffers, one of BUFFER_BACKENDS.
+        :param observation_capacity: Max number of observations held by the observation buffer, 0 for unbounded.
+        :param overflow_policy: What happens to observations sent while the observation buffer is full, one of
+        OVERFLOW_POLICIES.
+        :param session_id: Id of the session, scoping its redis keys so that many sessions can share one redis server.
+        :param device_id: Serial of the device to connect to, e.g. emulator-5554. None connects to any device.
+        :param capture_mode: When to take the screenshot after an action, one of CAPTURE_MODES.
+        :param settle_frames: Number of successive identical screenshots a settled screen takes, in settle mode.
+        :param settle_timeout: Max time in milliseconds to wait for the screen to settle, in settle mode.
+        :param redis_socket_path: Path to the unix domain socket of the redis server, None to connect over TCP.
         """
 
-        self.logger = logging.getLogger("ConnectionClient")
-        self.logger.addHandler(logging.StreamHandler())
-        self.logger.setLevel(logging.DEBUG)
+        super(ConnectionClient, self).__init__(
+            redis_port,
+            observation_delta,
+            observation_codec,
+            observation_transport,
+            ring_path,
+            buffer_backend,
+            observation_capacity,
+            overflow_policy,
+            session_id,
+            capture_mode,
+            settle_frames,
+            settle_timeout,
+            redis_socket_path
+        )
 
         self.logger.info("Waiting for device connection.")
-        self.connected_device = MonkeyRunner.waitForConnection()
+        if device_id is None:
+            self.connected_device = MonkeyRunner.waitForConnection()
+        else:
+            self.connected_device = MonkeyRunner.waitForConnection(self.DEVICE_CONNECTION_TIMEOUT, device_id)
         self.logger.info("Device found!")
 
-        # Start Redis connection on specified port.
-        self.redis_client = redis.Redis(port=redis_port)
-
-        # Initialize buffers.
-        self.action_buffer = ActionBuffer(self.redis_client)
-        self.observation_buffer = ObservationBuffer(self.redis_client)
-
-        self.observation_delta = observation_delta / 1000.0
-
         self.adb_shell_cmds_manager = AdbShellCmdsManager(self.connected_device)
 
-    def start(self):
-        """
-        First, send a screenshot message to the observation buffer to provide an example image response. Then,
-        start an infinite cycle of listening to the action buffer and populating the observation buffer.
-        Once terminated, the shutdown function will be invoked.
-
-        In each iteration, read action from the action_buffer and apply it to the device. Then wait observation_delta
-        milliseconds and take a screenshot of the device.
-        """
-
-        try:
-            # Initial step is to pass a screenshot into the observation buffer
-            self.logger.debug("Sending inital observation image")
-            self.gather_observation()
-
-            while True:
-                action = self.action_buffer.blocking_read_elem()
-                self.take_action(action)
-
-                time.sleep(self.observation_delta)
-
-                self.gather_observation()
-        except redis.connection.ConnectionError:
-            self.redis_client.shutdown()
-            self.logger.info("Redis has been terminated, connection client is shut down.")
-
     def take_action(self, action):
         """
         Takes the given action on the device.
@@ -90,46 +101,68 @@ class ConnectionClient:
             # Reset device to its original state by closing all active applications.
             self.adb_shell_cmds_manager.close_applications()
 
+            # The environment drops its frame state on reset, so the next observation has to be self-contained.
+            self.observation_codec.request_keyframe()
+
             self.logger.debug("Action taken! This is a reset action closing all open applications")
 
             # Custom sleep for a longer period of time since reboot may take a while
             time.sleep(self.RESET_TIME)
+        elif action.gestures is not None:
+            # The gestures of a macro-action run back to back; a single observation is taken once all are done.
+            for gesture in action.gestures:
+                self.take_gesture(gesture)
+            self.logger.debug("Action taken! Macro-action of " + str(len(action.gestures)) + " gestures")
         else:
             x, y = action.click_coordinate
             device_x, device_y = int(x), int(y)
             self.connected_device.touch(device_x, device_y, MonkeyDevice.DOWN_AND_UP)
             self.logger.debug("Action taken! Coordinates (" + str(device_x) + "," + str(device_y) + ")")
 
-    def gather_observation(self):
+    def take_gesture(self, gesture):
         """
-        Take a screenshot of the device and add the image bytes (png format) into the observation buffer.
+        Takes the given gesture on the device.
+        :param gesture: Gesture object.
         """
 
-        num_retry = 0
-        while num_retry < self.MAX_SCREENSHOT_RETRY:
-            try:
-                device_image = self.connected_device.takeSnapshot()
-
-                img_bytes = device_image.convertToBytes().tostring()
-
-                observation = Observation(img_bytes)
-
-                self.observation_buffer.put_elem(observation)
-
-                return
-            except TimeoutException:
-                self.logger.error("Taking screenshot failed. Trying again.")
-                num_retry += 1
+        start_x, start_y = int(gesture.start[0]), int(gesture.start[1])
+        end_x, end_y = int(gesture.end[0]), int(gesture.end[1])
+        duration = gesture.duration / 1000.0
+
+        if gesture.kind == GESTURE_TAP:
+            self.connected_device.touch(start_x, start_y, MonkeyDevice.DOWN_AND_UP)
+        elif gesture.kind == GESTURE_SWIPE:
+            self.connected_device.drag((start_x, start_y), (end_x, end_y), duration, self.GESTURE_MOVE_STEPS)
+        elif gesture.kind == GESTURE_LONG_PRESS:
+            self.connected_device.touch(start_x, start_y, MonkeyDevice.DOWN)
+            time.sleep(duration)
+            self.connected_device.touch(start_x, start_y, MonkeyDevice.UP)
+        elif gesture.kind == GESTURE_DRAG:
+            self.connected_device.touch(start_x, start_y, MonkeyDevice.DOWN)
+            time.sleep(self.DRAG_HOLD_TIME)
+            for step in range(1, self.GESTURE_MOVE_STEPS + 1):
+                x = start_x + (end_x - start_x) * step // self.GESTURE_MOVE_STEPS
+                y = start_y + (end_y - start_y) * step // self.GESTURE_MOVE_STEPS
+                self.connected_device.touch(x, y, MonkeyDevice.MOVE)
+                time.sleep(duration / self.GESTURE_MOVE_STEPS)
+            self.connected_device.touch(end_x, end_y, MonkeyDevice.UP)
+        elif gesture.kind == GESTURE_WAIT:
+            time.sleep(duration)
+
+    def take_screenshot(self):
+        """
+        Take a screenshot of the device.
+        :return: MonkeySnapshot of the screenshot.
+        """
 
-        self.logger.critical("Taking screenshot failed after max retries. Failing out.")
-        raise Exception("Taking screenshot failed.")
+        return MonkeySnapshot(self.connected_device.takeSnapshot())
 
     def shutdown(self):
         """
         Shutdown the connection client.
         """
 
-        self.logger.info("Connection client shutting down.")
+        super(ConnectionClient, self).shutdown()
 
         # Kill any monkey processes running on the device. This is required due to a bug in monkeyrunner itself
         self.adb_shell_cmds_manager.shutdown_monkey_on_device()
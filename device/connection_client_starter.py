@@ -3,6 +3,19 @@ This is a starter script for the connection_client. It requires the following cm
   i) redispy path: local path to redispy library
   ii) port that redis server is running
   iii) observation delta: time in milliseconds after an action is taken to take a screenshot of the device.
+Optional arguments:
+  --observation-codec: name of the codec used to encode screenshots (see device/observation_codecs.py).
+  --observation-transport: how observations are handed to the Multivac (see buffers/buffer_factory.py).
+  --ring-path: path to the ring file of the shared memory observation transport.
+  --buffer-backend: redis data structure backing the buffers (see buffers/buffer_factory.py).
+  --observation-capacity: max number of observations held by the observation buffer, 0 for unbounded.
+  --overflow-policy: what happens to observations sent while the observation buffer is full (see buffers/buffer.py).
+  --redis-socket-path: path to the unix domain socket of the redis server; TCP on the given port is used otherwise.
+  --session-id: id of the session scoping its redis keys, so that many sessions can share one redis server.
+  --device-id: serial of the device to connect to, e.g. emulator-5554.
+  --capture-mode: when to take the screenshot after an action (see device/screen_settle.py).
+  --settle-frames: number of successive identical screenshots a settled screen takes, in settle mode.
+  --settle-timeout: max time in milliseconds to wait for the screen to settle, in settle mode.
 It is best to call this using `session_starter.py`.
 """
 
@@ -10,8 +23,39 @@ import os
 import signal
 import sys
 
-assert(len(sys.argv) == 4, 'Three arguments required.')
-redispy_path, redis_port, observation_delta = sys.argv[1:]
+from optparse import OptionParser
+
+parser = OptionParser(usage="%prog redispy_path redis_port observation_delta [options]")
+parser.add_option('--observation-codec', dest='observation_codec', default='png',
+                  help="Name of the codec used to encode screenshots, or 'auto'.")
+parser.add_option('--observation-transport', dest='observation_transport', default='redis',
+                  help="How observations are handed to the Multivac: 'redis' or 'shared-memory'.")
+parser.add_option('--ring-path', dest='ring_path', default=None,
+                  help="Path to the ring file of the shared memory observation transport.")
+parser.add_option('--buffer-backend', dest='buffer_backend', default='list',
+                  help="Redis data structure backing the buffers: 'list' or 'stream'.")
+parser.add_option('--observation-capacity', dest='observation_capacity', type='int', default=0,
+                  help="Max number of observations held by the observation buffer, 0 for unbounded.")
+parser.add_option('--overflow-policy', dest='overflow_policy', default='drop-oldest',
+                  help="Policy applied when the observation buffer is full: 'block', 'drop-oldest', 'drop-newest' "
+                       "or 'keep-latest'.")
+parser.add_option('--redis-socket-path', dest='redis_socket_path', default=None,
+                  help="Path to the unix domain socket of the redis server.")
+parser.add_option('--session-id', dest='session_id', default=None,
+                  help="Id of the session scoping its redis keys.")
+parser.add_option('--device-id', dest='device_id', default=None,
+                  help="Serial of the device to connect to. Any device is used if not given.")
+parser.add_option('--capture-mode', dest='capture_mode', default='sleep',
+                  help="When to take the screenshot after an action: 'sleep' or 'settle'.")
+parser.add_option('--settle-frames', dest='settle_frames', type='int', default=3,
+                  help="Number of successive identical screenshots a settled screen takes.")
+parser.add_option('--settle-timeout', dest='settle_timeout', type='int', default=2000,
+                  help="Max time in milliseconds to wait for the screen to settle.")
+options, args = parser.parse_args(sys.argv[1:])
+
+if len(args) != 3:
+    parser.error('Three positional arguments required.')
+redispy_path, redis_port, observation_delta = args
 
 # Add the redispy (python 2.5 compatible version) library.
 sys.path.append(redispy_path)
@@ -19,10 +63,26 @@ sys.path.append(redispy_path)
 # This is to ensure jython will have the current project in its path.
 sys.path.append(os.getcwd())
 
+from buffers.shared_memory_observation_buffer import DEFAULT_RING_PATH
 from device.connection_client import ConnectionClient
 
 # Initialize the connection client.
-client = ConnectionClient(int(redis_port), int(observation_delta))
+client = ConnectionClient(
+    int(redis_port),
+    int(observation_delta),
+    redis_socket_path=options.redis_socket_path,
+    observation_codec=options.observation_codec,
+    observation_transport=options.observation_transport,
+    ring_path=options.ring_path or DEFAULT_RING_PATH,
+    buffer_backend=options.buffer_backend,
+    observation_capacity=options.observation_capacity,
+    overflow_policy=options.overflow_policy,
+    session_id=options.session_id,
+    device_id=options.device_id,
+    capture_mode=options.capture_mode,
+    settle_frames=options.settle_frames,
+    settle_timeout=options.settle_timeout
+)
 
 
 def terminate_on_signal(signum, _):
@@ -0,0 +1,109 @@
+import jarray
+
+from java.io import ByteArrayOutputStream
+from java.nio import ByteBuffer
+from java.util import Arrays
+from javax.imageio import IIOImage, ImageIO, ImageWriteParam
+
+from com.android.monkeyrunner import MonkeyImage
+
+from eventobjects.observation import IMAGE_FORMAT_RAW_ARGB
+
+
+class MonkeySnapshot(object):
+    """
+    The MonkeySnapshot wraps a MonkeyImage taken by monkeyrunner and exposes it to the observation codecs.
+
+    MonkeyImage only offers png encoding and per pixel access, so the raw and fast png paths go through the
+    underlying java BufferedImage instead.
+    """
+
+    # Compression quality for the fast png path: 1.0 means least compression, i.e. fastest.
+    FAST_PNG_COMPRESSION_QUALITY = 1.0
+
+    # Every how many rows a row is hashed into the signature of the snapshot.
+    SIGNATURE_ROW_STRIDE = 4
+
+    def __init__(self, monkey_image):
+        """
+        Initialize the snapshot.
+        :param monkey_image: MonkeyImage returned by MonkeyDevice.takeSnapshot().
+        """
+
+        self.monkey_image = monkey_image
+        self.buffered_image = None
+
+    def get_buffered_image(self):
+        """
+        Retrieve the BufferedImage backing the MonkeyImage. It is held in a private field, hence the reflection.
+        :return: java.awt.image.BufferedImage.
+        """
+
+        if self.buffered_image is None:
+            impl_field = MonkeyImage.getDeclaredField('impl')
+            impl_field.setAccessible(True)
+            self.buffered_image = impl_field.get(self.monkey_image).getBufferedImage()
+
+        return self.buffered_image
+
+    def png_bytes(self, fast=False):
+        """
+        Encode the snapshot as png.
+        :param fast: flag to use the fastest compression setting the png writer supports.
+        :return: string of png encoded image.
+        """
+
+        if not fast:
+            return self.monkey_image.convertToBytes().tostring()
+
+        writer = ImageIO.getImageWritersByFormatName('png').next()
+        param = writer.getDefaultWriteParam()
+        if param.canWriteCompressed():
+            param.setCompressionMode(ImageWriteParam.MODE_EXPLICIT)
+            param.setCompressionQuality(self.FAST_PNG_COMPRESSION_QUALITY)
+
+        output_stream = ByteArrayOutputStream()
+        image_output_stream = ImageIO.createImageOutputStream(output_stream)
+        try:
+            writer.setOutput(image_output_stream)
+            writer.write(None, IIOImage(self.get_buffered_image(), None, None), param)
+        finally:
+            image_output_stream.close()
+            writer.dispose()
+
+        return output_stream.toByteArray().tostring()
+
+    def signature(self):
+        """
+        Compute a cheap digest of the snapshot, hashing every SIGNATURE_ROW_STRIDE-th row of pixels in java. Changes
+        confined to the rows in between are missed, which is fine for detecting whether the screen is still changing.
+        :return: 32 bit int, equal for identical snapshots.
+        """
+
+        image = self.get_buffered_image()
+        width, height = image.getWidth(), image.getHeight()
+
+        row = jarray.zeros(width, 'i')
+        signature = 1
+        for y in range(0, height, self.SIGNATURE_ROW_STRIDE):
+            image.getRGB(0, y, width, 1, row, 0, width)
+            signature = (31 * signature + Arrays.hashCode(row)) & 0xFFFFFFFF
+
+        return signature
+
+    def raw_pixels(self):
+        """
+        Read the raw pixels of the snapshot. getRGB converts whatever the backing raster is into packed ARGB ints in
+        native code, which are then laid out big endian, i.e. as A, R, G, B bytes per pixel.
+        :return: (raw pixel string, IMAGE_FORMAT_RAW_ARGB, height, width) tuple.
+        """
+
+        image = self.get_buffered_image()
+        width, height = image.getWidth(), image.getHeight()
+
+        pixels = image.getRGB(0, 0, width, height, None, 0, width)
+
+        byte_buffer = ByteBuffer.allocate(len(pixels) * 4)
+        byte_buffer.asIntBuffer().put(pixels)
+
+        return byte_buffer.array().tostring(), IMAGE_FORMAT_RAW_ARGB, height, width
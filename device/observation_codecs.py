@@ -0,0 +1,269 @@
+"""
+File that contains the codecs a connection client can use to encode device screenshots into observations.
+
+Codecs work on a snapshot object exposing:
+  i) png_bytes(fast): png encoded image; fast trades compression ratio for encoding speed.
+  ii) raw_pixels(): (raw pixel string, IMAGE_FORMAT_RAW_* constant, height, width) tuple.
+This module is shared by the jython connection client, so it keeps to python 2.5 compatible syntax.
+"""
+
+import struct
+import time
+import zlib
+
+from eventobjects.observation import Observation, COMPRESSION_LZ4, COMPRESSION_NONE, COMPRESSION_ZLIB, \
+    IMAGE_FORMAT_PNG, IMAGE_FORMAT_TILE_DELTA, RAW_CHANNELS, TILE_DELTA_FLAG_KEYFRAME, \
+    TILE_DELTA_FRAME_NUMBER_MODULUS, TILE_DELTA_HEADER_FORMAT, png_dimensions, tile_grid_shape
+
+try:
+    import lz4.frame as lz4_frame
+except ImportError:
+    # lz4 is an optional dependency and never available under jython.
+    lz4_frame = None
+
+
+class ObservationCodec(object):
+    """
+    Base codec that encodes a device snapshot into an Observation.
+    """
+
+    def encode(self, snapshot):
+        """
+        Encode the snapshot.
+        :param snapshot: snapshot object of the device screen.
+        :return: Observation object carrying the encoded image.
+        """
+
+        raise NotImplementedError()
+
+    def request_keyframe(self):
+        """
+        Request that the next observation is self-contained. This is a no-op for stateless codecs.
+        """
+
+        pass
+
+
+def compress(img_bytes, compression):
+    """
+    Compress an encoded image.
+    :param img_bytes: string of the encoded image.
+    :param compression: one of the COMPRESSION_* constants.
+    :return: compressed string.
+    """
+
+    if compression == COMPRESSION_ZLIB:
+        return zlib.compress(img_bytes, 1)
+    elif compression == COMPRESSION_LZ4:
+        return lz4_frame.compress(img_bytes)
+
+    return img_bytes
+
+
+class PngCodec(ObservationCodec):
+    """
+    Encodes the snapshot as png.
+    """
+
+    def __init__(self, fast=False):
+        """
+        Initialize the codec.
+        :param fast: flag to use the fastest, least compressing png setting.
+        """
+
+        self.fast = fast
+
+    def encode(self, snapshot):
+        img_bytes = snapshot.png_bytes(self.fast)
+        height, width = png_dimensions(img_bytes)
+
+        return Observation(img_bytes, IMAGE_FORMAT_PNG, COMPRESSION_NONE, height, width)
+
+
+class RawCodec(ObservationCodec):
+    """
+    Sends the raw pixels of the snapshot, optionally compressed.
+    """
+
+    def __init__(self, compression=COMPRESSION_NONE):
+        """
+        Initialize the codec.
+        :param compression: one of the COMPRESSION_* constants.
+        """
+
+        self.compression = compression
+
+    def encode(self, snapshot):
+        img_bytes, image_format, height, width = snapshot.raw_pixels()
+
+        return Observation(compress(img_bytes, self.compression), image_format, self.compression, height, width)
+
+
+class TileDeltaCodec(ObservationCodec):
+    """
+    Splits the raw pixels of each snapshot into square tiles and sends only the tiles whose hash changed since the
+    previous snapshot. Every keyframe_interval observations, and whenever a keyframe is requested, all tiles are sent.
+
+    The codec is stateful, so every connection client needs its own instance; see create_codec().
+    """
+
+    def __init__(self, tile_size=64, keyframe_interval=30, compression=COMPRESSION_NONE):
+        """
+        Initialize the codec.
+        :param tile_size: side length of a tile in pixels.
+        :param keyframe_interval: number of observations after which a keyframe is sent.
+        :param compression: one of the COMPRESSION_* constants, applied to the whole delta payload.
+        """
+
+        self.tile_size = tile_size
+        self.keyframe_interval = keyframe_interval
+        self.compression = compression
+
+        # crc32 of every tile of the previous snapshot; None forces a keyframe.
+        self.tile_hashes = None
+        self.num_since_keyframe = 0
+
+        # Frame number of the next observation.
+        self.frame_number = 0
+
+    def request_keyframe(self):
+        self.tile_hashes = None
+
+    def encode(self, snapshot):
+        img_bytes, image_format, height, width = snapshot.raw_pixels()
+
+        tile_rows, tile_cols = tile_grid_shape(height, width, self.tile_size)
+        pixel_size = RAW_CHANNELS[image_format]
+        row_stride = width * pixel_size
+
+        is_keyframe = self.tile_hashes is None or len(self.tile_hashes) != tile_rows * tile_cols or \
+            self.num_since_keyframe >= self.keyframe_interval
+
+        # Empty string of the same type as img_bytes, to join tile rows under both jython and python3.
+        empty = img_bytes[:0]
+
+        tile_hashes = []
+        changed_indices = []
+        changed_tiles = []
+        for tile_row in range(tile_rows):
+            y_start = tile_row * self.tile_size
+            y_end = min(y_start + self.tile_size, height)
+
+            for tile_col in range(tile_cols):
+                x_start = tile_col * self.tile_size * pixel_size
+                x_end = min((tile_col + 1) * self.tile_size, width) * pixel_size
+
+                tile = empty.join([img_bytes[y * row_stride + x_start:y * row_stride + x_end]
+                                   for y in range(y_start, y_end)])
+                tile_hash = zlib.crc32(tile)
+
+                tile_index = len(tile_hashes)
+                if is_keyframe or tile_hash != self.tile_hashes[tile_index]:
+                    changed_indices.append(tile_index)
+                    changed_tiles.append(tile)
+
+                tile_hashes.append(tile_hash)
+
+        self.tile_hashes = tile_hashes
+        if is_keyframe:
+            self.num_since_keyframe = 0
+        self.num_since_keyframe += 1
+
+        flags = 0
+        if is_keyframe:
+            flags |= TILE_DELTA_FLAG_KEYFRAME
+
+        payload = empty.join([
+            struct.pack(TILE_DELTA_HEADER_FORMAT, image_format, flags, self.tile_size, len(changed_indices),
+                        self.frame_number),
+            struct.pack('>' + str(len(changed_indices)) + 'I', *changed_indices)
+        ] + changed_tiles)
+        self.frame_number = (self.frame_number + 1) % TILE_DELTA_FRAME_NUMBER_MODULUS
+
+        return Observation(compress(payload, self.compression), IMAGE_FORMAT_TILE_DELTA, self.compression, height,
+                           width)
+
+
+# Name of the pseudo codec that measures all codecs and picks the fastest one for the current link.
+AUTO_CODEC_NAME = "auto"
+
+DEFAULT_CODEC_NAME = "png"
+
+# Dict mapping from codec name to a function that creates an instance of that codec.
+CODECS = {
+    'png': lambda: PngCodec(),
+    'png-fast': lambda: PngCodec(fast=True),
+    'raw': lambda: RawCodec(),
+    'raw-zlib': lambda: RawCodec(COMPRESSION_ZLIB),
+    'delta': lambda: TileDeltaCodec(),
+    'delta-zlib': lambda: TileDeltaCodec(compression=COMPRESSION_ZLIB)
+}
+
+# Names of the tile delta codecs, whose observations build on the one before them. They need an observation buffer
+# that never evicts observations it holds, see overflow_evicts().
+TILE_DELTA_CODEC_NAMES = ['delta', 'delta-zlib', 'delta-lz4']
+
+# Names of the codecs that need lz4. The connection client runs under jython, which has no lz4, so only a simulated
+# device can encode with them.
+LZ4_CODEC_NAMES = ['raw-lz4', 'delta-lz4']
+
+if lz4_frame is not None:
+    CODECS['raw-lz4'] = lambda: RawCodec(COMPRESSION_LZ4)
+    CODECS['delta-lz4'] = lambda: TileDeltaCodec(compression=COMPRESSION_LZ4)
+
+
+def create_codec(codec_name):
+    """
+    Create a new instance of the codec registered under codec_name.
+    :param codec_name: name of the codec in CODECS.
+    :return: ObservationCodec instance.
+    """
+
+    return CODECS[codec_name]()
+
+
+def measure_codec_latencies(snapshot, transfer_fn, codec_names, decode_fn=None):
+    """
+    Measure the end to end latency of each codec: encoding the snapshot, transferring the result and decoding what was
+    received, as the environment does.
+    :param snapshot: snapshot object of the device screen.
+    :param transfer_fn: function taking a serialized observation, sending it over the link under test and returning the
+    serialized observation as received.
+    :param codec_names: names of the codecs to measure.
+    :param decode_fn: function decoding a received serialized observation into an image, None to leave decoding out.
+    :return: dict mapping codec name to latency in seconds.
+    """
+
+    latencies = dict()
+    for codec_name in codec_names:
+        start = time.time()
+        received = transfer_fn(create_codec(codec_name).encode(snapshot).serialize())
+        if decode_fn is not None:
+            decode_fn(received)
+        latencies[codec_name] = time.time() - start
+
+    return latencies
+
+
+def select_fastest_codec(snapshot, transfer_fn, decode_fn=None, codec_names=None):
+    """
+    Pick the codec with the lowest end to end latency for the snapshot, see measure_codec_latencies().
+    :param snapshot: snapshot object of the device screen.
+    :param transfer_fn: function taking a serialized observation, sending it over the link under test and returning the
+    serialized observation as received.
+    :param decode_fn: function decoding a received serialized observation into an image, None to leave decoding out.
+    :param codec_names: names of the codecs to pick from, None for all codecs in CODECS.
+    :return: (codec name, dict mapping codec name to latency in seconds) tuple.
+    """
+
+    if codec_names is None:
+        codec_names = sorted(CODECS.keys())
+
+    latencies = measure_codec_latencies(snapshot, transfer_fn, codec_names, decode_fn)
+
+    fastest_codec_name = None
+    for codec_name in latencies:
+        if fastest_codec_name is None or latencies[codec_name] < latencies[fastest_codec_name]:
+            fastest_codec_name = codec_name
+
+    return fastest_codec_name, latencies
@@ -0,0 +1,84 @@
+"""
+File that contains the capture modes of the connection client and the detection of a settled screen, i.e. a screen
+that stopped changing after an action.
+
+This file is run by jython 2.5 on the device side, so it sticks to python 2.5 syntax.
+"""
+
+import time
+
+# Capture modes. Sleep waits a fixed observation delta after every action before taking one screenshot. Settle takes
+# screenshots back to back after the action until enough successive ones are identical.
+CAPTURE_MODE_SLEEP = "sleep"
+CAPTURE_MODE_SETTLE = "settle"
+CAPTURE_MODES = [CAPTURE_MODE_SLEEP, CAPTURE_MODE_SETTLE]
+
+# Default number of successive identical screenshots a settled screen takes.
+DEFAULT_SETTLE_FRAMES = 3
+
+# Default max time in milliseconds to wait for the screen to settle.
+DEFAULT_SETTLE_TIMEOUT = 2000
+
+
+class ScreenSettleDetector(object):
+    """
+    The ScreenSettleDetector takes screenshots back to back until num_settle_frames successive ones have the same
+    signature, or until the timeout passes. Signatures are cheap digests of a screenshot, e.g. a hash of a sample of
+    its rows, so that comparing frames costs far less than taking them.
+    """
+
+    def __init__(self, take_snapshot, frame_signature, num_settle_frames=DEFAULT_SETTLE_FRAMES,
+                 settle_timeout=DEFAULT_SETTLE_TIMEOUT, poll_interval=0.0, clock=time.time, sleep=time.sleep):
+        """
+        Initialize the detector.
+        :param take_snapshot: function taking no arguments and returning a screenshot.
+        :param frame_signature: function mapping a screenshot to a value that is equal for identical screenshots.
+        :param num_settle_frames: number of successive identical screenshots a settled screen takes, at least 2.
+        :param settle_timeout: max time in milliseconds to wait for the screen to settle.
+        :param poll_interval: time in seconds to wait between screenshots.
+        :param clock: function returning the current time in seconds.
+        :param sleep: function sleeping for a given time in seconds.
+        """
+
+        assert num_settle_frames >= 2, "A settled screen takes at least 2 identical screenshots"
+
+        self.take_snapshot = take_snapshot
+        self.frame_signature = frame_signature
+        self.num_settle_frames = num_settle_frames
+        self.settle_timeout = settle_timeout / 1000.0
+        self.poll_interval = poll_interval
+        self.clock = clock
+        self.sleep = sleep
+
+    def wait_for_settle(self):
+        """
+        Take screenshots until the screen settles or the timeout passes.
+        :return: (screenshot, settle time in seconds, settled flag) tuple. The screenshot is the last one taken, and the
+        settle time is measured from the call up to when it was taken.
+        """
+
+        start = self.clock()
+
+        snapshot = self.take_snapshot()
+        signature = self.frame_signature(snapshot)
+        num_identical = 1
+
+        while True:
+            elapsed = self.clock() - start
+
+            if num_identical >= self.num_settle_frames:
+                return snapshot, elapsed, True
+            if elapsed >= self.settle_timeout:
+                return snapshot, elapsed, False
+
+            if self.poll_interval > 0:
+                self.sleep(self.poll_interval)
+
+            snapshot = self.take_snapshot()
+            new_signature = self.frame_signature(snapshot)
+
+            if new_signature == signature:
+                num_identical += 1
+            else:
+                num_identical = 1
+            signature = new_signature
@@ -0,0 +1,154 @@
+"""
+File that contains a simulated stand-in for the ConnectionClient, for load testing the buffers, environments and
+everything behind them without monkeyrunner, Jython or a device. It runs on CPython only.
+"""
+
+import logging
+import math
+import random
+import time
+
+from buffers.buffer import OVERFLOW_DROP_OLDEST
+from buffers.buffer_factory import LIST_BACKEND, REDIS_TRANSPORT
+from buffers.shared_memory_observation_buffer import DEFAULT_RING_PATH
+from device.base_connection_client import BaseConnectionClient
+from device.observation_codecs import DEFAULT_CODEC_NAME
+from device.screen_settle import CAPTURE_MODE_SLEEP, DEFAULT_SETTLE_FRAMES, DEFAULT_SETTLE_TIMEOUT
+from device.simulated_screen import DEFAULT_TILE_SIZE, SimulatedScreen
+
+
+def lognormal_latency(rng, mean, jitter):
+    """
+    Draw a latency from the log-normal distribution with the given mean and standard deviation, whose long right tail
+    resembles the screenshot latencies of real devices.
+    """
+
+    if mean <= 0:
+        return 0.0
+
+    sigma_squared = math.log(1 + (jitter / mean) ** 2)
+
+    return rng.lognormvariate(math.log(mean) - sigma_squared / 2, math.sqrt(sigma_squared))
+
+
+# Dict mapping from the name of a latency distribution to a function drawing a latency from it, given a
+# random.Random, the mean latency and its standard deviation.
+LATENCY_DISTRIBUTIONS = {
+    'constant': lambda rng, mean, jitter: mean,
+    'uniform': lambda rng, mean, jitter: max(0.0, rng.uniform(mean - math.sqrt(3) * jitter,
+                                                               mean + math.sqrt(3) * jitter)),
+    'lognormal': lognormal_latency
+}
+
+DEFAULT_LATENCY_DISTRIBUTION = 'lognormal'
+
+
+class SimulatedScreenshotError(Exception):
+    """
+    Raised by a simulated screenshot that failed, like a TimeoutException of monkeyrunner.
+    """
+    pass
+
+
+class SimulatedConnectionClient(BaseConnectionClient):
+    """
+    The SimulatedConnectionClient speaks the buffer protocol of the ConnectionClient, but carries out actions on a
+    SimulatedScreen instead of a device. Every screenshot takes a latency drawn from a configurable distribution and
+    fails at a configurable rate, failures being retried like on a device, so that sessions against simulated devices
+    put the same kind of load on redis, the buffers and the environment as sessions against real ones.
+    """
+
+    SCREENSHOT_ERROR = SimulatedScreenshotError
+
+    LOG_LEVEL = logging.INFO
+
+    def __init__(self, redis_port, observation_delta=250, observation_codec=DEFAULT_CODEC_NAME,
+                 observation_transport=REDIS_TRANSPORT, ring_path=DEFAULT_RING_PATH, buffer_backend=LIST_BACKEND,
+                 observation_capacity=0, overflow_policy=OVERFLOW_DROP_OLDEST, session_id=None,
+                 capture_mode=CAPTURE_MODE_SLEEP, settle_frames=DEFAULT_SETTLE_FRAMES,
+                 settle_timeout=DEFAULT_SETTLE_TIMEOUT, image_height=1920, image_width=1080,
+                 tile_size=DEFAULT_TILE_SIZE, latency_distribution=DEFAULT_LATENCY_DISTRIBUTION, latency=100,
+                 latency_jitter=50, screenshot_failure_rate=0.0, seed=None, redis_socket_path=None):
+        """
+        Initialize the client and setup the two buffers.
+        :param redis_port: Port to start the redis connection.
+        :param observation_delta: Time interval in milliseconds to wait after an action before taking a screenshot.
+        :param observation_codec: Name of the codec in CODECS used to encode screenshots, or AUTO_CODEC_NAME.
+        :param observation_transport: How observations are handed to the Multivac, one of OBSERVATION_TRANSPORTS.
+        :param ring_path: Path to the ring file used by the shared memory observation transport.
+        :param buffer_backend: Redis data structure backing the buffers, one of BUFFER_BACKENDS.
+        :param observation_capacity: Max number of observations held by the observation buffer, 0 for unbounded.
+        :param overflow_policy: What happens to observations sent while the observation buffer is full.
+        :param session_id: Id of the session, scoping its redis keys.
+        :param capture_mode: When to take the screenshot after an action, one of CAPTURE_MODES.
+        :param settle_frames: Number of successive identical screenshots a settled screen takes, in settle mode.
+        :param settle_timeout: Max time in milliseconds to wait for the screen to settle, in settle mode.
+        :param image_height: Height of the simulated screen in pixels.
+        :param image_width: Width of the simulated screen in pixels.
+        :param tile_size: Edge length of the tiles of the simulated screen in pixels.
+        :param latency_distribution: Name of the distribution of screenshot latencies in LATENCY_DISTRIBUTIONS.
+        :param latency: Mean screenshot latency in milliseconds.
+        :param latency_jitter: Standard deviation of the screenshot latency in milliseconds.
+        :param screenshot_failure_rate: Probability of a screenshot failing.
+        :param seed: Seed of the simulated screen, latencies and failures, None for a random one.
+        :param redis_socket_path: Path to the unix domain socket of the redis server, None to connect over TCP.
+        """
+
+        assert latency_distribution in LATENCY_DISTRIBUTIONS, \
+            "{} is not a valid latency distribution".format(latency_distribution)
+        assert latency >= 0 and latency_jitter >= 0, "Latencies must be non-negative"
+        assert 0 <= screenshot_failure_rate < 1, "The screenshot failure rate must be in [0, 1)"
+
+        super(SimulatedConnectionClient, self).__init__(
+            redis_port,
+            observation_delta,
+            observation_codec,
+            observation_transport,
+            ring_path,
+            buffer_backend,
+            observation_capacity,
+            overflow_policy,
+            session_id,
+            capture_mode,
+            settle_frames,
+            settle_timeout,
+            redis_socket_path
+        )
+
+        self.screen = SimulatedScreen(image_height, image_width, tile_size, seed)
+
+        self.rng = random.Random(seed)
+        self.draw_latency = LATENCY_DISTRIBUTIONS[latency_distribution]
+        self.latency = latency / 1000.0
+        self.latency_jitter = latency_jitter / 1000.0
+        self.screenshot_failure_rate = screenshot_failure_rate
+
+    def take_action(self, action):
+        """
+        Takes the given action on the simulated screen.
+        :param action: Action object.
+        """
+
+        if action.is_reset_action:
+            self.screen.reset()
+
+            # The environment drops its frame state on reset, so the next observation has to be self-contained.
+            self.observation_codec.request_keyframe()
+        elif action.gestures is not None:
+            for gesture in action.gestures:
+                self.screen.take_gesture(gesture)
+        else:
+            self.screen.tap(action.click_coordinate)
+
+    def take_screenshot(self):
+        """
+        Wait for a latency drawn from the latency distribution, then fail at the screenshot failure rate.
+        :return: SimulatedSnapshot of the screen.
+        """
+
+        time.sleep(self.draw_latency(self.rng, self.latency, self.latency_jitter))
+
+        if self.rng.random() < self.screenshot_failure_rate:
+            raise SimulatedScreenshotError()
+
+        return self.screen.snapshot()
@@ -0,0 +1,97 @@
+"""
+This is a starter script for the simulated_connection_client, standing in for connection_client_starter.py when no
+device is attached. It runs on CPython and requires the following cmd line arguments in order:
+  i) port that redis server is running
+  ii) observation delta: time in milliseconds after an action is taken to take a screenshot.
+The optional arguments of connection_client_starter.py are accepted as well, apart from --device-id, along with the
+options of the simulated device, see `python device/simulated_connection_client_starter.py -h`.
+It is best to call this using `session_starter.py --simulated-device`.
+"""
+
+import argparse
+import os
+import signal
+import sys
+
+# This is to ensure the current project is in the path.
+sys.path.append(os.getcwd())
+
+from buffers.shared_memory_observation_buffer import DEFAULT_RING_PATH
+from device.simulated_connection_client import DEFAULT_LATENCY_DISTRIBUTION, LATENCY_DISTRIBUTIONS, \
+    SimulatedConnectionClient
+from device.simulated_screen import DEFAULT_TILE_SIZE
+
+parser = argparse.ArgumentParser()
+parser.add_argument('redis_port', type=int)
+parser.add_argument('observation_delta', type=int)
+parser.add_argument('--observation-codec', default='png')
+parser.add_argument('--observation-transport', default='redis')
+parser.add_argument('--ring-path', default=None)
+parser.add_argument('--buffer-backend', default='list')
+parser.add_argument('--observation-capacity', type=int, default=0)
+parser.add_argument('--overflow-policy', default='drop-oldest')
+parser.add_argument('--redis-socket-path', default=None)
+parser.add_argument('--session-id', default=None)
+parser.add_argument('--capture-mode', default='sleep')
+parser.add_argument('--settle-frames', type=int, default=3)
+parser.add_argument('--settle-timeout', type=int, default=2000)
+parser.add_argument('--image-height', type=int, default=1920,
+                    help="Height of the simulated screen in pixels.")
+parser.add_argument('--image-width', type=int, default=1080,
+                    help="Width of the simulated screen in pixels.")
+parser.add_argument('--tile-size', type=int, default=DEFAULT_TILE_SIZE,
+                    help="Edge length of the tiles of the simulated screen in pixels.")
+parser.add_argument('--latency-distribution', default=DEFAULT_LATENCY_DISTRIBUTION,
+                    choices=sorted(LATENCY_DISTRIBUTIONS.keys()),
+                    help="Distribution of the screenshot latencies.")
+parser.add_argument('--latency', type=float, default=100,
+                    help="Mean screenshot latency in milliseconds.")
+parser.add_argument('--latency-jitter', type=float, default=50,
+                    help="Standard deviation of the screenshot latency in milliseconds.")
+parser.add_argument('--screenshot-failure-rate', type=float, default=0.0,
+                    help="Probability of a screenshot failing and being retried.")
+parser.add_argument('--seed', type=int, default=None,
+                    help="Seed of the simulated screen, latencies and failures.")
+options = parser.parse_args()
+
+# Initialize the simulated connection client.
+client = SimulatedConnectionClient(
+    options.redis_port,
+    options.observation_delta,
+    redis_socket_path=options.redis_socket_path,
+    observation_codec=options.observation_codec,
+    observation_transport=options.observation_transport,
+    ring_path=options.ring_path or DEFAULT_RING_PATH,
+    buffer_backend=options.buffer_backend,
+    observation_capacity=options.observation_capacity,
+    overflow_policy=options.overflow_policy,
+    session_id=options.session_id,
+    capture_mode=options.capture_mode,
+    settle_frames=options.settle_frames,
+    settle_timeout=options.settle_timeout,
+    image_height=options.image_height,
+    image_width=options.image_width,
+    tile_size=options.tile_size,
+    latency_distribution=options.latency_distribution,
+    latency=options.latency,
+    latency_jitter=options.latency_jitter,
+    screenshot_failure_rate=options.screenshot_failure_rate,
+    seed=options.seed
+)
+
+
+def terminate_on_signal(signum, _):
+    client.shutdown()
+
+    # Graceful exit on sigterm since this is sent from parent process.
+    if signum == signal.SIGTERM:
+        sys.exit(0)
+    else:
+        sys.exit(1)
+
+
+# Gracefully exit on the SIGTERM signal. This is usually sent by the parent process.
+signal.signal(signal.SIGTERM, terminate_on_signal)
+
+# Start the simulated connection client.
+client.start()
@@ -0,0 +1,192 @@
+"""
+File that contains a procedurally generated screen standing in for the screen of a device, along with the snapshot
+object the observation codecs read it through. Unlike the rest of the device package, it runs on CPython only.
+"""
+
+import numpy as np
+import zlib
+
+from io import BytesIO
+from PIL import Image
+
+from eventobjects.action import GESTURE_DRAG, GESTURE_LONG_PRESS, GESTURE_SWIPE, GESTURE_TAP
+from eventobjects.observation import IMAGE_FORMAT_RAW_RGB
+
+# Default edge length in pixels of the tiles of a simulated screen.
+DEFAULT_TILE_SIZE = 96
+
+# Number of colors tiles cycle through.
+NUM_TILE_COLORS = 8
+
+
+class SimulatedSnapshot(object):
+    """
+    The SimulatedSnapshot exposes a frame of a SimulatedScreen to the observation codecs, like MonkeySnapshot does for
+    a screenshot of a device.
+    """
+
+    # Compression level of the fast png path, 1 being the fastest zlib supports.
+    FAST_PNG_COMPRESS_LEVEL = 1
+
+    # Every how many rows a row is hashed into the signature of the snapshot.
+    SIGNATURE_ROW_STRIDE = 4
+
+    def __init__(self, pixels):
+        """
+        Initialize the snapshot.
+        :param pixels: H x W x 3 uint8 np array of the frame, not modified afterwards.
+        """
+
+        self.pixels = pixels
+
+    def png_bytes(self, fast=False):
+        """
+        Encode the snapshot as png.
+        :param fast: flag to use the fastest compression setting.
+        :return: bytes of png encoded image.
+        """
+
+        output = BytesIO()
+        if fast:
+            Image.fromarray(self.pixels).save(output, format='PNG', compress_level=self.FAST_PNG_COMPRESS_LEVEL)
+        else:
+            Image.fromarray(self.pixels).save(output, format='PNG')
+
+        return output.getvalue()
+
+    def signature(self):
+        """
+        Compute a cheap digest of the snapshot, hashing every SIGNATURE_ROW_STRIDE-th row of pixels.
+        :return: 32 bit int, equal for identical snapshots.
+        """
+
+        return zlib.crc32(np.ascontiguousarray(self.pixels[::self.SIGNATURE_ROW_STRIDE]).data) & 0xFFFFFFFF
+
+    def raw_pixels(self):
+        """
+        :return: (raw pixel bytes, IMAGE_FORMAT_RAW_RGB, height, width) tuple.
+        """
+
+        height, width, _ = self.pixels.shape
+
+        return self.pixels.tobytes(), IMAGE_FORMAT_RAW_RGB, height, width
+
+
+class SimulatedScreen(object):
+    """
+    The SimulatedScreen renders a grid of colored tiles, randomly generated from a seed, that reacts to touches the way
+    a simple app would:
+      - a tap cycles the color of the tile under it,
+      - a long press clears the tile under it,
+      - a swipe scrolls the grid vertically by the rows swiped over, wrapping around,
+      - a drag moves the tile under its start to its end, clearing the start.
+    Resetting restores the generated grid. Frames are only rendered when the grid changes.
+    """
+
+    def __init__(self, height, width, tile_size=DEFAULT_TILE_SIZE, seed=None):
+        """
+        Initialize the screen.
+        :param height: height of the screen in pixels.
+        :param width: width of the screen in pixels.
+        :param tile_size: edge length of the tiles in pixels.
+        :param seed: seed of the generated grid, None for a random one.
+        """
+
+        assert height > 0 and width > 0, "The screen must be at least one pixel high and wide"
+        assert tile_size > 1, "Tiles must be at least two pixels wide"
+
+        self.height = height
+        self.width = width
+        self.tile_size = tile_size
+
+        random_state = np.random.RandomState(seed)
+
+        # Color 0 is the background of cleared tiles.
+        self.palette = random_state.randint(0, 256, size=(NUM_TILE_COLORS, 3)).astype(np.uint8)
+        self.palette[0] = 255
+
+        num_rows = -(-height // tile_size)
+        num_columns = -(-width // tile_size)
+        self.initial_tiles = random_state.randint(1, NUM_TILE_COLORS, size=(num_rows, num_columns))
+
+        self.tiles = None
+        self.pixels = None
+        self.reset()
+
+    def reset(self):
+        """
+        Restore the generated grid.
+        """
+
+        self.tiles = self.initial_tiles.copy()
+        self.render()
+
+    def render(self):
+        """
+        Render the grid into a new frame, with a dark line along the top and left edge of every tile. A new array is
+        allocated, so that snapshots of earlier frames stay unchanged.
+        """
+
+        tile_pixels = self.palette[self.tiles]
+        pixels = np.repeat(np.repeat(tile_pixels, self.tile_size, axis=0), self.tile_size, axis=1)
+        pixels = np.ascontiguousarray(pixels[:self.height, :self.width])
+
+        pixels[::self.tile_size] //= 4
+        pixels[:, ::self.tile_size] //= 4
+
+        self.pixels = pixels
+
+    def tile_at(self, coordinate):
+        """
+        :param coordinate: (x, y) coordinate in pixels, clipped to the screen.
+        :return: (row, column) tuple of the tile under the coordinate.
+        """
+
+        x = min(max(int(coordinate[0]), 0), self.width - 1)
+        y = min(max(int(coordinate[1]), 0), self.height - 1)
+
+        return y // self.tile_size, x // self.tile_size
+
+    def tap(self, coordinate):
+        tile = self.tile_at(coordinate)
+        self.tiles[tile] = self.tiles[tile] % (NUM_TILE_COLORS - 1) + 1
+        self.render()
+
+    def long_press(self, coordinate):
+        self.tiles[self.tile_at(coordinate)] = 0
+        self.render()
+
+    def swipe(self, start, end):
+        num_rows = self.tile_at(end)[0] - self.tile_at(start)[0]
+        if num_rows != 0:
+            self.tiles = np.roll(self.tiles, num_rows, axis=0)
+            self.render()
+
+    def drag(self, start, end):
+        start_tile, end_tile = self.tile_at(start), self.tile_at(end)
+        if start_tile != end_tile:
+            self.tiles[end_tile] = self.tiles[start_tile]
+            self.tiles[start_tile] = 0
+            self.render()
+
+    def take_gesture(self, gesture):
+        """
+        Apply a gesture to the screen. Waits leave it unchanged.
+        :param gesture: Gesture object.
+        """
+
+        if gesture.kind == GESTURE_TAP:
+            self.tap(gesture.start)
+        elif gesture.kind == GESTURE_SWIPE:
+            self.swipe(gesture.start, gesture.end)
+        elif gesture.kind == GESTURE_LONG_PRESS:
+            self.long_press(gesture.start)
+        elif gesture.kind == GESTURE_DRAG:
+            self.drag(gesture.start, gesture.end)
+
+    def snapshot(self):
+        """
+        :return: SimulatedSnapshot of the current frame.
+        """
+
+        return SimulatedSnapshot(self.pixels)
@@ -0,0 +1,107 @@
+"""
+File that contains the action modes of the environment. An action mode defines the action space agents act in and
+turns their actions into the Action objects sent to the device.
+"""
+
+import gym
+import numpy as np
+
+from eventobjects.action import Action, GESTURE_KINDS, Gesture
+
+# Default max duration in milliseconds of gestures in the gesture action mode.
+MAX_GESTURE_DURATION = 2000
+
+
+class TouchActionMode(object):
+    """
+    Every action is a single tap, given as its (x, y) coordinate.
+    """
+
+    def __init__(self, image_height, image_width):
+        """
+        Initialize the action mode.
+        :param image_height: height of the device screen in pixels.
+        :param image_width: width of the device screen in pixels.
+        """
+
+        # 2D continuous grid. Each action corresponds to a (x, y) touch.
+        self.action_space = gym.spaces.Box(
+            low=np.array([0.0, 0.0]),
+            high=np.array([image_width, image_height]),
+            dtype=np.float32
+        )
+
+    def to_action(self, action):
+        """
+        :param action: action from the action space.
+        :return: Action object.
+        """
+
+        return Action(tuple(action))
+
+
+class GestureActionMode(object):
+    """
+    Every action is a single gesture, given as (kind, start x, start y, end x, end y, duration in milliseconds). The
+    kind is rounded to the nearest of GESTURE_KINDS, so continuous agents can pick it too.
+    """
+
+    def __init__(self, image_height, image_width, max_duration=MAX_GESTURE_DURATION):
+        """
+        Initialize the action mode.
+        :param image_height: height of the device screen in pixels.
+        :param image_width: width of the device screen in pixels.
+        :param max_duration: max duration of a gesture in milliseconds.
+        """
+
+        self.action_space = gym.spaces.Box(
+            low=np.array([min(GESTURE_KINDS), 0.0, 0.0, 0.0, 0.0, 0.0]),
+            high=np.array([max(GESTURE_KINDS), image_width, image_height, image_width, image_height, max_duration]),
+            dtype=np.float32
+        )
+
+    def to_action(self, action):
+        """
+        :param action: action from the action space.
+        :return: Action object of a macro-action with a single gesture.
+        """
+
+        action = np.clip(action, self.action_space.low, self.action_space.high)
+        kind, start_x, start_y, end_x, end_y, duration = action
+
+        gesture = Gesture(int(np.rint(kind)), (start_x, start_y), (end_x, end_y), int(duration))
+
+        return Action(None, gestures=[gesture])
+
+
+class MacroActionMode(object):
+    """
+    Every action is the index of one of a fixed list of macro-actions, e.g. scrolling down a page or typing a PIN.
+    """
+
+    def __init__(self, macros):
+        """
+        Initialize the action mode.
+        :param macros: list of Action objects, either clicks or macro-actions.
+        """
+
+        assert len(macros) > 0, "At least one macro-action is required"
+
+        self.macros = macros
+        self.action_space = gym.spaces.Discrete(len(macros))
+
+    def to_action(self, action):
+        """
+        :param action: index of a macro-action.
+        :return: Action object.
+        """
+
+        return self.macros[int(action)]
+
+
+# Dict mapping from the name of an action mode to a function creating it for a screen of the given size. Macro-actions
+# depend on the app at hand, so MacroActionMode is created directly.
+ACTION_MODES = {
+    'touch': lambda image_height, image_width: TouchActionMode(image_height, image_width),
+    'gesture': lambda image_height, image_width: GestureActionMode(image_height, image_width)
+}
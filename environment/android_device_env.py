@@ -1,10 +1,13 @@
 import gym
-import numpy as np
 
 from abc import ABC
-from io import BytesIO
-from PIL import Image
+from collections import deque
 
+from buffers.async_buffer import AsyncBuffer, create_async_redis_client
+from environment.action_modes import TouchActionMode
+from environment.frame_pool import FramePool, ScratchBuffers
+from environment.observation_decoding import TileDeltaAssembler, decode_observation
+from environment.observation_preprocessing import ObservationPreprocessor
 from eventobjects.action import Action, RESET_ACTION
 
 
@@ -13,8 +16,22 @@ class AndroidDeviceEnv(gym.Env, ABC):
     The AndroidDeviceEnv implements the gym Env interface in order to interface
     with an Android device through the abstraction layers of the Action and Observation buffers.
 
-    Each action is defined in a continuous 2D space, specifically a down and up action on some 2D coordinate.
+    By default, each action is defined in a continuous 2D space, specifically a down and up action on some 2D
+    coordinate. Other action modes take swipes, long presses and sequences of gestures, which the device side runs in
+    one round trip, taking a single observation at the end.
     Each observation is a continuous RGB image.
+
+    Besides the gym step() and reset(), the environment provides async_step() and async_reset() coroutines, so one
+    event loop can drive many devices concurrently. Both share all logic other than the buffer I/O.
+
+    step() is split into step_async(), which sends an action, and step_wait(), which waits for its observation and
+    computes the reward. Several actions may be in flight at once, so that the agent works while the device does.
+    Actions are numbered with sequence ids that the device side stamps on the observations answering them, which
+    pairs each observation with its action and lets observations of actions sent before a reset be skipped.
+
+    Decoded observations that need their own pixels are written into the frames of a FramePool, so steady state
+    stepping allocates no new images. Observations returned by step() and reset() are therefore overwritten two
+    observations later; copy them to keep them around for longer.
     """
 
     metadata = {'render.modes': ['rgb_array']}
@@ -22,13 +39,18 @@ class AndroidDeviceEnv(gym.Env, ABC):
     # Predefined (RGB image)
     NUM_CHANNELS = 3
 
-    def __init__(self, action_buffer, observation_buffer, image_height, image_width):
+    def __init__(self, action_buffer, observation_buffer, image_height, image_width, preprocessor=None,
+                 action_mode=None):
         """
         Initialize the environment.
         :param action_buffer: ActionBuffer object that the environment should populate
         :param observation_buffer: ObservationBuffer object that the environment uses to gather image observations.
         :param image_height: height of the image observation in terms of num pixels
         :param image_width: width of the image observation in terms of num pixels
+        :param preprocessor: ObservationPreprocessor applied to observation images on ingest, None to use the full
+        device images. The observation space, rewards and rendering all refer to the preprocessed images.
+        :param action_mode: action mode defining the action space, e.g. a GestureActionMode or MacroActionMode. None
+        for single taps, i.e. a TouchActionMode.
         """
 
         super(AndroidDeviceEnv, self).__init__()
@@ -40,31 +62,131 @@ class AndroidDeviceEnv(gym.Env, ABC):
         # This is set to None initially. It is set in either the step() or reset() fn and is used during rendering.
         self.most_recent_observation = None
 
-        # 2D continuous grid. Each action corresponds to a (x, y) touch.
-        self.action_space = gym.spaces.Box(
-            low=np.array([0.0, 0.0]),
-            high=np.array([image_width, image_height]),
-            dtype=np.float32
-        )
+        # Time in seconds the screen of the newest observation took to settle, 0 if it was not measured.
+        self.most_recent_settle_time = 0.0
+
+        self.preprocessor = preprocessor or ObservationPreprocessor()
+
+        # Frame state for observations sent as tile deltas.
+        self.tile_delta_assembler = TileDeltaAssembler()
+
+        # AsyncBuffer counterparts of the buffers, created on first use by async_step() or async_reset().
+        self.async_action_buffer = None
+        self.async_observation_buffer = None
+
+        # Sequence id of the next action and the numbered actions in flight, oldest first. The connection client
+        # numbers its initial observation 0, so actions start at 1.
+        self.next_sequence_id = 1
+        self.pending_actions = deque()
+
+        # TrajectoryRecorder the resets and steps are written to, None to not record them.
+        self.trajectory_recorder = None
+
+        # Function called with every raw Observation read, e.g. to stream the screen, None to not pass them on. It is
+        # called by the step loop, so it must return quickly.
+        self.observation_callback = None
+
+        # Actions are in device coordinates, regardless of the preprocessing of observations.
+        self.action_mode = action_mode or TouchActionMode(image_height, image_width)
+        self.action_space = self.action_mode.action_space
 
         # H x W x C where C is number of channels.
-        self.observation_space = gym.spaces.Box(
-            low=0,
-            high=255,
-            shape=[image_height, image_width, self.NUM_CHANNELS],
-            dtype=np.uint8
-        )
+        self.observation_space = self.preprocessor.observation_space(image_height, image_width)
 
-    def step(self, action):
-        # Wrap the action from the action space into an Action object
-        action_buffer_elem = Action(tuple(action))
+        # Double buffer of the current and previous observations, and temporary arrays of reward computations.
+        self.frame_pool = FramePool(self.observation_space.shape, self.observation_space.dtype)
+        self.scratch_buffers = ScratchBuffers()
 
-        # Add the action into the action buffer
-        self.action_buffer.put_elem(action_buffer_elem)
+    def step(self, action):
+        self.step_async(action)
 
         # Get new observation once action has been taken.
         # This observation corresponds to the image once the action has been taken.
-        new_observation = self.get_new_observation()
+        return self.step_wait()
+
+    def step_async(self, action):
+        """
+        Send an action to the device without waiting for its observation. step_wait() completes the steps of the
+        actions in flight in the order they were sent.
+        :param action: action from the action space.
+        """
+
+        # Wrap the action from the action space into an Action object and add it into the action buffer
+        numbered_action = self.number_action(self.action_mode.to_action(action))
+        self.action_buffer.put_elem(numbered_action)
+
+        self.pending_actions.append(numbered_action)
+
+    def step_wait(self):
+        """
+        Wait for the observation answering the oldest action in flight and complete its step.
+        :return: (observation, reward, info) tuple as returned by step().
+        """
+
+        assert len(self.pending_actions) > 0, "No action in flight, call step_async() first"
+
+        action = self.pending_actions.popleft()
+
+        return self.complete_step(action, self.read_observation(action.sequence_id))
+
+    def complete_step(self, action, observation):
+        """
+        Complete the step of an action once its observation has arrived, and hand the observation to the trajectory
+        recorder and observation callback.
+        :param action: numbered Action object that was sent.
+        :param observation: Observation object answering the action.
+        :return: (observation, reward, info) tuple as returned by step().
+        """
+
+        new_observation, reward, info = self.finish_step(self.process_observation(observation))
+
+        if self.trajectory_recorder is not None:
+            self.trajectory_recorder.record_step(action, reward, observation)
+        if self.observation_callback is not None:
+            self.observation_callback(observation)
+
+        return new_observation, reward, info
+
+    def num_actions_in_flight(self):
+        """
+        :return: number of actions sent by step_async() whose steps step_wait() has not completed yet.
+        """
+
+        return len(self.pending_actions)
+
+    def number_action(self, action):
+        """
+        Number an action with the next sequence id.
+        :param action: Action object, which is left as is since e.g. macro-actions are shared between steps.
+        :return: Action object with a sequence id.
+        """
+
+        numbered_action = Action(action.click_coordinate, action.is_reset_action, action.gestures,
+                                 self.next_sequence_id)
+        self.next_sequence_id += 1
+
+        return numbered_action
+
+    async def async_step(self, action):
+        """
+        Coroutine counterpart of step(); waiting for the observation yields to other coroutines of the event loop.
+        :param action: action from the action space.
+        :return: (observation, reward, info) tuple as returned by step().
+        """
+
+        async_action_buffer, _ = self.get_async_buffers()
+
+        numbered_action = self.number_action(self.action_mode.to_action(action))
+        await async_action_buffer.put_elem(numbered_action)
+
+        return self.complete_step(numbered_action, await self.async_read_observation(numbered_action.sequence_id))
+
+    def finish_step(self, new_observation):
+        """
+        Complete a step once the new observation has arrived.
+        :param new_observation: np array containing the decoded new observation image (H x W x 3).
+        :return: (observation, reward, info) tuple.
+        """
 
         # Increment the num_steps counter
         self.num_steps += 1
@@ -76,26 +198,110 @@ class AndroidDeviceEnv(gym.Env, ABC):
         self.most_recent_observation = new_observation
 
         log_info = {
-            'num_steps': self.num_steps
+            'num_steps': self.num_steps,
+            'settle_time': self.most_recent_settle_time
         }
 
         return new_observation, reward_val, log_info
 
     def reset(self):
-        self.num_steps = 0
-
         # First clear all elements from the buffers
         self.action_buffer.clearall()
         self.observation_buffer.clearall()
 
         # Send a 'reset' action to the ActionBuffer so that the initial observation can be sent.
-        self.action_buffer.put_elem(RESET_ACTION)
+        reset_action = self.begin_reset()
+        self.action_buffer.put_elem(reset_action)
+
+        # Read initial response, skipping observations of actions that were in flight when the buffers were cleared.
+        return self.complete_reset(self.read_observation(reset_action.sequence_id))
+
+    async def async_reset(self):
+        """
+        Coroutine counterpart of reset().
+        :return: np array containing the initial observation image (H x W x 3).
+        """
+
+        async_action_buffer, async_observation_buffer = self.get_async_buffers()
+
+        await async_action_buffer.clearall()
+        await async_observation_buffer.clearall()
+
+        reset_action = self.begin_reset()
+        await async_action_buffer.put_elem(reset_action)
 
-        # Read initial response
-        self.most_recent_observation = self.get_new_observation()
+        return self.complete_reset(await self.async_read_observation(reset_action.sequence_id))
+
+    def begin_reset(self):
+        """
+        Reset the episode state once the buffers have been cleared.
+        :return: numbered reset Action object to send.
+        """
+
+        self.reset_state()
+
+        return self.number_action(RESET_ACTION)
+
+    def complete_reset(self, observation):
+        """
+        Complete a reset once the initial observation has arrived, and hand the observation to the trajectory recorder
+        and observation callback.
+        :param observation: Observation object answering the reset action.
+        :return: np array containing the initial observation image (H x W x 3).
+        """
+
+        if self.trajectory_recorder is not None:
+            self.trajectory_recorder.record_reset(observation)
+        if self.observation_callback is not None:
+            self.observation_callback(observation)
+
+        return self.finish_reset(self.process_observation(observation))
+
+    def reset_state(self):
+        """
+        Reset the episode state of the environment, once its buffers have been cleared.
+        """
+
+        self.num_steps = 0
+        self.pending_actions.clear()
+        self.tile_delta_assembler.reset()
+
+    def finish_reset(self, initial_observation):
+        """
+        Complete a reset once the initial observation has arrived.
+        :param initial_observation: np array containing the decoded initial observation image (H x W x 3).
+        :return: initial_observation.
+        """
+
+        self.most_recent_observation = initial_observation
 
         return self.most_recent_observation
 
+    def get_async_buffers(self):
+        """
+        Retrieve the AsyncBuffer counterparts of the action and observation buffers, creating them on first use. They
+        share a redis.asyncio client connected to the server of the action buffer.
+        :return: (AsyncBuffer, AsyncBuffer) tuple of the action and observation buffers.
+        """
+
+        if self.async_action_buffer is None:
+            async_redis_client = create_async_redis_client(self.action_buffer.redis_client)
+            self.async_action_buffer = AsyncBuffer(self.action_buffer, async_redis_client)
+            self.async_observation_buffer = AsyncBuffer(self.observation_buffer, async_redis_client)
+
+        return self.async_action_buffer, self.async_observation_buffer
+
+    async def aclose(self):
+        """
+        Close the asyncio redis client of the AsyncBuffers, if they have been created. The sync buffers are left open.
+        """
+
+        if self.async_action_buffer is not None:
+            # Both buffers share the client.
+            await self.async_action_buffer.aclose()
+            self.async_action_buffer = None
+            self.async_observation_buffer = None
+
     def render(self, mode='human'):
         if self.most_recent_observation is None:
             raise Exception("most_recent_observation has not been set to a valid image. " +
@@ -105,17 +311,91 @@ class AndroidDeviceEnv(gym.Env, ABC):
         else:
             super(AndroidDeviceEnv, self).render(mode=mode)  # just raise an exception for invalid mode
 
-    def get_new_observation(self):
+    def get_new_observation(self, sequence_id=None):
         """
         Gather the observation object from the observation buffer and decode the image into a numpy array
-        that aligns with the observation space.
+        that aligns with the observation space. Tile delta observations are assembled in place, see
+        TileDeltaAssembler.
+        :param sequence_id: sequence id of the action the observation answers. Observations of earlier actions are
+        skipped. None to take the next observation, whatever it answers.
         :return: np array containing the image (H x W x 3).
         """
 
+        return self.process_observation(self.read_observation(sequence_id))
+
+    def read_observation(self, sequence_id=None):
+        """
+        Gather the observation object answering an action from the observation buffer.
+        :param sequence_id: sequence id of the action the observation answers. Observations of earlier actions are
+        skipped. None to take the next observation, whatever it answers.
+        :return: Observation object.
+        """
+
         # Blocking read from the observation buffer.
         observation = self.observation_buffer.blocking_read_elem()
+        while not self.answers_action(observation, sequence_id):
+            observation = self.observation_buffer.blocking_read_elem()
+
+        return observation
+
+    async def async_read_observation(self, sequence_id=None):
+        """
+        Coroutine counterpart of read_observation().
+        :param sequence_id: sequence id of the action the observation answers, None to take the next observation.
+        :return: Observation object.
+        """
+
+        _, async_observation_buffer = self.get_async_buffers()
+
+        observation = await async_observation_buffer.blocking_read_elem()
+        while not self.answers_action(observation, sequence_id):
+            observation = await async_observation_buffer.blocking_read_elem()
+
+        return observation
+
+    @staticmethod
+    def answers_action(observation, sequence_id):
+        """
+        Check whether an observation answers an action, or is a leftover of an earlier one to skip.
+        :param observation: Observation object.
+        :param sequence_id: sequence id of the action, None to accept any observation.
+        :return: True if the observation answers the action, False if it answers an earlier action.
+        """
+
+        if sequence_id is None or observation.step_id == sequence_id:
+            return True
+
+        if observation.step_id > sequence_id:
+            raise Exception("Observation of action {} was dropped by the observation buffer; pipelined actions need "
+                            "an unbounded buffer or the block overflow policy".format(sequence_id))
+
+        return False
+
+    def process_observation(self, observation):
+        """
+        Decode and preprocess the image of an observation into the next frame of the frame pool, keeping the frame
+        state of tile deltas.
+        :param observation: Observation object.
+        :return: np array containing the image, matching the observation space.
+        """
 
-        return AndroidDeviceEnv.process_image_from_observation(observation)
+        self.most_recent_settle_time = observation.settle_time
+
+        return self.process_image_from_observation(observation, self.preprocessor, self.tile_delta_assembler,
+                                                   self.frame_pool.acquire())
+
+    def changed_regions(self):
+        """
+        Retrieve the regions of the newest observation that differ from most_recent_observation. Outside of them the
+        two images are identical, so rewards can skip everything else.
+        :return: list of (row slice, column slice) tuples, or None if unknown, i.e. the whole image may have changed.
+        """
+
+        # Regions are tracked in full device coordinates only.
+        if not self.preprocessor.is_identity():
+            return None
+
+        return self.tile_delta_assembler.changed_regions()
 
     def compute_reward(self, new_observation):
         """
@@ -132,16 +412,18 @@ class AndroidDeviceEnv(gym.Env, ABC):
         raise NotImplementedError
 
     @staticmethod
-    def process_image_from_observation(observation):
+    def process_image_from_observation(observation, preprocessor=None, tile_delta_assembler=None, out=None):
         """
-        Helper static method to process an image from an observation to a numpy array
+        Helper static method to process an image from an observation to a numpy array. Decoding is dispatched on the
+        image format of the observation; raw formats are returned as read-only views without copying.
         :param observation: Observation object
-        :return: numpy array of an RGB image contained in the observation
+        :param preprocessor: ObservationPreprocessor to apply, None for the full RGB image.
+        :param tile_delta_assembler: TileDeltaAssembler holding the frame state for tile delta observations.
+        :param out: numpy array matching the processed image to decode into, None to allocate one if needed.
+        :return: numpy array of the image contained in the observation
         """
 
-        # Decode image bytes into a numpy array.
-        pil_image = Image.open(BytesIO(observation.image_bytes)).convert('RGB')
-
-        image_arr = np.array(pil_image)
+        if preprocessor is None:
+            return decode_observation(observation, tile_delta_assembler, out)
 
-        return image_arr
+        return preprocessor.process(observation, tile_delta_assembler, out)
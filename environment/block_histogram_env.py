@@ -0,0 +1,32 @@
+from environment.image_feature_env import ImageFeatureEnv
+from environment.reward_kernels import block_histograms, fitting_stride, histogram_cell_offsets, histogram_distance, \
+    luma
+
+
+class BlockHistogramEnv(ImageFeatureEnv):
+    """
+    Rewards the change of the intensity distribution within the cells of a GRID_SIZE x GRID_SIZE grid over the screen,
+    as the mean total variation distance between the cell histograms. Unlike pixel differences, it ignores content that
+    moves within a cell, e.g. an animated spinner, and is in [0, 1].
+    """
+
+    GRID_SIZE = 4
+    NUM_BINS = 16
+    SAMPLE_STRIDE = 8
+
+    def __init__(self, *args, **kwargs):
+        super(BlockHistogramEnv, self).__init__(*args, **kwargs)
+
+        # Histogram offsets of the sampled pixels, computed for the first observation.
+        self.cell_offsets = None
+
+    def compute_features(self, observation):
+        gray = luma(observation, fitting_stride(observation, self.SAMPLE_STRIDE, self.GRID_SIZE))
+
+        if self.cell_offsets is None or self.cell_offsets.shape != gray.shape:
+            self.cell_offsets = histogram_cell_offsets(gray.shape[0], gray.shape[1], self.GRID_SIZE, self.NUM_BINS)
+
+        return block_histograms(gray, self.cell_offsets, self.GRID_SIZE, self.NUM_BINS)
+
+    def feature_distance(self, old_features, new_features):
+        return histogram_distance(old_features, new_features)
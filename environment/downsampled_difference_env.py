@@ -0,0 +1,29 @@
+from environment.android_device_env import AndroidDeviceEnv
+from environment.reward_kernels import difference_dtype, sampled_absolute_difference, sum_of_values
+
+
+class DownsampledDifferenceEnv(AndroidDeviceEnv):
+    """
+    Rewards the mean absolute pixel difference over a grid of pixels sampled every SAMPLE_STRIDE rows and columns, a
+    cheap estimate of the mean pixel difference over the whole screen.
+    """
+
+    SAMPLE_STRIDE = 8
+
+    def compute_reward(self, new_observation):
+        """
+        Computes the average pixel difference between the sampled pixels of the current and new observations.
+        :param new_observation: numpy array containing the new screen image (H x W x C).
+        :return: float reward value.
+        """
+
+        height, width, num_channels = new_observation[::self.SAMPLE_STRIDE, ::self.SAMPLE_STRIDE].shape
+
+        dtype = difference_dtype(new_observation, self.most_recent_observation)
+        image_diff = self.scratch_buffers.get('sampled_diff', (num_channels, height, width), dtype)
+        scratch = self.scratch_buffers.get('sampled_diff_scratch', (num_channels, height, width), dtype)
+
+        sampled_absolute_difference(new_observation, self.most_recent_observation, self.SAMPLE_STRIDE, image_diff,
+                                    scratch)
+
+        return sum_of_values(image_diff) / image_diff.size
@@ -2,15 +2,23 @@
 File that contains any environments that can be used.
 """
 
+from environment.block_histogram_env import BlockHistogramEnv
+from environment.downsampled_difference_env import DownsampledDifferenceEnv
 from environment.mean_pixel_difference_env import MeanPixelDifferenceEnv
+from environment.perceptual_hash_env import PerceptualHashEnv
+from environment.ssim_env import SsimEnv
 
 
 def create_environment_instance_fn(cls):
-    return lambda action_buffer, observation_buffer, image_height, image_width: \
-        cls(action_buffer, observation_buffer, image_height, image_width)
+    return lambda action_buffer, observation_buffer, image_height, image_width, **kwargs: \
+        cls(action_buffer, observation_buffer, image_height, image_width, **kwargs)
 
 
 # Dict mapping from environment name to a function that creates an instance of that environment.
 ENVIRONMENTS = {
-    'MeanPixelDifferenceEnv': create_environment_instance_fn(MeanPixelDifferenceEnv)
+    'MeanPixelDifferenceEnv': create_environment_instance_fn(MeanPixelDifferenceEnv),
+    'DownsampledDifferenceEnv': create_environment_instance_fn(DownsampledDifferenceEnv),
+    'BlockHistogramEnv': create_environment_instance_fn(BlockHistogramEnv),
+    'PerceptualHashEnv': create_environment_instance_fn(PerceptualHashEnv),
+    'SsimEnv': create_environment_instance_fn(SsimEnv)
 }
@@ -0,0 +1,74 @@
+"""
+File that contains the pool of preallocated frames observations are decoded into, so that steady state stepping does
+not allocate a new image per observation.
+"""
+
+import numpy as np
+
+
+class FramePool(object):
+    """
+    The FramePool hands out a fixed ring of preallocated frames in turn.
+
+    With the default two frames, the pool is a double buffer: the frame handed out for the previous observation stays
+    intact while the next one is decoded, so rewards can compare the two, and swapping current and previous frames is
+    a matter of handing out the other one. As a consequence, a frame is overwritten num_frames acquisitions later;
+    copy it to keep it around for longer.
+
+    The frames are the slices of a single (num_frames x ...) array, so several of them can be gathered in one go, see
+    FrameStackWrapper.
+    """
+
+    def __init__(self, shape, dtype=np.uint8, num_frames=2):
+        """
+        Initialize the pool.
+        :param shape: shape of the frames.
+        :param dtype: dtype of the frames.
+        :param num_frames: number of frames in the ring, at least 2.
+        """
+
+        assert num_frames >= 2, "A frame pool needs at least 2 frames"
+
+        self.storage = np.zeros((num_frames,) + tuple(shape), dtype=dtype)
+        self.frames = list(self.storage)
+        self.current = 0
+
+        # Total number of frames handed out so far.
+        self.num_acquired = 0
+
+    def acquire(self):
+        """
+        Retrieve the next frame of the ring to decode into.
+        :return: numpy array whose content is undefined.
+        """
+
+        self.current = (self.current + 1) % len(self.frames)
+        self.num_acquired += 1
+
+        return self.frames[self.current]
+
+
+class ScratchBuffers(object):
+    """
+    The ScratchBuffers hold temporary arrays reused across calls, e.g. by reward computations, allocating each one on
+    first use only and again whenever its shape or dtype changes.
+    """
+
+    def __init__(self):
+        self.buffers = dict()
+
+    def get(self, name, shape, dtype):
+        """
+        Retrieve the scratch array of a name.
+        :param name: name of the scratch array.
+        :param shape: shape of the array.
+        :param dtype: dtype of the array.
+        :return: numpy array whose content is undefined.
+        """
+
+        buffer = self.buffers.get(name)
+        if buffer is None or buffer.shape != tuple(shape) or buffer.dtype != dtype:
+            buffer = np.empty(shape, dtype=dtype)
+            self.buffers[name] = buffer
+
+        return buffer
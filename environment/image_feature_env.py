@@ -0,0 +1,51 @@
+from abc import ABC
+
+from environment.android_device_env import AndroidDeviceEnv
+
+
+class ImageFeatureEnv(AndroidDeviceEnv, ABC):
+    """
+    The ImageFeatureEnv rewards the distance between features of successive observations, e.g. hashes or histograms.
+
+    The features of each observation are computed once and kept for the next step, rather than being recomputed from
+    the previous observation. Rewards therefore have to be computed once per step, in order.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super(ImageFeatureEnv, self).__init__(*args, **kwargs)
+
+        # Features of most_recent_observation, None if not computed yet.
+        self.most_recent_features = None
+
+    def reset_state(self):
+        super(ImageFeatureEnv, self).reset_state()
+        self.most_recent_features = None
+
+    def compute_reward(self, new_observation):
+        if self.most_recent_features is None:
+            self.most_recent_features = self.compute_features(self.most_recent_observation)
+
+        new_features = self.compute_features(new_observation)
+        reward = self.feature_distance(self.most_recent_features, new_features)
+        self.most_recent_features = new_features
+
+        return reward
+
+    def compute_features(self, observation):
+        """
+        Compute the features of an observation.
+        :param observation: numpy array containing the screen image (H x W x C).
+        :return: features in any form feature_distance() accepts.
+        """
+
+        raise NotImplementedError
+
+    def feature_distance(self, old_features, new_features):
+        """
+        Compute the distance between the features of two observations.
+        :param old_features: features of the previous observation.
+        :param new_features: features of the new observation.
+        :return: float reward value.
+        """
+
+        raise NotImplementedError
@@ -1,6 +1,5 @@
-import numpy as np
-
 from environment.android_device_env import AndroidDeviceEnv
+from environment.reward_kernels import absolute_difference, difference_dtype, sum_of_values
 
 
 class MeanPixelDifferenceEnv(AndroidDeviceEnv):
@@ -9,11 +8,30 @@ class MeanPixelDifferenceEnv(AndroidDeviceEnv):
         Computes the average pixel difference between the current and new observations.
         Agent learns to click on the screen so that there are visual changes going on.
 
+        When the changed regions are known, unchanged regions contribute zero and are skipped entirely.
+        The difference is computed in preallocated scratch buffers, so no temporary images are allocated per step.
+        uint8 images are differenced in uint8 without wrapping around and summed exactly in integers.
+
         :param new_observation: numpy array containing the new screen image (H x W x C) where C is the number of
         channels (C = 3 for RGB).
         :return: float reward value.
         """
 
-        image_diff = np.absolute(new_observation - self.most_recent_observation)
+        changed_regions = self.changed_regions()
+
+        dtype = difference_dtype(new_observation, self.most_recent_observation)
+        image_diff = self.scratch_buffers.get('image_diff', new_observation.shape, dtype)
+        scratch = self.scratch_buffers.get('image_diff_scratch', new_observation.shape, dtype)
+
+        if changed_regions is None:
+            absolute_difference(new_observation, self.most_recent_observation, image_diff, scratch)
+
+            return sum_of_values(image_diff) / new_observation.size
+
+        total_diff = 0
+        for rows, cols in changed_regions:
+            region_diff = absolute_difference(new_observation[rows, cols], self.most_recent_observation[rows, cols],
+                                              image_diff[rows, cols], scratch[rows, cols])
+            total_diff += sum_of_values(region_diff)
 
-        return np.mean(image_diff)
+        return total_diff / new_observation.size
@@ -0,0 +1,278 @@
+"""
+File that contains the decoders turning Observation payloads into numpy RGB images, one per image format.
+"""
+
+import numpy as np
+import struct
+import zlib
+
+from io import BytesIO
+from PIL import Image
+
+from eventobjects.observation import COMPRESSION_LZ4, COMPRESSION_NONE, COMPRESSION_ZLIB, IMAGE_FORMAT_PNG, \
+    IMAGE_FORMAT_RAW_ARGB, IMAGE_FORMAT_RAW_RGB, IMAGE_FORMAT_RAW_RGBA, IMAGE_FORMAT_TILE_DELTA, RAW_CHANNELS, \
+    TILE_DELTA_FLAG_KEYFRAME, TILE_DELTA_FRAME_NUMBER_MODULUS, TILE_DELTA_HEADER_FORMAT, TILE_DELTA_HEADER_SIZE, \
+    tile_grid_shape
+
+try:
+    import lz4.frame as lz4_frame
+except ImportError:
+    lz4_frame = None
+
+# Slice selecting the R, G, B channels out of the pixel channels of each raw image format.
+RGB_CHANNELS = {
+    IMAGE_FORMAT_RAW_RGB: slice(0, 3),
+    IMAGE_FORMAT_RAW_RGBA: slice(0, 3),
+    IMAGE_FORMAT_RAW_ARGB: slice(1, 4)
+}
+
+# Max size in bytes of the pieces zlib compressed raw images are decompressed in when decoding into a given array.
+DECOMPRESSION_CHUNK_SIZE = 256 * 1024
+
+
+def decompress_lz4(payload):
+    if lz4_frame is None:
+        raise Exception("Observation is lz4 compressed but the lz4 package is not installed.")
+
+    return lz4_frame.decompress(payload)
+
+
+def decode_png(payload, _, __, out=None):
+    """
+    Decode a PNG image.
+    :param payload: PNG encoded image.
+    :param out: numpy array (H x W x 3) to decode into, None or one of another shape to allocate a new array.
+    :return: numpy array of the RGB image (H x W x 3).
+    """
+
+    image = Image.open(BytesIO(payload))
+    if image.mode not in ('RGB', 'RGBA'):
+        image = image.convert('RGB')
+
+    if out is None or out.shape != (image.height, image.width, 3):
+        return np.array(image.convert('RGB'))
+
+    # Dropping the alpha channel on the way into out saves the converted copy of the image.
+    out[...] = np.asarray(image)[:, :, :3]
+
+    return out
+
+
+def raw_decoder(image_format):
+    """
+    Create a decoder for raw pixels. The returned image is a read-only view on the payload, no pixels are copied.
+    :param image_format: one of the raw IMAGE_FORMAT_* constants.
+    :return: function decoding (payload, height, width, out=None) into an H x W x 3 numpy array. Since no pixels are
+    copied, out is not used.
+    """
+
+    num_channels = RAW_CHANNELS[image_format]
+    rgb_channels = RGB_CHANNELS[image_format]
+
+    return lambda payload, height, width, out=None: \
+        np.frombuffer(payload, dtype=np.uint8).reshape(height, width, num_channels)[:, :, rgb_channels]
+
+
+def decompress_raw_into(payload, image_format, out):
+    """
+    Decompress zlib compressed raw pixels straight into an array, a few rows at a time, so neither the decompressed
+    image nor copies of the compressed payload are ever held in full.
+    :param payload: zlib compressed raw pixels.
+    :param image_format: one of the raw IMAGE_FORMAT_* constants.
+    :param out: numpy array (H x W x 3) to decode into.
+    :return: out.
+    """
+
+    height, width, _ = out.shape
+    num_channels = RAW_CHANNELS[image_format]
+    rgb_channels = RGB_CHANNELS[image_format]
+
+    row_size = width * num_channels
+    rows_per_chunk = max(1, DECOMPRESSION_CHUNK_SIZE // row_size)
+
+    # Rows are gathered in a staging buffer, since decompressed pieces do not end on row boundaries.
+    staging = np.empty(rows_per_chunk * row_size, dtype=np.uint8)
+    num_staged = 0
+    row = 0
+
+    decompressor = zlib.decompressobj()
+    payload = memoryview(payload)
+    for offset in range(0, len(payload), DECOMPRESSION_CHUNK_SIZE):
+        # Feeding the payload in pieces bounds the unconsumed input zlib copies out when the output is capped.
+        data = payload[offset:offset + DECOMPRESSION_CHUNK_SIZE]
+
+        while data and row < height:
+            num_rows = min(rows_per_chunk, height - row)
+            piece = decompressor.decompress(data, num_rows * row_size - num_staged)
+            data = decompressor.unconsumed_tail
+
+            staging[num_staged:num_staged + len(piece)] = np.frombuffer(piece, dtype=np.uint8)
+            num_staged += len(piece)
+
+            if num_staged == num_rows * row_size:
+                out[row:row + num_rows] = staging[:num_staged].reshape(num_rows, width, num_channels)[
+                    :, :, rgb_channels]
+                row += num_rows
+                num_staged = 0
+
+    if row < height:
+        raise Exception("Raw observation payload is shorter than its {}x{} image.".format(height, width))
+
+    return out
+
+
+class TileDeltaAssembler(object):
+    """
+    The TileDeltaAssembler rebuilds full frames from tile delta observations.
+
+    Frames are assembled in place in two persistent arrays that take turns: the frame returned for the previous
+    observation stays intact while the next one is assembled, so rewards can compare the two. As a consequence, a
+    returned frame is overwritten two observations later.
+
+    A delta is only applied on top of the frame it builds on, i.e. the frame numbered right before it. A delta whose
+    preceding frame never arrived, e.g. as it was evicted from a bounded observation buffer, is rejected.
+    """
+
+    def __init__(self):
+        self.frames = None
+        self.current = 0
+        self.tile_size = None
+
+        # Frame number of the current frame, None without frame state.
+        self.frame_number = None
+
+        # Boolean (tile rows x tile columns) mask of the tiles that changed with the most recent observation.
+        self.changed_tile_mask = None
+
+    def reset(self):
+        """
+        Drop all frame state; the next observation has to be a keyframe.
+        """
+
+        self.frames = None
+        self.changed_tile_mask = None
+        self.frame_number = None
+
+    def tile_slices(self, tile_index):
+        """
+        Retrieve the pixel region covered by a tile.
+        :param tile_index: row-major index of the tile.
+        :return: (row slice, column slice) tuple.
+        """
+
+        tile_row, tile_col = divmod(tile_index, self.changed_tile_mask.shape[1])
+
+        return slice(tile_row * self.tile_size, (tile_row + 1) * self.tile_size), \
+            slice(tile_col * self.tile_size, (tile_col + 1) * self.tile_size)
+
+    def assemble(self, payload, height, width):
+        """
+        Apply a tile delta payload on top of the current frame.
+        :param payload: decompressed tile delta payload.
+        :param height: height of the frame in pixels.
+        :param width: width of the frame in pixels.
+        :return: numpy array of the assembled RGB frame (H x W x 3).
+        """
+
+        image_format, flags, tile_size, num_tiles, frame_number = \
+            struct.unpack_from(TILE_DELTA_HEADER_FORMAT, payload, 0)
+        tile_indices = np.frombuffer(payload, dtype='>u4', count=num_tiles, offset=TILE_DELTA_HEADER_SIZE)
+
+        is_keyframe = flags & TILE_DELTA_FLAG_KEYFRAME
+        if not is_keyframe and (self.frames is None or self.frames[0].shape[:2] != (height, width)):
+            raise Exception("Tile delta observation received without a preceding keyframe.")
+        if not is_keyframe and (self.frame_number + 1) % TILE_DELTA_FRAME_NUMBER_MODULUS != frame_number:
+            raise Exception("Tile delta observation of frame {} does not build on frame {}, the frames in between "
+                            "were dropped; tile delta codecs need an observation buffer that does not evict "
+                            "observations".format(frame_number, self.frame_number))
+        self.frame_number = frame_number
+
+        if self.frames is None or self.frames[0].shape[:2] != (height, width):
+            self.frames = [np.zeros((height, width, 3), dtype=np.uint8) for _ in range(2)]
+
+        previous_frame = self.frames[self.current]
+        self.current = 1 - self.current
+        frame = self.frames[self.current]
+
+        # Bring the frame up to date with the previous one by copying the tiles that changed last time.
+        if not is_keyframe and self.changed_tile_mask is not None:
+            for tile_index in np.flatnonzero(self.changed_tile_mask):
+                rows, cols = self.tile_slices(tile_index)
+                frame[rows, cols] = previous_frame[rows, cols]
+
+        self.tile_size = tile_size
+        self.changed_tile_mask = np.zeros(tile_grid_shape(height, width, tile_size), dtype=np.bool_)
+        self.changed_tile_mask.flat[tile_indices] = True
+
+        num_channels = RAW_CHANNELS[image_format]
+        rgb_channels = RGB_CHANNELS[image_format]
+        offset = TILE_DELTA_HEADER_SIZE + 4 * num_tiles
+        for tile_index in tile_indices:
+            rows, cols = self.tile_slices(tile_index)
+            tile_height = min(rows.stop, height) - rows.start
+            tile_width = min(cols.stop, width) - cols.start
+            tile_size_bytes = tile_height * tile_width * num_channels
+
+            tile = np.frombuffer(payload, dtype=np.uint8, count=tile_size_bytes, offset=offset)
+            frame[rows, cols] = tile.reshape(tile_height, tile_width, num_channels)[:, :, rgb_channels]
+            offset += tile_size_bytes
+
+        return frame
+
+    def changed_regions(self):
+        """
+        Retrieve the pixel regions that changed with the most recent observation.
+        :return: list of (row slice, column slice) tuples, or None if the most recent observation was not a delta.
+        """
+
+        if self.changed_tile_mask is None:
+            return None
+
+        return [self.tile_slices(tile_index) for tile_index in np.flatnonzero(self.changed_tile_mask)]
+
+
+# Dict mapping from compression to a function returning the decompressed payload.
+DECOMPRESSORS = {
+    COMPRESSION_NONE: lambda payload: payload,
+    COMPRESSION_ZLIB: zlib.decompress,
+    COMPRESSION_LZ4: decompress_lz4
+}
+
+# Dict mapping from image format to a function decoding (payload, height, width, out=None) into an H x W x 3 numpy
+# array. Decoders that materialize pixels decode into out when it is given and of the right shape.
+DECODERS = {
+    IMAGE_FORMAT_PNG: decode_png,
+    IMAGE_FORMAT_RAW_RGB: raw_decoder(IMAGE_FORMAT_RAW_RGB),
+    IMAGE_FORMAT_RAW_RGBA: raw_decoder(IMAGE_FORMAT_RAW_RGBA),
+    IMAGE_FORMAT_RAW_ARGB: raw_decoder(IMAGE_FORMAT_RAW_ARGB)
+}
+
+
+def decode_observation(observation, tile_delta_assembler=None, out=None):
+    """
+    Decode the image carried by an observation.
+    :param observation: Observation object
+    :param tile_delta_assembler: TileDeltaAssembler holding the frame state for tile delta observations. If None, only
+    keyframes can be decoded. Its changed tile mask is cleared when the observation is not a tile delta.
+    :param out: numpy array (H x W x 3) to decode into, e.g. a frame of a FramePool. It is not used by raw images,
+    which are returned as views on the payload, nor by tile deltas, which are assembled in place.
+    :return: numpy array of an RGB image (H x W x 3), which is out if the image was decoded into it.
+    """
+
+    if observation.image_format in RGB_CHANNELS and observation.compression == COMPRESSION_ZLIB and \
+            out is not None and out.shape == (observation.height, observation.width, 3):
+        if tile_delta_assembler is not None:
+            tile_delta_assembler.reset()
+        return decompress_raw_into(observation.image_bytes, observation.image_format, out)
+
+    payload = DECOMPRESSORS[observation.compression](observation.image_bytes)
+
+    if observation.image_format == IMAGE_FORMAT_TILE_DELTA:
+        if tile_delta_assembler is None:
+            tile_delta_assembler = TileDeltaAssembler()
+        return tile_delta_assembler.assemble(payload, observation.height, observation.width)
+
+    if tile_delta_assembler is not None:
+        tile_delta_assembler.reset()
+
+    return DECODERS[observation.image_format](payload, observation.height, observation.width, out)
@@ -0,0 +1,193 @@
+"""
+File that contains the preprocessing applied to observation images on ingest, so that rewards, agents and recordings
+work on the reduced frames the agents consume instead of the full device resolution.
+"""
+
+import gym
+import numpy as np
+
+from io import BytesIO
+from PIL import Image
+
+from environment.observation_decoding import DECOMPRESSORS, decode_observation
+from eventobjects.observation import IMAGE_FORMAT_PNG
+
+# Supported dtypes of preprocessed images. Values stay in the [0, 255] range for all of them.
+DTYPES = {
+    'uint8': np.uint8,
+    'float32': np.float32
+}
+
+# Weights of the R, G, B channels in the luma of a grayscale image (ITU-R 601-2), as used by PIL.
+LUMA_WEIGHTS = np.array([0.299, 0.587, 0.114])
+
+
+class ObservationPreprocessor(object):
+    """
+    The ObservationPreprocessor turns an observation into the image agents consume. In order, it
+      1. crops the image to a box, e.g. to drop the status bar,
+      2. shrinks it by an integer factor, averaging each factor x factor block of pixels,
+      3. converts it to grayscale, keeping a single channel,
+      4. casts it to the requested dtype.
+
+    Raw payloads are cropped and reduced straight from a strided view on the payload, so their full size frame is
+    never materialized. PNG images are still decoded in full by PIL, which cannot reduce PNG while decoding, and are
+    cropped and reduced afterwards; only the reduced image is converted into an array. Rows and columns that do not
+    fill a whole block at the bottom and right edges of the crop box are dropped.
+    """
+
+    def __init__(self, crop_box=None, resize_factor=1, grayscale=False, dtype='uint8'):
+        """
+        Initialize the preprocessor.
+        :param crop_box: (left, top, right, bottom) pixel box to keep, None to keep the whole image.
+        :param resize_factor: integer factor the height and width are divided by.
+        :param grayscale: whether to convert the image to grayscale.
+        :param dtype: name of the dtype in DTYPES of the preprocessed image.
+        """
+
+        assert crop_box is None or len(crop_box) == 4, "Crop box must be (left, top, right, bottom)"
+        assert type(resize_factor) == int and resize_factor >= 1, "Resize factor must be a positive integer"
+        assert dtype in DTYPES, "{} is not a valid dtype".format(dtype)
+
+        self.crop_box = None if crop_box is None else tuple(crop_box)
+        self.resize_factor = resize_factor
+        self.grayscale = grayscale
+        self.dtype = DTYPES[dtype]
+
+    def is_identity(self):
+        """
+        Check whether the preprocessor leaves images as they are.
+        :return: True if images are not changed.
+        """
+
+        return self.crop_box is None and self.resize_factor == 1 and not self.grayscale and self.dtype == np.uint8
+
+    def output_box(self, image_height, image_width):
+        """
+        Compute the box of the full image covered by the preprocessed image.
+        :param image_height: height of the full image in pixels.
+        :param image_width: width of the full image in pixels.
+        :return: (left, top, right, bottom) box whose sides are multiples of the resize factor.
+        """
+
+        left, top, right, bottom = self.crop_box or (0, 0, image_width, image_height)
+        assert 0 <= left < right <= image_width and 0 <= top < bottom <= image_height, \
+            "Crop box {} does not fit a {}x{} image".format(self.crop_box, image_height, image_width)
+
+        right -= (right - left) % self.resize_factor
+        bottom -= (bottom - top) % self.resize_factor
+        assert right > left and bottom > top, "Crop box is smaller than the resize factor"
+
+        return left, top, right, bottom
+
+    def output_shape(self, image_height, image_width):
+        """
+        Compute the shape of preprocessed images.
+        :param image_height: height of the full image in pixels.
+        :param image_width: width of the full image in pixels.
+        :return: (H, W, C) shape tuple.
+        """
+
+        left, top, right, bottom = self.output_box(image_height, image_width)
+
+        return (
+            (bottom - top) // self.resize_factor,
+            (right - left) // self.resize_factor,
+            1 if self.grayscale else 3
+        )
+
+    def observation_space(self, image_height, image_width):
+        """
+        Create the observation space of preprocessed images.
+        :param image_height: height of the full image in pixels.
+        :param image_width: width of the full image in pixels.
+        :return: gym Box space.
+        """
+
+        return gym.spaces.Box(low=0, high=255, shape=self.output_shape(image_height, image_width), dtype=self.dtype)
+
+    def process(self, observation, tile_delta_assembler=None, out=None):
+        """
+        Decode and preprocess the image carried by an observation.
+        :param observation: Observation object.
+        :param tile_delta_assembler: TileDeltaAssembler holding the frame state for tile delta observations.
+        :param out: numpy array of the preprocessed shape and dtype to write the result into, None to allocate one.
+        :return: numpy array of the preprocessed image (H x W x C), which is out if the result was written into it.
+        """
+
+        if self.is_identity():
+            return decode_observation(observation, tile_delta_assembler, out)
+
+        if observation.image_format == IMAGE_FORMAT_PNG:
+            if tile_delta_assembler is not None:
+                tile_delta_assembler.reset()
+            return self.process_png(DECOMPRESSORS[observation.compression](observation.image_bytes), out)
+
+        # Raw images are views on the payload and tile deltas are assembled in place, so neither is copied here.
+        return self.process_array(decode_observation(observation, tile_delta_assembler), out)
+
+    def process_png(self, png_bytes, out=None):
+        """
+        Preprocess a PNG image with PIL.
+        :param png_bytes: PNG encoded image.
+        :param out: numpy array to write the result into, None or one of another shape to allocate a new array.
+        :return: numpy array of the preprocessed image (H x W x C).
+        """
+
+        image = Image.open(BytesIO(png_bytes))
+        if image.mode not in ('RGB', 'RGBA'):
+            image = image.convert('RGB')
+
+        box = self.output_box(image.height, image.width)
+        if self.resize_factor == 1:
+            image = image.crop(box)
+        elif hasattr(image, 'reduce'):
+            image = image.reduce(self.resize_factor, box=box)
+        else:
+            # Pillow < 7 has no reduce(); a box filter resize of the crop box averages the same blocks.
+            height, width, _ = self.output_shape(image.height, image.width)
+            image = image.resize((width, height), Image.BOX, box=box)
+
+        if self.grayscale:
+            pixels = np.asarray(image.convert('L'))[:, :, np.newaxis]
+        else:
+            pixels = np.asarray(image)[:, :, :3]
+
+        if out is None or out.shape != pixels.shape:
+            return pixels.astype(self.dtype)
+
+        out[...] = pixels
+
+        return out
+
+    def process_array(self, image, out=None):
+        """
+        Preprocess an RGB image given as a numpy array.
+        :param image: numpy array of an RGB image (H x W x 3), possibly a read-only view.
+        :param out: numpy array to write the result into, None or one of another shape to allocate a new array.
+        :return: numpy array of the preprocessed image (H x W x C).
+        """
+
+        image_height, image_width, _ = image.shape
+        left, top, right, bottom = self.output_box(image_height, image_width)
+        image = image[top:bottom, left:right]
+
+        if self.resize_factor > 1:
+            factor = self.resize_factor
+            height, width, _ = self.output_shape(image_height, image_width)
+
+            # Splitting the axes of the view into blocks does not copy it; only the block means are allocated.
+            image = image.reshape(height, factor, width, factor, 3).mean(axis=(1, 3))
+
+        if self.grayscale:
+            image = np.dot(image, LUMA_WEIGHTS)[:, :, np.newaxis]
+
+        if image.dtype != self.dtype and self.dtype == np.uint8:
+            image = np.rint(image, out=image)
+
+        if out is None or out.shape != image.shape:
+            return image.astype(self.dtype, copy=False)
+
+        out[...] = image
+
+        return out
@@ -0,0 +1,35 @@
+from environment.image_feature_env import ImageFeatureEnv
+from environment.reward_kernels import averaging_matrix, dct_matrix, fitting_stride, hamming_distance, luma, \
+    perceptual_hash
+
+
+class PerceptualHashEnv(ImageFeatureEnv):
+    """
+    Rewards the fraction of differing bits between DCT perceptual hashes of successive screens. The hash only captures
+    the coarse layout of a screen, so the reward is insensitive to small changes and noise, and is in [0, 1].
+    """
+
+    DCT_SIZE = 32
+    HASH_SIZE = 8
+    SAMPLE_STRIDE = 8
+
+    def __init__(self, *args, **kwargs):
+        super(PerceptualHashEnv, self).__init__(*args, **kwargs)
+
+        self.dct = dct_matrix(self.DCT_SIZE)
+
+        # Matrices reducing the sampled screens to DCT_SIZE x DCT_SIZE, computed for the first observation.
+        self.row_matrix = None
+        self.col_matrix = None
+
+    def compute_features(self, observation):
+        gray = luma(observation, fitting_stride(observation, self.SAMPLE_STRIDE, self.DCT_SIZE))
+
+        if self.row_matrix is None or (self.row_matrix.shape[1], self.col_matrix.shape[1]) != gray.shape:
+            self.row_matrix = averaging_matrix(gray.shape[0], self.DCT_SIZE)
+            self.col_matrix = averaging_matrix(gray.shape[1], self.DCT_SIZE)
+
+        return perceptual_hash(gray, self.row_matrix, self.col_matrix, self.dct, self.HASH_SIZE)
+
+    def feature_distance(self, old_features, new_features):
+        return hamming_distance(old_features, new_features)
@@ -0,0 +1,163 @@
+import gym
+
+from collections import deque
+
+from environment.android_device_env import AndroidDeviceEnv
+from environment.environment_registry import ENVIRONMENTS
+from environment.trajectory import TrajectoryReader
+
+
+class ReplayDevice(object):
+    """
+    The ReplayDevice stands in for a device by answering actions with the observations of a recorded trajectory. A
+    reset action moves on to the next recorded episode, wrapping around after the last one, and every other action to
+    the next recorded step. The recorded observations do not depend on the actions taken.
+    """
+
+    def __init__(self, reader):
+        """
+        Initialize the device.
+        :param reader: TrajectoryReader of the trajectory.
+        """
+
+        assert reader.num_episodes() > 0, "The trajectory has no episodes"
+
+        self.reader = reader
+        self.episode = -1
+        self.record_index = None
+
+        # Observations answering the actions taken, oldest first.
+        self.replies = deque()
+
+    def take_action(self, action):
+        """
+        Answer an action with the next recorded observation.
+        :param action: Action object.
+        """
+
+        if action.is_reset_action:
+            self.episode = (self.episode + 1) % self.reader.num_episodes()
+            self.record_index = self.reader.episode_range(self.episode)[0]
+        else:
+            assert self.record_index is not None, "Reset the environment first"
+
+            self.record_index += 1
+            if self.record_index >= self.reader.episode_range(self.episode)[1]:
+                raise Exception("Episode {} of the trajectory has no more steps".format(self.episode))
+
+        observation = self.reader.read_observation(self.record_index)
+        if action.sequence_id is not None:
+            observation.step_id = action.sequence_id
+
+        self.replies.append(observation)
+
+
+class ReplayActionBuffer(object):
+    """
+    Action buffer handing the actions of the environment to a ReplayDevice.
+    """
+
+    def __init__(self, replay_device):
+        self.replay_device = replay_device
+
+    def put_elem(self, action):
+        self.replay_device.take_action(action)
+
+        return 0
+
+    def clearall(self):
+        pass
+
+
+class ReplayObservationBuffer(object):
+    """
+    Observation buffer serving the replies of a ReplayDevice.
+    """
+
+    def __init__(self, replay_device):
+        self.replay_device = replay_device
+
+    def blocking_read_elem(self):
+        return self.replay_device.replies.popleft()
+
+    def clearall(self):
+        self.replay_device.replies.clear()
+
+    def depth(self):
+        return len(self.replay_device.replies)
+
+    def num_dropped(self):
+        return 0
+
+
+class ReplayAndroidDeviceEnv(gym.Wrapper):
+    """
+    The ReplayAndroidDeviceEnv serves a recorded trajectory back through the API of AndroidDeviceEnv, with no device
+    attached. It wraps an environment of the registry whose buffers are replaced by a ReplayDevice, so recorded
+    observations go through the same decoding, preprocessing and reward computation as live ones, at the speed of
+    reading them from memory mapped chunks.
+
+    Every reset() starts the next recorded episode. The info of a step additionally holds 'recorded_reward', the reward
+    recorded along with the step, and 'episode_done', whether the episode has no more recorded steps.
+    """
+
+    def __init__(self, environment_name, trajectory_path, preprocessor=None, action_mode=None):
+        """
+        Initialize the environment.
+        :param environment_name: name of the environment in ENVIRONMENTS computing the rewards.
+        :param trajectory_path: path to the directory of the trajectory.
+        :param preprocessor: ObservationPreprocessor applied to the recorded observations, None to use them as is.
+        :param action_mode: action mode defining the action space, None for single taps.
+        """
+
+        assert environment_name in ENVIRONMENTS, "{} is not a valid environment name".format(environment_name)
+
+        self.reader = TrajectoryReader(trajectory_path)
+        self.replay_device = ReplayDevice(self.reader)
+
+        # The initial observation of an episode is self-contained, so it gives the size of the device screen.
+        initial_observation = self.reader.read_observation(self.reader.episode_starts[0])
+        image_height, image_width, _ = AndroidDeviceEnv.process_image_from_observation(initial_observation).shape
+
+        env = ENVIRONMENTS[environment_name](
+            ReplayActionBuffer(self.replay_device),
+            ReplayObservationBuffer(self.replay_device),
+            image_height,
+            image_width,
+            preprocessor=preprocessor,
+            action_mode=action_mode
+        )
+
+        super(ReplayAndroidDeviceEnv, self).__init__(env)
+
+    def step(self, action):
+        self.step_async(action)
+
+        return self.step_wait()
+
+    def step_async(self, action):
+        """
+        Take an action without waiting for its observation.
+        :param action: action from the action space.
+        """
+
+        self.env.step_async(action)
+
+    def step_wait(self):
+        """
+        Complete the step of the oldest action in flight.
+        :return: (observation, reward, info) tuple.
+        """
+
+        observation, reward, info = self.env.step_wait()
+
+        start, end = self.reader.episode_range(self.replay_device.episode)
+        record_index = start + self.env.num_steps
+
+        info['recorded_reward'] = self.reader.read_reward(record_index)
+        info['episode_done'] = record_index == end - 1
+
+        return observation, reward, info
+
+    def reset(self, **kwargs):
+        return self.env.reset(**kwargs)
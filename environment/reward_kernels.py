@@ -0,0 +1,324 @@
+"""
+File that contains the vectorized image change kernels the rewards of the environments are built from. Kernels work on
+observation images (H x W x C) of any dtype and channel count the preprocessing produces, and write their full size
+temporaries into the scratch buffers of the environment, so steady state steps do not allocate full size images.
+"""
+
+import numpy as np
+
+from environment.observation_preprocessing import LUMA_WEIGHTS
+
+# Max value of 8 bit pixels, the dynamic range SSIM constants are relative to.
+PIXEL_RANGE = 255.0
+
+# SSIM stabilizing constants, relative to the dynamic range.
+SSIM_K1 = 0.01
+SSIM_K2 = 0.03
+
+# Number of rows of uint8 values summed at once in uint16, which cannot overflow for up to 257 rows.
+UINT8_SUM_ROWS = 256
+
+# Luma weights in float32, so that luma images are computed in float32.
+LUMA_WEIGHTS_FLOAT32 = LUMA_WEIGHTS.astype(np.float32)
+
+
+def absolute_difference(new_image, old_image, out, scratch):
+    """
+    Compute the element wise absolute difference of two images without wrapping around. uint8 images are kept in
+    uint8, as max(a, b) - min(a, b) cannot wrap; other dtypes are subtracted in the dtype of out.
+    :param new_image: numpy array of the new image.
+    :param old_image: numpy array of the old image, of the same shape.
+    :param out: numpy array to write the difference into, uint8 for uint8 images.
+    :param scratch: numpy array like out, used for uint8 images.
+    :return: out.
+    """
+
+    if new_image.dtype == np.uint8 and old_image.dtype == np.uint8:
+        np.maximum(new_image, old_image, out=out)
+        np.minimum(new_image, old_image, out=scratch)
+        return np.subtract(out, scratch, out=out)
+
+    np.subtract(new_image, old_image, out=out)
+
+    return np.absolute(out, out=out)
+
+
+def difference_dtype(new_image, old_image):
+    """
+    Retrieve the dtype absolute_difference() works in.
+    :param new_image: numpy array of the new image.
+    :param old_image: numpy array of the old image.
+    :return: numpy dtype.
+    """
+
+    if new_image.dtype == np.uint8 and old_image.dtype == np.uint8:
+        return np.dtype(np.uint8)
+
+    # Widen unsigned and narrow signed integers so that differences fit, e.g. int16 for uint8 against int8.
+    return np.result_type(new_image, old_image, np.int16)
+
+
+def sum_of_values(image):
+    """
+    Sum all values of an image, accumulating integers exactly instead of in float64.
+    :param image: numpy array.
+    :return: sum as a python number.
+    """
+
+    if image.dtype == np.uint8 and image.flags.c_contiguous and image.ndim > 1:
+        # Adding whole rows in uint16 vectorizes far better than accumulating single values in a wide type.
+        rows = image.reshape(image.shape[0], -1)
+        return sum(
+            int(np.sum(rows[row:row + UINT8_SUM_ROWS].sum(axis=0, dtype=np.uint16), dtype=np.uint64))
+            for row in range(0, rows.shape[0], UINT8_SUM_ROWS)
+        )
+
+    if image.dtype.kind in 'ui':
+        return int(np.sum(image, dtype=np.uint64 if image.dtype.kind == 'u' else np.int64))
+
+    return float(np.sum(image))
+
+
+def sampled_absolute_difference(new_image, old_image, stride, out, scratch):
+    """
+    Compute absolute_difference() on every stride-th row and column of two images.
+    :param new_image: numpy array of the new image (H x W x C).
+    :param old_image: numpy array of the old image, of the same shape.
+    :param stride: sampling stride in pixels.
+    :param out: numpy array (C x H / stride x W / stride) to write the difference into, channel by channel.
+    :param scratch: numpy array like out.
+    :return: out.
+    """
+
+    # Strided views of whole pixels are slow to iterate, so channels are taken one plane at a time.
+    for channel in range(new_image.shape[2]):
+        absolute_difference(new_image[::stride, ::stride, channel], old_image[::stride, ::stride, channel],
+                            out[channel], scratch[channel])
+
+    return out
+
+
+def fitting_stride(image, stride, min_size):
+    """
+    Retrieve the largest sampling stride up to stride that leaves at least min_size rows and columns of an image, so
+    that small or preprocessed images are sampled more densely.
+    :param image: numpy array (H x W x C).
+    :param stride: preferred sampling stride in pixels.
+    :param min_size: min number of sampled rows and columns.
+    :return: stride in pixels.
+    """
+
+    return max(1, min(stride, image.shape[0] // min_size, image.shape[1] // min_size))
+
+
+def luma(image, stride=1):
+    """
+    Compute the luma of an image, sampling every stride-th row and column.
+    :param image: numpy array of an RGB or single channel image (H x W x C).
+    :param stride: sampling stride in pixels.
+    :return: float32 numpy array (H / stride x W / stride).
+    """
+
+    if image.shape[2] == 1:
+        return image[::stride, ::stride, 0].astype(np.float32)
+
+    # Weighting channel planes avoids the slow conversion of whole pixels np.dot() would do.
+    gray = np.multiply(image[::stride, ::stride, 0], LUMA_WEIGHTS_FLOAT32[0])
+    for channel in (1, 2):
+        gray += image[::stride, ::stride, channel] * LUMA_WEIGHTS_FLOAT32[channel]
+
+    return gray
+
+
+def averaging_matrix(size, num_cells):
+    """
+    Create the matrix averaging a vector over near equally sized cells, so that the grid means of a 2D image X are
+    R X C^T for the averaging matrices R and C of its rows and columns.
+    :param size: length of the vector, at least num_cells.
+    :param num_cells: number of cells.
+    :return: float32 numpy array (num_cells x size).
+    """
+
+    assert size >= num_cells, "Cannot average {} values over {} cells".format(size, num_cells)
+
+    cells = np.arange(size) * num_cells // size
+    matrix = (cells[np.newaxis, :] == np.arange(num_cells)[:, np.newaxis]).astype(np.float32)
+
+    return matrix / matrix.sum(axis=1, keepdims=True)
+
+
+def grid_mean(image, row_matrix, col_matrix):
+    """
+    Average a 2D image over a grid of near equally sized cells, for any image size.
+    :param image: 2D numpy array.
+    :param row_matrix: averaging matrix of the rows of the image, see averaging_matrix().
+    :param col_matrix: averaging matrix of the columns of the image.
+    :return: numpy array (grid rows x grid columns) of the cell means.
+    """
+
+    # Two small matrix products are much faster than reducing over uneven cells in place.
+    return row_matrix.dot(image).dot(col_matrix.T)
+
+
+def block_mean(image, factor):
+    """
+    Average a 2D image over factor x factor blocks, dropping rows and columns that do not fill a whole block.
+    :param image: 2D numpy array.
+    :param factor: side of the blocks in pixels.
+    :return: float numpy array (H / factor x W / factor) of the block means.
+    """
+
+    height = image.shape[0] // factor
+    width = image.shape[1] // factor
+
+    # Adding up strided views, one per offset within the blocks, vectorizes better than reshaping into blocks.
+    sums = np.zeros((height, width), dtype=np.float64)
+    for row in range(factor):
+        for col in range(factor):
+            sums += image[row:height * factor:factor, col:width * factor:factor]
+
+    return sums / (factor * factor)
+
+
+def histogram_cell_offsets(height, width, grid_size, num_bins):
+    """
+    Compute the offset of the histogram of the grid cell each pixel falls in, see block_histograms().
+    :param height: height of the grayscale image in pixels.
+    :param width: width of the grayscale image in pixels.
+    :param grid_size: number of cell rows and columns.
+    :param num_bins: number of histogram bins per cell.
+    :return: intp numpy array (H x W).
+    """
+
+    cell_rows = np.arange(height) * grid_size // height
+    cell_cols = np.arange(width) * grid_size // width
+
+    return (cell_rows[:, np.newaxis] * grid_size + cell_cols[np.newaxis, :]) * num_bins
+
+
+def block_histograms(gray, cell_offsets, grid_size, num_bins):
+    """
+    Compute the normalized intensity histogram of each cell of a grid over a grayscale image.
+    :param gray: 2D float numpy array with values in [0, 255].
+    :param cell_offsets: histogram offsets of the pixels as returned by histogram_cell_offsets().
+    :param grid_size: number of cell rows and columns.
+    :param num_bins: number of histogram bins per cell.
+    :return: numpy array (grid_size * grid_size x num_bins) of histograms that sum to 1 per cell.
+    """
+
+    bins = np.minimum((gray * (num_bins / 256.0)).astype(np.intp), num_bins - 1)
+    bins += cell_offsets
+
+    counts = np.bincount(bins.ravel(), minlength=grid_size * grid_size * num_bins)
+    counts = counts.reshape(grid_size * grid_size, num_bins)
+
+    return counts / counts.sum(axis=1, keepdims=True)
+
+
+def histogram_distance(old_histograms, new_histograms):
+    """
+    Compute the mean total variation distance between the histograms of corresponding cells.
+    :param old_histograms: numpy array (num cells x num bins) of normalized histograms.
+    :param new_histograms: numpy array like old_histograms.
+    :return: distance in [0, 1].
+    """
+
+    return 0.5 * np.abs(new_histograms - old_histograms).sum(axis=1).mean()
+
+
+def dct_matrix(size):
+    """
+    Create the orthonormal DCT-II matrix, so that the 2D DCT of an image X is D X D^T.
+    :param size: number of samples.
+    :return: numpy array (size x size).
+    """
+
+    frequencies = np.arange(size)[:, np.newaxis]
+    samples = np.arange(size)[np.newaxis, :]
+
+    matrix = np.cos(np.pi * (2 * samples + 1) * frequencies / (2.0 * size)) * np.sqrt(2.0 / size)
+    matrix[0] /= np.sqrt(2.0)
+
+    return matrix
+
+
+def perceptual_hash(gray, row_matrix, col_matrix, dct, hash_size):
+    """
+    Compute the DCT perceptual hash of a grayscale image: the signs of its lowest frequencies against their median.
+    :param gray: 2D float numpy array.
+    :param row_matrix: averaging matrix reducing the rows of the image to the size of the DCT.
+    :param col_matrix: averaging matrix reducing the columns of the image to the size of the DCT.
+    :param dct: DCT matrix as created by dct_matrix().
+    :param hash_size: number of lowest frequencies kept per axis.
+    :return: boolean numpy array (hash_size x hash_size).
+    """
+
+    coefficients = dct.dot(grid_mean(gray, row_matrix, col_matrix)).dot(dct.T)[:hash_size, :hash_size]
+
+    # The DC coefficient only carries the mean brightness, so it is left out of the median.
+    return coefficients > np.median(coefficients.flat[1:])
+
+
+def hamming_distance(old_hash, new_hash):
+    """
+    Compute the fraction of differing bits between two hashes.
+    :param old_hash: boolean numpy array.
+    :param new_hash: boolean numpy array like old_hash.
+    :return: distance in [0, 1].
+    """
+
+    return np.count_nonzero(old_hash != new_hash) / float(old_hash.size)
+
+
+def box_filter(image, window_size):
+    """
+    Average an image over all window_size x window_size windows that fit in it, using an integral image.
+    :param image: 2D float numpy array.
+    :param window_size: side of the windows in pixels.
+    :return: numpy array (H - window_size + 1 x W - window_size + 1) of the window means.
+    """
+
+    integral = np.zeros((image.shape[0] + 1, image.shape[1] + 1))
+    np.cumsum(np.cumsum(image, axis=0), axis=1, out=integral[1:, 1:])
+
+    window_sums = integral[window_size:, window_size:] - integral[:-window_size, window_size:] \
+        - integral[window_size:, :-window_size] + integral[:-window_size, :-window_size]
+
+    return window_sums / (window_size * window_size)
+
+
+def ssim_statistics(gray, window_size):
+    """
+    Compute the per window statistics of an image that SSIM compares, so that each frame's are computed once.
+    :param gray: 2D float numpy array.
+    :param window_size: side of the SSIM windows in pixels.
+    :return: (image, window means, window variances) tuple.
+    """
+
+    means = box_filter(gray, window_size)
+    variances = box_filter(gray * gray, window_size) - means * means
+
+    return gray, means, variances
+
+
+def structural_dissimilarity(old_statistics, new_statistics, window_size):
+    """
+    Compute the structural dissimilarity (1 - mean SSIM) / 2 of two images from their statistics.
+    :param old_statistics: statistics of the old image as returned by ssim_statistics().
+    :param new_statistics: statistics of the new image as returned by ssim_statistics().
+    :param window_size: side of the SSIM windows in pixels.
+    :return: dissimilarity in [0, 1], 0 for identical images.
+    """
+
+    old_gray, old_means, old_variances = old_statistics
+    new_gray, new_means, new_variances = new_statistics
+
+    covariances = box_filter(old_gray * new_gray, window_size) - old_means * new_means
+
+    c1 = (SSIM_K1 * PIXEL_RANGE) ** 2
+    c2 = (SSIM_K2 * PIXEL_RANGE) ** 2
+
+    ssim = ((2 * old_means * new_means + c1) * (2 * covariances + c2)) / \
+        ((old_means * old_means + new_means * new_means + c1) * (old_variances + new_variances + c2))
+
+    return (1.0 - ssim.mean()) / 2.0
@@ -0,0 +1,26 @@
+from environment.image_feature_env import ImageFeatureEnv
+from environment.reward_kernels import block_mean, fitting_stride, luma, ssim_statistics, structural_dissimilarity
+
+
+class SsimEnv(ImageFeatureEnv):
+    """
+    Rewards the structural dissimilarity (1 - SSIM) / 2 of successive screens, computed on a grayscale grid of
+    REDUCE_FACTOR x REDUCE_FACTOR pixel cells with WINDOW_SIZE x WINDOW_SIZE cell windows. It is in [0, 1], 0 for
+    identical screens.
+    """
+
+    REDUCE_FACTOR = 16
+    SAMPLE_STRIDE = 8
+    WINDOW_SIZE = 7
+
+    def compute_features(self, observation):
+        gray = luma(observation, fitting_stride(observation, self.SAMPLE_STRIDE, self.WINDOW_SIZE))
+
+        # Small screens are reduced less, keeping at least one window.
+        factor = max(1, min(self.REDUCE_FACTOR // self.SAMPLE_STRIDE, min(gray.shape) // self.WINDOW_SIZE))
+        grid = block_mean(gray, factor)
+
+        return ssim_statistics(grid, self.WINDOW_SIZE)
+
+    def feature_distance(self, old_features, new_features):
+        return structural_dissimilarity(old_features, new_features, self.WINDOW_SIZE)
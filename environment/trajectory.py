@@ -0,0 +1,314 @@
+"""
+File that contains the on-disk format of recorded trajectories, along with its writer and reader.
+
+A trajectory is a directory of chunk files named chunk-NNNNNN.trj, in order. Each chunk starts with a file header of
+magic and format version, followed by records appended one after the other:
+  - a record header of the record kind (reset or step), reward, time the step completed (seconds since the epoch),
+    and the sizes of the two byte strings that follow,
+  - the action taken, in the binary action encoding,
+  - the observation the device answered with, as its binary envelope. The payload is the one sent by the device, so
+    replaying it goes through the same decoding and preprocessing as a live session.
+
+Next to every chunk, an index file chunk-NNNNNN.idx holds one entry per record: the offset of the record in the chunk
+followed by the fields of its record header. Readers load the index instead of walking the chunk record by record, so
+opening a long recording touches the index files only, and any record is then reached with a single seek. A chunk
+without an index, or whose index lags behind it, e.g. after a crash, is scanned from its last indexed record on.
+
+Chunks are only ever appended to, and a new chunk is started once the current one exceeds the chunk size, so that
+recordings can be read while they grow and a crash loses at most the record being written. Readers memory map the
+chunks and hand out observations whose payloads are views into the maps.
+"""
+
+import mmap
+import os
+import struct
+import time
+
+from eventobjects.action import Action, RESET_ACTION
+from eventobjects.observation import Observation
+
+TRAJECTORY_MAGIC = 0x4D565452  # 'MVTR'
+TRAJECTORY_VERSION = 1
+FILE_HEADER_FORMAT = '>IB'
+FILE_HEADER_SIZE = struct.calcsize(FILE_HEADER_FORMAT)
+
+RECORD_HEADER_FORMAT = '>BddII'
+RECORD_HEADER_SIZE = struct.calcsize(RECORD_HEADER_FORMAT)
+
+# Index entry: offset of the record in its chunk, then the fields of the record header.
+INDEX_ENTRY_FORMAT = '>Q' + RECORD_HEADER_FORMAT[1:]
+INDEX_ENTRY_SIZE = struct.calcsize(INDEX_ENTRY_FORMAT)
+
+# Kinds of records. Every episode starts with a reset record.
+RECORD_RESET = 0
+RECORD_STEP = 1
+
+# Size in bytes beyond which a new chunk is started.
+DEFAULT_CHUNK_SIZE = 64 * 1024 * 1024
+
+CHUNK_FILE_NAME_FORMAT = "chunk-{:06d}.trj"
+
+
+def chunk_index_path(chunk_file_path):
+    """
+    :param chunk_file_path: path to a chunk file.
+    :return: path to the index file of the chunk.
+    """
+
+    return chunk_file_path[:-len(".trj")] + ".idx"
+
+
+def list_chunk_files(trajectory_path):
+    """
+    List the chunk files of a trajectory in order.
+    :param trajectory_path: path to the directory of the trajectory.
+    :return: list of paths.
+    """
+
+    file_names = sorted(
+        file_name for file_name in os.listdir(trajectory_path)
+        if file_name.startswith("chunk-") and file_name.endswith(".trj")
+    )
+
+    return [os.path.join(trajectory_path, file_name) for file_name in file_names]
+
+
+class TrajectoryRecorder(object):
+    """
+    The TrajectoryRecorder appends the resets and steps of an environment to a trajectory on disk. Recording into an
+    existing trajectory continues it in a new chunk.
+    """
+
+    def __init__(self, trajectory_path, chunk_size=DEFAULT_CHUNK_SIZE):
+        """
+        Initialize the recorder.
+        :param trajectory_path: path to the directory of the trajectory, created if it does not exist.
+        :param chunk_size: size in bytes beyond which a new chunk is started.
+        """
+
+        if not os.path.exists(trajectory_path):
+            os.makedirs(trajectory_path)
+
+        self.trajectory_path = trajectory_path
+        self.chunk_size = chunk_size
+
+        self.num_chunks = len(list_chunk_files(trajectory_path))
+        self.chunk_file = None
+        self.index_file = None
+        self.chunk_bytes = 0
+
+    def record_reset(self, observation):
+        """
+        Record the start of an episode.
+        :param observation: Observation object of the initial observation.
+        """
+
+        self.write_record(RECORD_RESET, RESET_ACTION, 0.0, observation)
+
+    def record_step(self, action, reward, observation):
+        """
+        Record a step.
+        :param action: Action object taken.
+        :param reward: reward of the step.
+        :param observation: Observation object the device answered the action with.
+        """
+
+        self.write_record(RECORD_STEP, action, reward, observation)
+
+    def write_record(self, kind, action, reward, observation):
+        """
+        Append a record to the current chunk, starting a new chunk first if the current one is full.
+        :param kind: RECORD_RESET or RECORD_STEP.
+        :param action: Action object.
+        :param reward: reward of the step.
+        :param observation: Observation object.
+        """
+
+        if self.chunk_file is None or self.chunk_bytes >= self.chunk_size:
+            self.start_chunk()
+
+        action_bytes = action.serialize()
+        observation_header = observation.serialize_header()
+        observation_size = len(observation_header) + len(observation.image_bytes)
+
+        header = (kind, reward, time.time(), len(action_bytes), observation_size)
+
+        self.chunk_file.write(struct.pack(RECORD_HEADER_FORMAT, *header))
+        self.chunk_file.write(action_bytes)
+        self.chunk_file.write(observation_header)
+        self.chunk_file.write(observation.image_bytes)
+
+        # The index entry follows the record, so that an entry never refers to a record missing from the chunk.
+        self.index_file.write(struct.pack(INDEX_ENTRY_FORMAT, self.chunk_bytes, *header))
+
+        self.chunk_bytes += RECORD_HEADER_SIZE + len(action_bytes) + observation_size
+
+    def start_chunk(self):
+        """
+        Close the current chunk and start the next one.
+        """
+
+        self.close()
+
+        chunk_file_path = os.path.join(self.trajectory_path, CHUNK_FILE_NAME_FORMAT.format(self.num_chunks))
+        self.chunk_file = open(chunk_file_path, 'ab')
+        self.chunk_file.write(struct.pack(FILE_HEADER_FORMAT, TRAJECTORY_MAGIC, TRAJECTORY_VERSION))
+        self.index_file = open(chunk_index_path(chunk_file_path), 'ab')
+
+        self.num_chunks += 1
+        self.chunk_bytes = FILE_HEADER_SIZE
+
+    def flush(self):
+        """
+        Hand the records written so far to the operating system, so that readers see them.
+        """
+
+        if self.chunk_file is not None:
+            self.chunk_file.flush()
+            self.index_file.flush()
+
+    def close(self):
+        """
+        Close the current chunk. Recording again starts a new one.
+        """
+
+        if self.chunk_file is not None:
+            self.chunk_file.close()
+            self.index_file.close()
+            self.chunk_file = None
+            self.index_file = None
+
+
+class TrajectoryReader(object):
+    """
+    The TrajectoryReader memory maps the chunks of a trajectory and indexes its records from the index files, scanning
+    the record headers of chunks not covered by them. Records are decoded on access, and the payloads of their
+    observations are views into the maps rather than copies.
+    A record cut off at the end of a chunk, e.g. by a crash while recording, is ignored.
+    """
+
+    def __init__(self, trajectory_path):
+        """
+        Initialize the reader.
+        :param trajectory_path: path to the directory of the trajectory.
+        """
+
+        self.maps = []
+
+        # Per record: index of the map, offset of the record header and the header fields.
+        self.records = []
+
+        for chunk_file_path in list_chunk_files(trajectory_path):
+            if os.path.getsize(chunk_file_path) <= FILE_HEADER_SIZE:
+                continue
+
+            with open(chunk_file_path, 'rb') as fp:
+                mapped = mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ)
+
+            magic, version = struct.unpack_from(FILE_HEADER_FORMAT, mapped, 0)
+            if magic != TRAJECTORY_MAGIC or version != TRAJECTORY_VERSION:
+                raise Exception("{} is not a trajectory chunk of version {}".format(chunk_file_path,
+                                                                                  TRAJECTORY_VERSION))
+
+            self.index_chunk(len(self.maps), mapped, chunk_index_path(chunk_file_path))
+            self.maps.append(mapped)
+
+        # Index of the first record of every episode.
+        self.episode_starts = [i for i, record in enumerate(self.records) if record[2] == RECORD_RESET]
+
+    def index_chunk(self, map_index, mapped, index_path):
+        """
+        Append the records of a chunk to the index.
+        :param map_index: index of the map of the chunk.
+        :param mapped: mmap of the chunk.
+        :param index_path: path to the index file of the chunk, which may not exist.
+        """
+
+        offset = FILE_HEADER_SIZE
+
+        if os.path.exists(index_path):
+            with open(index_path, 'rb') as fp:
+                index_bytes = fp.read()
+
+            # An entry cut off at the end of the index is ignored.
+            num_entries = len(index_bytes) // INDEX_ENTRY_SIZE
+            for entry in struct.iter_unpack(INDEX_ENTRY_FORMAT, index_bytes[:num_entries * INDEX_ENTRY_SIZE]):
+                record_offset, _, _, _, action_size, observation_size = entry
+                if record_offset != offset:
+                    raise Exception("The index {} does not match its chunk".format(index_path))
+
+                # Entries may reach the disk ahead of their records while the chunk is being recorded.
+                if offset + RECORD_HEADER_SIZE + action_size + observation_size > len(mapped):
+                    break
+
+                self.records.append((map_index,) + entry)
+                offset += RECORD_HEADER_SIZE + action_size + observation_size
+
+        # Scan the records the index does not cover.
+        while offset + RECORD_HEADER_SIZE <= len(mapped):
+            header = struct.unpack_from(RECORD_HEADER_FORMAT, mapped, offset)
+            _, _, _, action_size, observation_size = header
+
+            if offset + RECORD_HEADER_SIZE + action_size + observation_size > len(mapped):
+                break
+
+            self.records.append((map_index, offset) + header)
+            offset += RECORD_HEADER_SIZE + action_size + observation_size
+
+    def __len__(self):
+        return len(self.records)
+
+    def num_episodes(self):
+        return len(self.episode_starts)
+
+    def episode_range(self, episode):
+        """
+        :param episode: index of an episode.
+        :return: (start, end) tuple of the indices of the first record of the episode and of the record after its
+        last.
+        """
+
+        start = self.episode_starts[episode]
+        end = self.episode_starts[episode + 1] if episode + 1 < len(self.episode_starts) else len(self.records)
+
+        return start, end
+
+    def read(self, index):
+        """
+        Decode a record.
+        :param index: index of the record.
+        :return: (kind, action, reward, timestamp, observation) tuple, with Action and Observation objects.
+        """
+
+        map_index, offset, kind, reward, timestamp, action_size, observation_size = self.records[index]
+
+        view = memoryview(self.maps[map_index])
+        action_start = offset + RECORD_HEADER_SIZE
+        observation_start = action_start + action_size
+
+        action = Action.deserialize(bytes(view[action_start:observation_start]))
+        observation = Observation.deserialize(view[observation_start:observation_start + observation_size])
+
+        return kind, action, reward, timestamp, observation
+
+    def read_reward(self, index):
+        """
+        :param index: index of a record.
+        :return: reward recorded with the record.
+        """
+
+        return self.records[index][3]
+
+    def read_observation(self, index):
+        """
+        Decode the observation of a record only.
+        :param index: index of the record.
+        :return: Observation object.
+        """
+
+        map_index, offset, _, _, _, action_size, observation_size = self.records[index]
+
+        observation_start = offset + RECORD_HEADER_SIZE + action_size
+        view = memoryview(self.maps[map_index])
+
+        return Observation.deserialize(view[observation_start:observation_start + observation_size])
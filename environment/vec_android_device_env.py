@@ -0,0 +1,216 @@
+import numpy as np
+
+from buffers.buffer_factory import create_buffers
+from buffers.stream_buffer import StreamBuffer
+from environment.environment_registry import ENVIRONMENTS
+
+
+class VecAndroidDeviceEnv(object):
+    """
+    The VecAndroidDeviceEnv steps N AndroidDeviceEnv instances, each driving its own device, as one batch.
+
+    All N actions are sent at once, numbered by their environments, and every observation completes the step or reset
+    of its environment as it arrives, as AndroidDeviceEnv.step() and reset() would, trajectory recorder and observation
+    callback included. The decoded images are copied into one preallocated (N x H x W x C) array, along with (N,)
+    arrays of rewards and done flags. These arrays are reused and overwritten by every step() and reset(), so copy
+    them to keep them around.
+
+    When all buffers are redis lists on one shared client, the actions are sent in one pipeline and the observations
+    are gathered with a single multi-key BLPOP per arrival. Otherwise, buffers are served one environment at a time.
+
+    An episode is done once an environment has taken max_episode_steps steps. In synchronous mode, done environments
+    are left as they are until the next reset(): step() sends them no action and reports a reward of 0 for them. In
+    auto-reset mode, they are reset within step(): the returned observation is then the initial observation of the new
+    episode and the info holds the last observation of the finished one under 'terminal_observation'.
+    """
+
+    def __init__(self, environments, max_episode_steps=None, auto_reset=False):
+        """
+        Initialize the vectorized environment.
+        :param environments: list of AndroidDeviceEnv objects with identical observation spaces.
+        :param max_episode_steps: number of steps after which an episode is done, None for episodes that never end.
+        :param auto_reset: whether to reset done environments within step().
+        """
+
+        assert len(environments) > 0, "At least one environment is required"
+        assert len(set(env.observation_space.shape for env in environments)) == 1, \
+            "All environments must have the same observation space"
+        assert not auto_reset or max_episode_steps is not None, "Auto-reset requires max_episode_steps"
+
+        self.environments = environments
+        self.num_envs = len(environments)
+        self.max_episode_steps = max_episode_steps
+        self.auto_reset = auto_reset
+
+        # Per environment spaces.
+        self.observation_space = environments[0].observation_space
+        self.action_space = environments[0].action_space
+
+        self.observations = np.zeros((self.num_envs,) + self.observation_space.shape,
+                                     dtype=self.observation_space.dtype)
+        self.rewards = np.zeros(self.num_envs, dtype=np.float64)
+        self.dones = np.zeros(self.num_envs, dtype=bool)
+
+        # Redis client shared by all buffers, if any, so that all of them can be served with single commands.
+        self.shared_redis_client = None
+
+        buffers = [env.action_buffer for env in environments] + [env.observation_buffer for env in environments]
+        redis_clients = set(id(buffer.redis_client) for buffer in buffers)
+        if len(redis_clients) == 1 and not any(isinstance(buffer, StreamBuffer) for buffer in buffers):
+            self.shared_redis_client = buffers[0].redis_client
+
+        # Observation buffer name to environment index, used to dispatch the results of a multi-key BLPOP.
+        self.observation_buffer_indices = dict(
+            (env.observation_buffer.buffer_name, i) for i, env in enumerate(environments)
+        )
+
+    def step(self, actions):
+        """
+        Take one action on every environment.
+        :param actions: array-like of N actions from the action space, one per environment.
+        :return: (observations, rewards, dones, infos) tuple of the (N x H x W x C) observations, (N,) rewards, (N,)
+        done flags and list of N info dicts.
+        """
+
+        # Without auto-reset, done environments are left as they are: they get no action, a reward of 0 and an empty
+        # info, and keep their last observation.
+        if self.auto_reset:
+            indices = list(range(self.num_envs))
+        else:
+            indices = [i for i in range(self.num_envs) if not self.dones[i]]
+
+        numbered_actions = [self.environments[i].number_action(self.environments[i].action_mode.to_action(actions[i]))
+                            for i in indices]
+        self.send_actions(numbered_actions, indices)
+        results = self.gather_observations(numbered_actions, indices,
+                                           lambda env, action, observation: env.complete_step(action, observation))
+
+        self.rewards[:] = 0
+        infos = [dict() for _ in range(self.num_envs)]
+        for i in indices:
+            self.observations[i], self.rewards[i], infos[i] = results[i]
+            self.dones[i] = self.max_episode_steps is not None and \
+                self.environments[i].num_steps >= self.max_episode_steps
+
+        done_indices = [i for i in indices if self.dones[i]]
+        if self.auto_reset and done_indices:
+            for i in done_indices:
+                infos[i]['terminal_observation'] = self.observations[i].copy()
+            self.reset_environments(done_indices)
+
+        return self.observations, self.rewards, self.dones, infos
+
+    def reset(self):
+        """
+        Reset every environment.
+        :return: (N x H x W x C) array of the initial observations.
+        """
+
+        self.reset_environments(range(self.num_envs))
+        self.dones[:] = False
+
+        return self.observations
+
+    def reset_environments(self, indices):
+        """
+        Reset some of the environments, writing their initial observations into the observations array.
+        :param indices: indices of the environments to reset.
+        """
+
+        reset_actions = []
+        for i in indices:
+            self.environments[i].action_buffer.clearall()
+            self.environments[i].observation_buffer.clearall()
+            reset_actions.append(self.environments[i].begin_reset())
+
+        self.send_actions(reset_actions, indices)
+        results = self.gather_observations(reset_actions, indices,
+                                           lambda env, _, observation: env.complete_reset(observation))
+
+        for i in indices:
+            self.observations[i] = results[i]
+
+    def send_actions(self, actions, indices):
+        """
+        Send actions to environments.
+        :param actions: list of Action objects.
+        :param indices: indices of the environments, one per action.
+        """
+
+        if self.shared_redis_client is None or any(self.environments[i].action_buffer.capacity for i in indices):
+            for action, i in zip(actions, indices):
+                self.environments[i].action_buffer.put_elem(action)
+            return
+
+        pipeline = self.shared_redis_client.pipeline(transaction=False)
+        for action, i in zip(actions, indices):
+            action_buffer = self.environments[i].action_buffer
+            pipeline.rpush(action_buffer.buffer_name, action_buffer.serialize_elem(action))
+        pipeline.execute()
+
+    def gather_observations(self, actions, indices, complete_fn):
+        """
+        Wait for the observations answering the actions sent to the environments and complete the step or reset of
+        each environment in the order they arrive. Observations of actions sent before are skipped.
+        :param actions: list of numbered Action objects that were sent.
+        :param indices: indices of the environments, one per action.
+        :param complete_fn: function completing the step or reset of an environment, given the environment, the action
+        and the Observation object answering it.
+        :return: dict from environment index to the result of complete_fn.
+        """
+
+        results = dict()
+
+        if self.shared_redis_client is None:
+            for action, i in zip(actions, indices):
+                env = self.environments[i]
+                results[i] = complete_fn(env, action, env.read_observation(action.sequence_id))
+            return results
+
+        pending_actions = dict((self.environments[i].observation_buffer.buffer_name, action)
+                               for action, i in zip(actions, indices))
+        pending_buffer_names = [self.environments[i].observation_buffer.buffer_name for i in indices]
+        while pending_buffer_names:
+            buffer_name, read_str = self.shared_redis_client.blpop(pending_buffer_names)
+            if not isinstance(buffer_name, str):
+                buffer_name = buffer_name.decode('utf-8')
+
+            i = self.observation_buffer_indices[buffer_name]
+            env = self.environments[i]
+            action = pending_actions[buffer_name]
+            observation = env.observation_buffer.deserialize_elem(read_str)
+            if env.answers_action(observation, action.sequence_id):
+                pending_buffer_names.remove(buffer_name)
+                results[i] = complete_fn(env, action, observation)
+
+        return results
+
+
+def create_vec_environment(environment_name, redis_client, session_ids, image_height, image_width,
+                           max_episode_steps=None, auto_reset=False, preprocessor=None, action_mode=None,
+                           **buffer_kwargs):
+    """
+    Create a VecAndroidDeviceEnv over one registered environment per session, all sharing one redis client.
+    :param environment_name: name of the environment in ENVIRONMENTS.
+    :param redis_client: Redis client for an active connection.
+    :param session_ids: ids of the sessions, one per device.
+    :param image_height: height of the image observations in terms of num pixels.
+    :param image_width: width of the image observations in terms of num pixels.
+    :param max_episode_steps: number of steps after which an episode is done, None for episodes that never end.
+    :param auto_reset: whether to reset done environments within step().
+    :param preprocessor: ObservationPreprocessor shared by the environments, None to use the full device images.
+    :param action_mode: action mode shared by the environments, None for single taps.
+    :param buffer_kwargs: further arguments of create_buffers().
+    :return: VecAndroidDeviceEnv object.
+    """
+
+    assert environment_name in ENVIRONMENTS, "{} is not a valid environment name".format(environment_name)
+
+    environments = []
+    for session_id in session_ids:
+        action_buffer, observation_buffer = create_buffers(redis_client, session_id=session_id, **buffer_kwargs)
+        environments.append(ENVIRONMENTS[environment_name](action_buffer, observation_buffer, image_height,
+                                                           image_width, preprocessor=preprocessor,
+                                                           action_mode=action_mode))
+
+    return VecAndroidDeviceEnv(environments, max_episode_steps, auto_reset)
@@ -0,0 +1,226 @@
+"""
+File that contains gym wrappers around AndroidDeviceEnv: one repeating actions over several steps, and one stacking the
+latest observations to give agents motion context.
+"""
+
+import gym
+import numpy as np
+
+from collections import deque
+
+from environment.frame_pool import FramePool
+
+
+class FrameSkipWrapper(gym.Wrapper):
+    """
+    The FrameSkipWrapper repeats every action skip times and sums the rewards of the repeats.
+
+    All repeats are sent at once, so the device carries them out back to back, in the order they were sent, rather
+    than waiting on the environment in between. The observation of every repeat is still decoded, since rewards
+    compare successive observations.
+    """
+
+    def __init__(self, env, skip):
+        """
+        Initialize the wrapper.
+        :param env: AndroidDeviceEnv, or a wrapper around one.
+        :param skip: number of times every action is taken.
+        """
+
+        assert type(skip) == int and skip >= 1, "Frame skip must be a positive integer"
+
+        super(FrameSkipWrapper, self).__init__(env)
+
+        self.skip = skip
+
+    def step(self, action):
+        self.step_async(action)
+
+        return self.step_wait()
+
+    def step_async(self, action):
+        """
+        Send the repeats of an action without waiting for their observations.
+        :param action: action from the action space.
+        """
+
+        for _ in range(self.skip):
+            self.env.step_async(action)
+
+    def step_wait(self):
+        """
+        Wait for the observations of the repeats of the oldest action in flight.
+        :return: (observation, reward, info) tuple of the last observation, the sum of the rewards and the last info.
+        """
+
+        total_reward = 0.0
+        for _ in range(self.skip):
+            observation, reward, info = self.env.step_wait()
+            total_reward += reward
+
+        return observation, total_reward, info
+
+    def num_actions_in_flight(self):
+        """
+        :return: number of actions sent by step_async() whose steps step_wait() has not completed yet.
+        """
+
+        return self.env.num_actions_in_flight() // self.skip
+
+    def reset(self, **kwargs):
+        return self.env.reset(**kwargs)
+
+
+class LazyFrameStack(object):
+    """
+    The LazyFrameStack is a stack of the latest observations that refers to the frames in the ring of a
+    FrameStackWrapper instead of copying them. np.asarray() materializes it into a new (num_stack x H x W x C) array,
+    and indexing it yields a view of a single frame.
+
+    A frame stays in the ring until the ring has taken as many new frames as it holds; see FrameStackWrapper for how
+    many steps that is. Materialize stacks to keep them around for longer.
+    """
+
+    def __init__(self, frame_pool, slots, oldest_acquisition):
+        """
+        Initialize the stack.
+        :param frame_pool: FramePool holding the ring of frames.
+        :param slots: indices in the ring of the stacked frames, oldest first.
+        :param oldest_acquisition: value of frame_pool.num_acquired once the oldest frame was handed out.
+        """
+
+        self.frame_pool = frame_pool
+        self.slots = slots
+        self.oldest_acquisition = oldest_acquisition
+
+        self.shape = (len(slots),) + frame_pool.storage.shape[1:]
+        self.dtype = frame_pool.storage.dtype
+
+    def is_valid(self):
+        """
+        :return: True if none of the stacked frames has been overwritten yet.
+        """
+
+        return self.frame_pool.num_acquired - self.oldest_acquisition < len(self.frame_pool.frames)
+
+    def check_valid(self):
+        if not self.is_valid():
+            raise Exception("Frames of the stack have been overwritten. Materialize stacks with np.asarray() to keep "
+                            "them around, or enlarge the frame ring.")
+
+    def __array__(self, dtype=None):
+        self.check_valid()
+
+        stack = self.frame_pool.storage.take(self.slots, axis=0)
+
+        return stack if dtype is None else stack.astype(dtype)
+
+    def __len__(self):
+        return len(self.slots)
+
+    def __getitem__(self, index):
+        self.check_valid()
+
+        return self.frame_pool.frames[self.slots[index]]
+
+
+class FrameStackWrapper(gym.Wrapper):
+    """
+    The FrameStackWrapper turns observations into stacks of the num_stack latest observations, oldest first.
+
+    Instead of copying frames into every stack, the wrapper makes the frame pool of the environment a ring of
+    num_frames frames, which observations are decoded straight into, and hands out LazyFrameStack objects referring to
+    the frames in it. A stack thereby costs no copy of frame data until an agent materializes it. At reset, the initial
+    observation fills the whole stack.
+
+    A stack remains valid through the next num_frames // frames_per_step - num_stack steps, where frames_per_step is
+    the frame skip of the wrapped environment, if any. With the default ring, that is num_stack steps.
+    """
+
+    def __init__(self, env, num_stack, num_frames=None):
+        """
+        Initialize the wrapper.
+        :param env: AndroidDeviceEnv, or a wrapper around one.
+        :param num_stack: number of observations per stack.
+        :param num_frames: number of frames in the ring, None for the default.
+        """
+
+        assert type(num_stack) == int and num_stack >= 1, "Number of stacked frames must be a positive integer"
+
+        super(FrameStackWrapper, self).__init__(env)
+
+        # Every step decodes as many frames as the wrapped environment repeats the action.
+        frames_per_step = getattr(env, 'skip', 1)
+        if num_frames is None:
+            num_frames = 2 * num_stack * frames_per_step
+        assert num_frames > (num_stack - 1) * frames_per_step, \
+            "The frame ring must hold the frames of num_stack steps"
+
+        self.num_stack = num_stack
+
+        frame_space = env.observation_space
+        self.observation_space = gym.spaces.Box(
+            low=np.repeat(frame_space.low[np.newaxis], num_stack, axis=0),
+            high=np.repeat(frame_space.high[np.newaxis], num_stack, axis=0),
+            dtype=frame_space.dtype
+        )
+
+        self.frame_pool = FramePool(frame_space.shape, frame_space.dtype, max(num_frames, 2))
+        self.unwrapped.frame_pool = self.frame_pool
+
+        # Ring indices of the stacked frames and values of frame_pool.num_acquired when they were handed out.
+        self.slots = deque(maxlen=num_stack)
+        self.acquisitions = deque(maxlen=num_stack)
+
+    def step(self, action):
+        self.step_async(action)
+
+        return self.step_wait()
+
+    def step_async(self, action):
+        """
+        Send an action without waiting for its observation.
+        :param action: action from the action space.
+        """
+
+        self.env.step_async(action)
+
+    def step_wait(self):
+        """
+        Wait for the observation of the oldest action in flight and push it onto the stack.
+        :return: (observation, reward, info) tuple where the observation is a LazyFrameStack.
+        """
+
+        observation, reward, info = self.env.step_wait()
+        self.push(observation)
+
+        return self.stack(), reward, info
+
+    def reset(self, **kwargs):
+        observation = self.env.reset(**kwargs)
+
+        for _ in range(self.num_stack):
+            self.push(observation)
+
+        return self.stack()
+
+    def push(self, observation):
+        """
+        Push the newest observation onto the stack. It is normally decoded into the newest frame of the ring already;
+        otherwise, e.g. for uncompressed observations read in place, it is copied there.
+        :param observation: np array of the newest observation.
+        """
+
+        frame = self.frame_pool.frames[self.frame_pool.current]
+        if not np.may_share_memory(frame, observation):
+            np.copyto(frame, observation)
+
+        self.slots.append(self.frame_pool.current)
+        self.acquisitions.append(self.frame_pool.num_acquired)
+
+    def stack(self):
+        """
+        :return: LazyFrameStack of the latest observations.
+        """
+
+        return LazyFrameStack(self.frame_pool, list(self.slots), self.acquisitions[0])
@@ -1,39 +1,221 @@
 import pickle
+import struct
+
+# Compact binary encoding: magic, encoding version, flags and the (x, y) click coordinate as doubles.
+# Legacy pickled actions start with the pickle protocol opcode, which never matches the magic.
+ENCODING_MAGIC = 0x4D564143  # 'MVAC'
+ENCODING_VERSION = 1
+ENCODING_FORMAT = '>IBBdd'
+ENCODING_SIZE = struct.calcsize(ENCODING_FORMAT)
+
+# Version 2 appends optional fields to the version 1 header, each present if its flag is set, in order:
+#   1. the sequence id of the action,
+#   2. a sequence of gestures: their count, then for each gesture its kind, start and end coordinates and duration in
+#      milliseconds.
+# Actions without optional fields keep the version 1 encoding.
+EXTENDED_ENCODING_VERSION = 2
+SEQUENCE_ID_FORMAT = '>I'
+SEQUENCE_ID_SIZE = struct.calcsize(SEQUENCE_ID_FORMAT)
+GESTURE_COUNT_FORMAT = '>H'
+GESTURE_COUNT_SIZE = struct.calcsize(GESTURE_COUNT_FORMAT)
+GESTURE_FORMAT = '>BddddI'
+GESTURE_SIZE = struct.calcsize(GESTURE_FORMAT)
+
+# Bit flags of the binary encoding.
+FLAG_RESET_ACTION = 1
+FLAG_GESTURES = 2
+FLAG_SEQUENCE_ID = 4
+
+# Kinds of gestures.
+# Touch down and up at the start coordinate.
+GESTURE_TAP = 0
+# Fling from the start to the end coordinate over the duration.
+GESTURE_SWIPE = 1
+# Touch down at the start coordinate and hold for the duration.
+GESTURE_LONG_PRESS = 2
+# Press and hold at the start coordinate, then move to the end coordinate over the duration, e.g. to drag an icon.
+GESTURE_DRAG = 3
+# Do nothing for the duration, e.g. to let an animation play out between two gestures.
+GESTURE_WAIT = 4
+GESTURE_KINDS = [GESTURE_TAP, GESTURE_SWIPE, GESTURE_LONG_PRESS, GESTURE_DRAG, GESTURE_WAIT]
+
+
+class Gesture(object):
+    """
+    Gesture object that designates one touch gesture on the mobile screen, or a wait.
+    """
+
+    def __init__(self, kind, start=(0.0, 0.0), end=None, duration=0):
+        """
+        Initializes the Gesture object.
+        :param kind: kind of the gesture, one of GESTURE_KINDS.
+        :param start: tuple of (x, y) coordinates on the screen the gesture starts at.
+        :param end: tuple of (x, y) coordinates on the screen the gesture ends at, None for the start coordinate.
+        :param duration: duration of the gesture in milliseconds.
+        """
+
+        assert kind in GESTURE_KINDS, str(kind) + " is not a valid gesture kind"
+        assert duration >= 0, "Gesture duration must be non-negative"
+
+        self.kind = kind
+        self.start = tuple(start)
+        self.end = self.start
+        if end is not None:
+            self.end = tuple(end)
+        self.duration = int(duration)
+
+
+def tap(coordinate):
+    """
+    :param coordinate: tuple of (x, y) coordinates to tap.
+    :return: Gesture object.
+    """
+
+    return Gesture(GESTURE_TAP, coordinate)
+
+
+def swipe(start, end, duration):
+    """
+    :param start: tuple of (x, y) coordinates the swipe starts at.
+    :param end: tuple of (x, y) coordinates the swipe ends at.
+    :param duration: duration of the swipe in milliseconds.
+    :return: Gesture object.
+    """
+
+    return Gesture(GESTURE_SWIPE, start, end, duration)
+
+
+def long_press(coordinate, duration):
+    """
+    :param coordinate: tuple of (x, y) coordinates to press.
+    :param duration: time in milliseconds to hold the press.
+    :return: Gesture object.
+    """
+
+    return Gesture(GESTURE_LONG_PRESS, coordinate, duration=duration)
+
+
+def drag(start, end, duration):
+    """
+    :param start: tuple of (x, y) coordinates to pick up at.
+    :param end: tuple of (x, y) coordinates to drop at.
+    :param duration: duration of the move in milliseconds.
+    :return: Gesture object.
+    """
+
+    return Gesture(GESTURE_DRAG, start, end, duration)
+
+
+def wait(duration):
+    """
+    :param duration: time in milliseconds to wait.
+    :return: Gesture object.
+    """
+
+    return Gesture(GESTURE_WAIT, duration=duration)
 
 
 class Action(object):
     """
-    Action object that designates a click on the mobile screen.
+    Action object that designates a click on the mobile screen, or a macro-action: a sequence of gestures that the
+    device side runs back to back before taking a single observation.
     """
 
-    def __init__(self, click_coordinate, is_reset_action=False):
+    # Pickles of actions that predate gestures and sequence ids lack the attributes.
+    gestures = None
+    sequence_id = None
+
+    def __init__(self, click_coordinate, is_reset_action=False, gestures=None, sequence_id=None):
         """
         Initializes the Action object.
-        :param click_coordinate: tuple of (x, y) coordinates on the screen.
+        :param click_coordinate: tuple of (x, y) coordinates on the screen, None for macro-actions.
         :param is_reset_action: flag to indicate whether this action is a 'reset' action
         (return device to initial state)
+        :param gestures: list of Gesture objects making up a macro-action, None for a click.
+        :param sequence_id: id the environment numbers its actions with, so that it can pair observations with the
+        actions they answer while more than one action is in flight. None for unnumbered actions.
         """
 
         self.click_coordinate = click_coordinate
         self.is_reset_action = is_reset_action
+        self.gestures = gestures
+        self.sequence_id = sequence_id
 
-    def serialize(self):
+    def serialize(self, use_pickle=False):
         """
-        Serialize the given action object to a string.
+        Serialize the given action object to a string using the compact binary encoding.
+        :param use_pickle: flag to use the legacy pickle representation understood by older clients.
         :return: string representation of the action.
         """
 
-        return pickle.dumps(self, protocol=2)
+        if use_pickle:
+            return pickle.dumps(self, protocol=2)
+
+        flags = 0
+        x, y = 0.0, 0.0
+        if self.is_reset_action:
+            flags |= FLAG_RESET_ACTION
+        elif self.gestures is not None:
+            flags |= FLAG_GESTURES
+        else:
+            x, y = self.click_coordinate
+        if self.sequence_id is not None:
+            flags |= FLAG_SEQUENCE_ID
+
+        if not flags & (FLAG_GESTURES | FLAG_SEQUENCE_ID):
+            return struct.pack(ENCODING_FORMAT, ENCODING_MAGIC, ENCODING_VERSION, flags, x, y)
+
+        encoded = struct.pack(ENCODING_FORMAT, ENCODING_MAGIC, EXTENDED_ENCODING_VERSION, flags, x, y)
+        if flags & FLAG_SEQUENCE_ID:
+            encoded += struct.pack(SEQUENCE_ID_FORMAT, self.sequence_id)
+        if flags & FLAG_GESTURES:
+            encoded += struct.pack(GESTURE_COUNT_FORMAT, len(self.gestures))
+            for gesture in self.gestures:
+                encoded += struct.pack(GESTURE_FORMAT, gesture.kind, gesture.start[0], gesture.start[1],
+                                       gesture.end[0], gesture.end[1], gesture.duration)
+
+        return encoded
 
     @staticmethod
     def deserialize(str_repr):
         """
-        Deserialize the str_repr of an Action to an action object.
+        Deserialize the str_repr of an Action to an action object. Both the binary encoding and legacy pickles are
+        accepted.
         :param str_repr: String representation of an action.
         :return: Action object.
         """
 
-        return pickle.loads(str_repr)
+        if len(str_repr) < ENCODING_SIZE or struct.unpack_from('>I', str_repr, 0)[0] != ENCODING_MAGIC:
+            return pickle.loads(str_repr)
+
+        _, version, flags, x, y = struct.unpack_from(ENCODING_FORMAT, str_repr, 0)
+
+        if version != ENCODING_VERSION and version != EXTENDED_ENCODING_VERSION:
+            raise Exception("Unsupported action encoding version: " + str(version))
+
+        offset = ENCODING_SIZE
+
+        sequence_id = None
+        if flags & FLAG_SEQUENCE_ID:
+            sequence_id = struct.unpack_from(SEQUENCE_ID_FORMAT, str_repr, offset)[0]
+            offset += SEQUENCE_ID_SIZE
+
+        if flags & FLAG_RESET_ACTION:
+            return Action(None, is_reset_action=True, sequence_id=sequence_id)
+
+        if flags & FLAG_GESTURES:
+            num_gestures = struct.unpack_from(GESTURE_COUNT_FORMAT, str_repr, offset)[0]
+            offset += GESTURE_COUNT_SIZE
+
+            gestures = []
+            for _ in range(num_gestures):
+                kind, start_x, start_y, end_x, end_y, duration = struct.unpack_from(GESTURE_FORMAT, str_repr, offset)
+                gestures.append(Gesture(kind, (start_x, start_y), (end_x, end_y), duration))
+                offset += GESTURE_SIZE
+
+            return Action(None, gestures=gestures, sequence_id=sequence_id)
+
+        return Action((x, y), sequence_id=sequence_id)
 
 
 # Singleton instance of the Action object denoting a 'reset' action.
@@ -1,4 +1,62 @@
 import pickle
+import struct
+
+# Versioned binary envelope: a fixed big-endian header followed by the raw image payload. The header fields are
+# magic, envelope version, image format, compression, height, width, step id, capture timestamp (seconds since
+# the epoch) and, from version 2 on, the settle time (seconds). Legacy pickled observations start with the pickle
+# protocol opcode, which never matches the magic.
+ENVELOPE_MAGIC = 0x4D564F42  # 'MVOB'
+ENVELOPE_VERSION = 2
+ENVELOPE_HEADER_FORMAT = '>IBBBIIIdd'
+ENVELOPE_HEADER_SIZE = struct.calcsize(ENVELOPE_HEADER_FORMAT)
+
+# Header formats of all envelope versions that can be deserialized.
+ENVELOPE_HEADER_FORMATS = {
+    1: '>IBBBIIId',
+    ENVELOPE_VERSION: ENVELOPE_HEADER_FORMAT
+}
+
+# Image formats of the payload. Raw formats are tightly packed, row-major 8 bit pixels of height x width, with the
+# channels in the order given by the name.
+IMAGE_FORMAT_PNG = 0
+IMAGE_FORMAT_RAW_RGB = 1
+IMAGE_FORMAT_RAW_RGBA = 2
+IMAGE_FORMAT_RAW_ARGB = 3
+IMAGE_FORMAT_TILE_DELTA = 4
+
+# Number of 8 bit channels per pixel of the raw image formats.
+RAW_CHANNELS = {
+    IMAGE_FORMAT_RAW_RGB: 3,
+    IMAGE_FORMAT_RAW_RGBA: 4,
+    IMAGE_FORMAT_RAW_ARGB: 4
+}
+
+# Tile delta payloads start with a header of the raw format of the tiles, flags, tile size in pixels, number of tiles
+# sent and frame number. It is followed by the row-major index of each tile sent, then the raw pixels of these tiles,
+# each tile row-major on its own. Tiles in the last row/column are cut off at the image border. Frame numbers count
+# the frames encoded by a codec, modulo TILE_DELTA_FRAME_NUMBER_MODULUS, so that a delta can be checked to build on
+# the frame before it.
+TILE_DELTA_HEADER_FORMAT = '>BBHII'
+TILE_DELTA_HEADER_SIZE = struct.calcsize(TILE_DELTA_HEADER_FORMAT)
+TILE_DELTA_FLAG_KEYFRAME = 1
+TILE_DELTA_FRAME_NUMBER_MODULUS = 2 ** 32
+
+# Compression applied on top of the image format.
+COMPRESSION_NONE = 0
+COMPRESSION_ZLIB = 1
+COMPRESSION_LZ4 = 2
+
+try:
+    BINARY_TYPE = bytes
+except NameError:
+    # Jython 2.5 predates the bytes alias; its str already holds raw bytes.
+    BINARY_TYPE = str
+
+try:
+    PAYLOAD_VIEW = memoryview
+except NameError:
+    # Jython 2.5 has no memoryview, fall back to slicing.
+    PAYLOAD_VIEW = None
 
 
 class Observation(object):
@@ -6,31 +64,127 @@ class Observation(object):
     Observation object that designates a response from the device.
     """
 
-    def __init__(self, image_bytes):
+    def __init__(self, image_bytes, image_format=IMAGE_FORMAT_PNG, compression=COMPRESSION_NONE, height=0,
+                 width=0, step_id=0, timestamp=0.0, settle_time=0.0):
         """
         Initializes the Observation object.
-        :param image_bytes: string of png encoded image.
+        :param image_bytes: string of the encoded image, png unless image_format says otherwise.
+        :param image_format: format of image_bytes, one of the IMAGE_FORMAT_* constants.
+        :param compression: compression applied to image_bytes, one of the COMPRESSION_* constants.
+        :param height: height of the image in pixels, 0 if unknown.
+        :param width: width of the image in pixels, 0 if unknown.
+        :param step_id: id of the step on the device this observation was captured for.
+        :param timestamp: time in seconds since the epoch at which the image was captured.
+        :param settle_time: time in seconds the screen took to settle after the action, 0 if it was not measured.
         """
 
         self.image_bytes = image_bytes
+        self.image_format = image_format
+        self.compression = compression
+        self.height = height
+        self.width = width
+        self.step_id = step_id
+        self.timestamp = timestamp
+        self.settle_time = settle_time
 
-    def serialize(self):
+    def serialize(self, use_pickle=False):
         """
-        Serialize the given observation object to a string. This involves serializing JUST the image bytes.
+        Serialize the given observation object to a string. By default this is the binary envelope, i.e. the header
+        followed by the image bytes as is. Text payloads (str under python3) cannot be framed as raw bytes and fall
+        back to pickling JUST the image bytes, as does use_pickle.
+        :param use_pickle: flag to force the legacy pickle representation.
         :return: string representation of the observation.
         """
 
-        return pickle.dumps(self.image_bytes, protocol=2)
+        if use_pickle or (isinstance(self.image_bytes, str) and BINARY_TYPE is not str):
+            return pickle.dumps(self.image_bytes, protocol=2)
+
+        return self.serialize_header() + self.image_bytes
+
+    def serialize_header(self):
+        """
+        Serialize the header of the binary envelope, so that the image bytes can be written out after it without
+        concatenating the two.
+        :return: string of ENVELOPE_HEADER_SIZE bytes.
+        """
+
+        return struct.pack(
+            ENVELOPE_HEADER_FORMAT,
+            ENVELOPE_MAGIC,
+            ENVELOPE_VERSION,
+            self.image_format,
+            self.compression,
+            self.height,
+            self.width,
+            self.step_id,
+            self.timestamp,
+            self.settle_time
+        )
 
     @staticmethod
     def deserialize(str_repr):
         """
-        Deserialize the str_repr of an observation to an observation object.
+        Deserialize the str_repr of an observation to an observation object. Binary envelopes are unpacked without
+        copying the payload: where available, image_bytes is a memoryview into str_repr.
         :param str_repr: String representation of an observation.
         :return: Observation object.
         """
 
-        # Custom deserialization that involves wrapping the result into a new Observation object.
-        img_bytes = pickle.loads(str_repr, encoding='bytes')
+        if not is_envelope(str_repr):
+            # Custom deserialization that involves wrapping the result into a new Observation object.
+            img_bytes = pickle.loads(str_repr, encoding='bytes')
+
+            return Observation(img_bytes)
+
+        version = struct.unpack_from('>B', str_repr, 4)[0]
+        if version not in ENVELOPE_HEADER_FORMATS:
+            raise Exception("Unsupported observation envelope version: " + str(version))
+
+        header_format = ENVELOPE_HEADER_FORMATS[version]
+        header = struct.unpack_from(header_format, str_repr, 0)
+        image_format, compression, height, width, step_id, timestamp = header[2:8]
+        settle_time = 0.0
+        if len(header) > 8:
+            settle_time = header[8]
+
+        header_size = struct.calcsize(header_format)
+        if PAYLOAD_VIEW is not None:
+            img_bytes = PAYLOAD_VIEW(str_repr)[header_size:]
+        else:
+            img_bytes = str_repr[header_size:]
+
+        return Observation(img_bytes, image_format, compression, height, width, step_id, timestamp, settle_time)
+
+
+def is_envelope(str_repr):
+    """
+    Check whether str_repr is a binary envelope rather than a legacy pickled observation.
+    :param str_repr: String representation of an observation.
+    :return: True if str_repr starts with the envelope magic.
+    """
+
+    return len(str_repr) >= ENVELOPE_HEADER_SIZE and struct.unpack_from('>I', str_repr, 0)[0] == ENVELOPE_MAGIC
+
+
+def png_dimensions(png_bytes):
+    """
+    Read the dimensions of a png image from its IHDR chunk without decoding it.
+    :param png_bytes: string of png encoded image.
+    :return: (height, width) tuple.
+    """
+
+    width, height = struct.unpack_from('>II', png_bytes, 16)
+
+    return height, width
+
+
+def tile_grid_shape(height, width, tile_size):
+    """
+    Compute the number of tile rows and columns covering an image.
+    :param height: height of the image in pixels.
+    :param width: width of the image in pixels.
+    :param tile_size: side length of a tile in pixels.
+    :return: (tile rows, tile columns) tuple.
+    """
 
-        return Observation(img_bytes)
+    return (height + tile_size - 1) // tile_size, (width + tile_size - 1) // tile_size
@@ -8,8 +8,19 @@ AGENT_NAME_KEY = 'agentName'
 NUM_STEPS_KEY = 'numSteps'
 OBSERVATION_DELTA_KEY = 'observationDelta'
 VIDEO_FPS_KEY = 'videoFps'
+JOB_ID_KEY = 'jobId'
+STREAM_FPS_KEY = 'fps'
 
 # Return values by the / and /session endpoints
 SUCCESS_DESIGNATION = "success"
 FAILED_DESIGNATION = "failed"
 INVALID_POST_PARAMETERS_DESIGNATION = "Invalid POST parameters"
+UNKNOWN_JOB_DESIGNATION = "Unknown session job"
+INVALID_STREAM_FPS_DESIGNATION = "Invalid stream fps"
+
+# Time in seconds between keepalive comments of an event stream while a session makes no progress.
+EVENT_KEEPALIVE_INTERVAL = 15
+
+# Default and max number of frames per second of the live stream of a session.
+DEFAULT_STREAM_FPS = 5
+MAX_STREAM_FPS = 20
@@ -0,0 +1,91 @@
+"""
+File that contains the live stream of the screen of a session, which hands the PNG screenshots sent by the device to
+any number of viewers as a multipart stream, without decoding or encoding them.
+"""
+
+import threading
+import time
+
+from eventobjects.observation import COMPRESSION_NONE, IMAGE_FORMAT_PNG
+
+# Boundary between the frames of a stream, see STREAM_MIMETYPE.
+STREAM_BOUNDARY = "frame"
+STREAM_MIMETYPE = "multipart/x-mixed-replace; boundary={}".format(STREAM_BOUNDARY)
+
+# Header of every frame of a stream, filled in with the size of the PNG that follows it.
+FRAME_HEADER = "--{}\r\nContent-Type: image/png\r\nContent-Length: {{}}\r\n\r\n".format(STREAM_BOUNDARY)
+
+
+class LatestFrame(object):
+    """
+    The LatestFrame holds the latest screenshot of a session for its live streams.
+
+    Publishing a screenshot swaps a single reference, whatever the number of viewers, and is skipped altogether while
+    nobody watches; the step loop never waits on a viewer. Every viewer polls the latest frame at its own rate and
+    sends the very bytes shared by all viewers, so a slow viewer only skips frames.
+    """
+
+    def __init__(self):
+        # (version, part header, PNG bytes) of the latest frame, swapped as a whole so a reader never sees a torn frame.
+        self.frame = (0, None, None)
+
+        self.num_viewers = 0
+        self.lock = threading.Lock()
+
+    def publish(self, observation):
+        """
+        Publish the screenshot of an observation, if anybody watches. Only PNG screenshots are published, as other
+        payloads would have to be encoded first.
+        :param observation: Observation object as read from the observation buffer.
+        """
+
+        if self.num_viewers == 0:
+            return
+        if observation.image_format != IMAGE_FORMAT_PNG or observation.compression != COMPRESSION_NONE:
+            return
+
+        png_bytes = observation.image_bytes
+        if not isinstance(png_bytes, bytes):
+            # A view into the buffer the observation was read from, which may be reused for the next one.
+            png_bytes = bytes(png_bytes)
+
+        # Frames are only published by the thread running the session.
+        self.frame = (self.frame[0] + 1, FRAME_HEADER.format(len(png_bytes)).encode('ascii'), png_bytes)
+
+    def add_viewer(self):
+        with self.lock:
+            self.num_viewers += 1
+
+    def remove_viewer(self):
+        with self.lock:
+            self.num_viewers -= 1
+
+
+def stream_frames(latest_frame, fps, is_finished):
+    """
+    Stream the frames published to a LatestFrame as the parts of a multipart response, at most fps times per second.
+    Frames published in between are skipped, and a frame is only sent again once a newer one has been published.
+    :param latest_frame: LatestFrame of the session.
+    :param fps: max number of frames sent per second.
+    :param is_finished: function returning whether the session is over, which ends the stream.
+    :return: generator of the bytes of the response.
+    """
+
+    interval = 1.0 / fps
+    last_version = 0
+
+    latest_frame.add_viewer()
+    try:
+        while not is_finished():
+            next_time = time.time() + interval
+
+            version, header, png_bytes = latest_frame.frame
+            if version > last_version:
+                last_version = version
+                yield header
+                yield png_bytes
+                yield b'\r\n'
+
+            time.sleep(max(0.0, next_time - time.time()))
+    finally:
+        latest_frame.remove_viewer()
@@ -1,14 +1,17 @@
+import json
 import logging
 
-from flask import Flask, make_response, render_template, request
+from flask import Flask, Response, jsonify, make_response, render_template, request
 
 import frontend.frontend_constants as constants
 
 from agents.agent_registry import AGENTS
+from buffers.redis_connection import DEFAULT_REDIS_SOCKET_PATH
 from environment.environment_registry import ENVIRONMENTS
+from frontend.live_stream import STREAM_MIMETYPE, stream_frames
+from frontend.session_jobs import FINISHED_JOB_STATUSES, SessionJobManager
 from session import static_configs
-from session.session_starter import start_multivac_session
-from session.session_status_enum import SessionStatusEnum
+from session.session_starter import is_redis_db_running, start_redis_db
 
 
 app = Flask(__name__)
@@ -24,6 +27,9 @@ ENVIRONMENT_NAME_OPTIONS = sorted(ENVIRONMENTS.keys())
 # Gather options for agent name
 AGENT_NAME_OPTIONS = sorted(AGENTS.keys())
 
+# Sessions run in the background, on the worker threads of the job manager rather than those of the server.
+session_job_manager = SessionJobManager()
+
 
 @app.route('/', methods=['GET', 'POST'])
 def route_index_page():
@@ -50,8 +56,8 @@ def route_index_page():
 @app.route('/session', methods=['POST'])
 def route_session_page():
     """
-    Launch the Multivac session with passed in parameters. Once completed, return a response indicating whether the
-    session successfully completed.
+    Queue a Multivac session with passed in parameters and return the id of its job right away. The session runs in
+    the background; its progress is available from the /session/<job_id> and /session/<job_id>/events endpoints.
     """
 
     try:
@@ -61,30 +67,90 @@ def route_session_page():
         logger.error("Error processing user POST request to /session endpoint: {}".format(e))
         return make_response(constants.INVALID_POST_PARAMETERS_DESIGNATION, 400)
 
-    # Start session with passed in parameters
+    job = session_job_manager.submit(
+        environment_name=environment_name,
+        agent_name=agent_name,
+        num_steps=num_steps,
+        observation_delta=observation_delta,
+        video_fps=video_fps
+    )
+
     logger.info(
         """
-        Starting Multivac session with parameters:
+        Queued Multivac session job {} with parameters:
           1. Environment name: {}
           2. Agent name: {}
           3. Num steps: {}
           4. Observation delta: {}
           5. Video FPS: {}
-        """.format(environment_name, agent_name, num_steps, observation_delta, video_fps)
+        """.format(job.job_id, environment_name, agent_name, num_steps, observation_delta, video_fps)
     )
 
-    status = start_multivac_session(
-        environment_name=environment_name,
-        agent_name=agent_name,
-        num_steps=num_steps,
-        observation_delta=observation_delta,
-        video_fps=video_fps
-    )
+    return make_response(jsonify({constants.JOB_ID_KEY: job.job_id}), 202)
 
-    if status == SessionStatusEnum.SUCCESS:
-        return make_response(constants.SUCCESS_DESIGNATION, 200)
-    else:
-        return make_response(constants.FAILED_DESIGNATION, 500)
+
+@app.route('/session/<job_id>', methods=['GET'])
+def route_session_status(job_id):
+    """
+    Return the status and latest progress of a session job as JSON.
+    """
+
+    job = session_job_manager.get(job_id)
+    if job is None:
+        return make_response(constants.UNKNOWN_JOB_DESIGNATION, 404)
+
+    return jsonify(job.snapshot())
+
+
+@app.route('/session/<job_id>/events', methods=['GET'])
+def route_session_events(job_id):
+    """
+    Stream the status and progress of a session job as Server-Sent Events, one event per change, until the session
+    concludes. Changes made while an event is being sent are coalesced into the next one, so slow clients only ever
+    receive the latest progress.
+    """
+
+    job = session_job_manager.get(job_id)
+    if job is None:
+        return make_response(constants.UNKNOWN_JOB_DESIGNATION, 404)
+
+    def stream_events():
+        last_version = -1
+        while True:
+            snapshot = job.wait_for_update(last_version, constants.EVENT_KEEPALIVE_INTERVAL)
+            if snapshot is None:
+                # Comment line keeping the connection open through proxies.
+                yield ": keepalive\n\n"
+                continue
+
+            last_version = snapshot['version']
+            yield "data: {}\n\n".format(json.dumps(snapshot))
+
+            if snapshot['status'] in FINISHED_JOB_STATUSES:
+                return
+
+    return Response(stream_events(), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+
+@app.route('/session/<job_id>/stream', methods=['GET'])
+def route_session_stream(job_id):
+    """
+    Stream the screen of a session job as a multipart/x-mixed-replace response of PNG frames, which browsers display
+    in an <img> tag, until the session concludes. The screenshots are sent as received from the device, at most
+    ?fps= times per second per client, and only while they change. Requires the png screenshot codec.
+    """
+
+    job = session_job_manager.get(job_id)
+    if job is None:
+        return make_response(constants.UNKNOWN_JOB_DESIGNATION, 404)
+
+    fps = request.args.get(constants.STREAM_FPS_KEY, constants.DEFAULT_STREAM_FPS, type=float)
+    if not 0 < fps <= constants.MAX_STREAM_FPS:
+        return make_response(constants.INVALID_STREAM_FPS_DESIGNATION, 400)
+
+    return Response(stream_frames(job.latest_frame, fps, job.is_finished), mimetype=STREAM_MIMETYPE,
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
 
 
 def render_index_form_page():
@@ -143,4 +209,15 @@ def validate_and_retrieve_multivac_params_from_request_form():
 
 
 if __name__ == '__main__':
-    app.run()
+    # Start redis once for all sessions, rather than having concurrent sessions race to start it. Sessions leave a
+    # server they have not started running.
+    redis_process = None
+    if not is_redis_db_running(static_configs.DEFAULT_REDIS_PORT, DEFAULT_REDIS_SOCKET_PATH):
+        redis_process = start_redis_db(static_configs.DEFAULT_REDIS_PORT, DEFAULT_REDIS_SOCKET_PATH)
+
+    try:
+        app.run(threaded=True)
+    finally:
+        session_job_manager.shutdown()
+        if redis_process is not None:
+            redis_process.terminate()
@@ -0,0 +1,185 @@
+"""
+File that contains the job system running Multivac sessions for the frontend in the background, so that requests return
+right away and the progress of every session can be watched while it runs.
+"""
+
+import logging
+import threading
+import time
+import uuid
+
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from frontend.live_stream import LatestFrame
+from session.session_starter import start_multivac_session
+from session.session_status_enum import SessionStatusEnum
+
+# Statuses of a job.
+JOB_QUEUED = "queued"
+JOB_RUNNING = "running"
+JOB_SUCCEEDED = "succeeded"
+JOB_FAILED = "failed"
+
+FINISHED_JOB_STATUSES = [JOB_SUCCEEDED, JOB_FAILED]
+
+# Default number of sessions run at the same time. Further jobs wait in the queue. Sessions of the frontend connect to
+# whichever device monkeyrunner finds, so running more than one at a time would have them share a device.
+DEFAULT_MAX_CONCURRENT_SESSIONS = 1
+
+# Number of finished jobs kept around for their status to be looked up.
+MAX_FINISHED_JOBS = 100
+
+logger = logging.getLogger(__name__)
+logger.addHandler(logging.StreamHandler())
+logger.setLevel(logging.DEBUG)
+
+
+class SessionJob(object):
+    """
+    The SessionJob tracks a session run by the SessionJobManager. Every change to its status or progress bumps its
+    version, which watchers wait on.
+    """
+
+    def __init__(self, session_params):
+        """
+        Initialize the job.
+        :param session_params: dict of keyword arguments of start_multivac_session().
+        """
+
+        self.job_id = uuid.uuid4().hex
+        self.session_params = session_params
+        self.status = JOB_QUEUED
+        self.progress = dict()
+        self.submit_time = time.time()
+
+        # Latest screenshot of the session, for its live streams.
+        self.latest_frame = LatestFrame()
+
+        self.version = 0
+        self.condition = threading.Condition()
+
+    def update(self, status=None, progress=None):
+        """
+        Update the status and progress of the job, and wake its watchers.
+        :param status: new status, None to leave it.
+        :param progress: dict of progress of the session, see Multivac.report_progress(), None to leave it.
+        """
+
+        with self.condition:
+            if status is not None:
+                self.status = status
+            if progress is not None:
+                self.progress = progress
+            self.version += 1
+            self.condition.notify_all()
+
+    def is_finished(self):
+        return self.status in FINISHED_JOB_STATUSES
+
+    def snapshot(self):
+        """
+        :return: dict of the state of the job, ready to be serialized as JSON.
+        """
+
+        with self.condition:
+            return {
+                'job_id': self.job_id,
+                'status': self.status,
+                'version': self.version,
+                'progress': dict(self.progress),
+                'environment_name': self.session_params['environment_name'],
+                'agent_name': self.session_params['agent_name'],
+                'num_steps': self.session_params['num_steps']
+            }
+
+    def wait_for_update(self, last_version, timeout):
+        """
+        Wait until the job changes beyond a version, or the timeout passes.
+        :param last_version: version of the job the caller has seen.
+        :param timeout: max time in seconds to wait.
+        :return: snapshot of the job if it changed, None on timeout.
+        """
+
+        with self.condition:
+            if not self.condition.wait_for(lambda: self.version > last_version, timeout):
+                return None
+
+        return self.snapshot()
+
+
+class SessionJobManager(object):
+    """
+    The SessionJobManager runs sessions on a pool of worker threads. Submitting a session returns its job right away;
+    the job is then updated as the session makes progress and concludes.
+    """
+
+    def __init__(self, max_concurrent_sessions=DEFAULT_MAX_CONCURRENT_SESSIONS, session_fn=start_multivac_session):
+        """
+        Initialize the manager.
+        :param max_concurrent_sessions: number of sessions run at the same time.
+        :param session_fn: function running a session, taking the keyword arguments of start_multivac_session().
+        """
+
+        self.session_fn = session_fn
+        self.executor = ThreadPoolExecutor(max_workers=max_concurrent_sessions)
+
+        # Jobs by id, in the order they were submitted.
+        self.jobs = OrderedDict()
+        self.lock = threading.Lock()
+
+    def submit(self, **session_params):
+        """
+        Queue a session.
+        :param session_params: keyword arguments of start_multivac_session().
+        :return: SessionJob of the session.
+        """
+
+        job = SessionJob(session_params)
+
+        with self.lock:
+            self.jobs[job.job_id] = job
+            self.prune_finished_jobs()
+
+        self.executor.submit(self.run_job, job)
+
+        return job
+
+    def get(self, job_id):
+        """
+        :param job_id: id of a job.
+        :return: SessionJob, or None if there is no such job.
+        """
+
+        with self.lock:
+            return self.jobs.get(job_id)
+
+    def prune_finished_jobs(self):
+        """
+        Forget the oldest finished jobs beyond MAX_FINISHED_JOBS. Called with the lock held.
+        """
+
+        finished_job_ids = [job_id for job_id, job in self.jobs.items() if job.is_finished()]
+        for job_id in finished_job_ids[:max(0, len(finished_job_ids) - MAX_FINISHED_JOBS)]:
+            del self.jobs[job_id]
+
+    def run_job(self, job):
+        """
+        Run the session of a job on a worker thread.
+        :param job: SessionJob.
+        """
+
+        job.update(status=JOB_RUNNING)
+
+        try:
+            status = self.session_fn(progress_callback=lambda progress: job.update(progress=progress),
+                                     observation_callback=job.latest_frame.publish,
+                                     **job.session_params)
+        except Exception as e:
+            logger.exception("Session of job {} has thrown an exception: {}".format(job.job_id, e))
+            status = SessionStatusEnum.FAILED
+
+        job.update(status=JOB_SUCCEEDED if status == SessionStatusEnum.SUCCESS else JOB_FAILED)
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False)
@@ -1,6 +1,7 @@
 /**
- * Send a POST request to the /session endpoint which launches a Multivac session. Once the session concludes,
- * redirect back to the main page. If the session was a failure, then also display an alert message.
+ * Send a POST request to the /session endpoint which queues a Multivac session, then watch its progress through the
+ * event stream of its job. Once the session concludes, redirect back to the main page. If the session was a failure,
+ * then also display an alert message.
  */
 function sendSessionRequest(environmentName, agentName, numSteps, observationDelta, videoFps) {
     var request = new XMLHttpRequest();
@@ -16,14 +17,45 @@ function sendSessionRequest(environmentName, agentName, numSteps, observationDel
     request.open('POST', '/session');
 
     request.onload = function() {
-        if (request.status === 200 && request.responseText === 'success') {
-            // Session was a success, redirect user.
-            window.location = '/';
+        if (request.status === 202) {
+            watchSession(JSON.parse(request.responseText).jobId);
         } else {
-            alert('Multivac session failed - see logs for more information.')
+            alert('Multivac session could not be started - see logs for more information.')
             window.location = '/';
         };
     };
 
     request.send(data);
 };
+
+/**
+ * Display the progress of a session job as it streams in, and conclude once the session is over.
+ */
+function watchSession(jobId) {
+    var events = new EventSource('/session/' + jobId + '/events');
+
+    document.getElementById('sessionScreen').src = '/session/' + jobId + '/stream';
+
+    events.onmessage = function(event) {
+        var job = JSON.parse(event.data);
+        var progress = job.progress;
+
+        document.getElementById('sessionStatus').textContent = 'Session is ' + job.status;
+        if (progress.step !== undefined) {
+            document.getElementById('sessionStep').textContent = progress.step + ' / ' + progress.num_steps;
+            document.getElementById('sessionReward').textContent =
+                progress.total_reward.toFixed(2) + ' (average ' + progress.average_reward.toFixed(2) + ')';
+            document.getElementById('sessionStepsPerSec').textContent = progress.steps_per_sec.toFixed(2);
+            document.getElementById('sessionLatency').textContent = (progress.step_latency * 1000).toFixed(0) + ' ms';
+        };
+
+        if (job.status === 'succeeded') {
+            events.close();
+            window.location = '/';
+        } else if (job.status === 'failed') {
+            events.close();
+            alert('Multivac session failed - see logs for more information.')
+            window.location = '/';
+        };
+    };
+};
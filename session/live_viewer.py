@@ -0,0 +1,188 @@
+"""
+File that contains the live viewer, which displays the frames of a session in a separate process so that the step
+loop never waits on the GUI.
+"""
+
+import ctypes
+import multiprocessing
+import numpy as np
+
+# Number of frame slots in shared memory. With three, the slot a reader copies from is only written to again once two
+# newer frames have been published, so a reader never has to hold up the writer.
+NUM_FRAME_SLOTS = 3
+
+# Max size in bytes of the text shown along with a frame.
+MAX_TEXT_SIZE = 256
+
+# Default number of times per second the viewer redraws.
+DEFAULT_REFRESH_RATE = 20
+
+
+class SharedFrameBuffer(object):
+    """
+    The SharedFrameBuffer holds the latest frames in shared memory, as a ring of slots guarded by a sequence number.
+
+    The writer fills the slot of the next sequence number and then publishes the number; it never waits on readers. A
+    reader copies the slot of the latest published number and checks afterwards that the writer has not come around to
+    that slot meanwhile, in which case the copy may be torn and is discarded. Readers only ever see the latest frame,
+    so a slow reader skips the frames published in between.
+    """
+
+    def __init__(self, frame_height, frame_width, num_slots=NUM_FRAME_SLOTS):
+        """
+        Allocate the shared memory.
+        :param frame_height: height of the frames in pixels.
+        :param frame_width: width of the frames in pixels.
+        :param num_slots: number of frame slots, at least 3.
+        """
+
+        assert num_slots >= 3, "At least three frame slots are required"
+
+        self.frame_shape = (frame_height, frame_width, 3)
+        self.num_slots = num_slots
+
+        self.frame_memory = multiprocessing.RawArray(ctypes.c_uint8, num_slots * frame_height * frame_width * 3)
+        self.text_memory = multiprocessing.RawArray(ctypes.c_char, num_slots * MAX_TEXT_SIZE)
+        self.sequence = multiprocessing.RawValue(ctypes.c_uint64, 0)
+
+        self.frames = None
+
+    def frame_slots(self):
+        """
+        :return: (num_slots x H x W x 3) uint8 np array over the shared memory, created lazily so that it is created
+        anew in the process the buffer is handed to.
+        """
+
+        if self.frames is None:
+            self.frames = np.frombuffer(self.frame_memory, dtype=np.uint8).reshape((self.num_slots,) + self.frame_shape)
+
+        return self.frames
+
+    def __getstate__(self):
+        state = dict(self.__dict__)
+        state['frames'] = None
+
+        return state
+
+    def write(self, frame, text):
+        """
+        Publish a frame.
+        :param frame: H x W x C np array of the frame, C being 1 or 3. Other dtypes than uint8 are rounded.
+        :param text: text shown along with the frame, truncated to MAX_TEXT_SIZE bytes.
+        """
+
+        sequence = self.sequence.value + 1
+        slot = sequence % self.num_slots
+
+        if frame.dtype != np.uint8:
+            frame = np.rint(frame)
+        np.copyto(self.frame_slots()[slot], frame, casting='unsafe')
+
+        text_bytes = text.encode('utf-8')[:MAX_TEXT_SIZE - 1]
+        self.text_memory[slot * MAX_TEXT_SIZE:slot * MAX_TEXT_SIZE + len(text_bytes) + 1] = text_bytes + b'\0'
+
+        self.sequence.value = sequence
+
+    def read(self, out, last_sequence=0):
+        """
+        Copy the latest frame, if it is newer than the last one read.
+        :param out: H x W x 3 uint8 np array to copy the frame into.
+        :param last_sequence: sequence number of the last frame read.
+        :return: (sequence number, text) tuple of the frame copied into out, or None if there is no newer frame or the
+        copy was torn.
+        """
+
+        sequence = self.sequence.value
+        if sequence <= last_sequence:
+            return None
+
+        slot = sequence % self.num_slots
+        np.copyto(out, self.frame_slots()[slot])
+        text = self.text_memory[slot * MAX_TEXT_SIZE:(slot + 1) * MAX_TEXT_SIZE].split(b'\0', 1)[0]
+
+        # The writer starts writing into the slot again once it has published num_slots - 1 newer frames.
+        if self.sequence.value - sequence >= self.num_slots - 1:
+            return None
+
+        return sequence, text.decode('utf-8', 'replace')
+
+
+def run_viewer(frame_buffer, stop_event, refresh_rate):
+    """
+    Display the latest frame of a SharedFrameBuffer in a matplotlib window, until stop_event is set or the window is
+    closed.
+    :param frame_buffer: SharedFrameBuffer the frames are published to.
+    :param stop_event: multiprocessing.Event signalling the end of the session.
+    :param refresh_rate: number of times per second to redraw.
+    """
+
+    import matplotlib.pyplot as plt
+
+    frame = np.zeros(frame_buffer.frame_shape, dtype=np.uint8)
+
+    figure = plt.figure("MULTIVAC")
+    image = plt.imshow(frame)
+    title = plt.title("")
+    plt.axis('off')
+    plt.show(block=False)
+
+    last_sequence = 0
+    while not stop_event.is_set() and plt.fignum_exists(figure.number):
+        latest = frame_buffer.read(frame, last_sequence)
+        if latest is not None:
+            last_sequence, text = latest
+            image.set_data(frame)
+            title.set_text(text)
+            figure.canvas.draw_idle()
+
+        plt.pause(1.0 / refresh_rate)
+
+    plt.close(figure)
+
+
+class LiveViewer(object):
+    """
+    The LiveViewer displays the frames of a session in a separate process. Showing a frame costs the step loop a copy
+    of the frame into shared memory; the viewer process redraws the latest frame at its own rate and skips the frames
+    it falls behind on.
+    """
+
+    # Time in seconds to wait for the viewer process to exit when closing.
+    CLOSE_TIMEOUT = 2
+
+    def __init__(self, frame_height, frame_width, refresh_rate=DEFAULT_REFRESH_RATE):
+        """
+        Start the viewer process.
+        :param frame_height: height of the frames in pixels.
+        :param frame_width: width of the frames in pixels.
+        :param refresh_rate: number of times per second the viewer redraws.
+        """
+
+        self.frame_buffer = SharedFrameBuffer(frame_height, frame_width)
+        self.stop_event = multiprocessing.Event()
+
+        self.viewer_process = multiprocessing.Process(
+            target=run_viewer,
+            args=(self.frame_buffer, self.stop_event, refresh_rate),
+            daemon=True
+        )
+        self.viewer_process.start()
+
+    def show(self, frame, text):
+        """
+        Hand a frame to the viewer, without waiting for it to be displayed.
+        :param frame: H x W x C np array of the frame, C being 1 or 3.
+        :param text: text shown along with the frame.
+        """
+
+        self.frame_buffer.write(frame, text)
+
+    def close(self):
+        """
+        Stop the viewer process.
+        """
+
+        self.stop_event.set()
+        self.viewer_process.join(self.CLOSE_TIMEOUT)
+        if self.viewer_process.is_alive():
+            self.viewer_process.terminate()
@@ -1,19 +1,35 @@
-import cv2
 import logging
-import matplotlib.pyplot as plt
 import numpy as np
 import os
-import redis
+import shutil
+import time
+
+from collections import deque
 
 from agents.agent_registry import AGENTS
-from buffers.action_buffer import ActionBuffer
-from buffers.observation_buffer import ObservationBuffer
+from buffers.buffer import OVERFLOW_DROP_OLDEST
+from buffers.buffer_factory import LIST_BACKEND, REDIS_TRANSPORT, create_buffers
+from buffers.redis_connection import create_redis_client
+from buffers.shared_memory_observation_buffer import DEFAULT_RING_PATH
+from environment.action_modes import ACTION_MODES
 from environment.android_device_env import AndroidDeviceEnv
 from environment.environment_registry import ENVIRONMENTS
+from environment.observation_preprocessing import ObservationPreprocessor
+from environment.trajectory import TrajectoryRecorder
+from environment.wrappers import FrameSkipWrapper, FrameStackWrapper
+from session.live_viewer import LiveViewer
+from session.video_recorder import DEFAULT_RECORDING_QUEUE_SIZE, RECORDING_POLICY_BLOCK, VideoRecorder
+
+# Number of steps between logs of the observation buffer depth and drops.
+BUFFER_STATS_LOG_INTERVAL = 10
 
+# Recording sinks. A video sink encodes every frame into an mp4 video during the session. An archive sink appends the
+# observations as sent by the device, along with the actions and rewards, to a trajectory on disk, which
+# session/transcode_recording.py turns into a video afterwards.
+RECORDING_SINK_VIDEO = "video"
+RECORDING_SINK_ARCHIVE = "archive"
 
-# Height for text portion of the video frame.
-TEXT_HEIGHT = 100
+RECORDING_SINKS = [RECORDING_SINK_VIDEO, RECORDING_SINK_ARCHIVE]
 
 # Base path for outputting recordings. Note: if you run two sessions with same agent and environment name, then
 # any old videos will be replaced.
@@ -25,7 +41,13 @@ class Multivac:
     The Multivac class starts an environment and an agent in that environment.
     """
 
-    def __init__(self, environment_name, agent_name, num_steps, redis_port, video_fps=1, display_video=False):
+    def __init__(self, environment_name, agent_name, num_steps, redis_port, video_fps=1, display_video=False,
+                 observation_transport=REDIS_TRANSPORT, ring_path=DEFAULT_RING_PATH, buffer_backend=LIST_BACKEND,
+                 observation_capacity=0, overflow_policy=OVERFLOW_DROP_OLDEST, session_id=None, crop_box=None,
+                 resize_factor=1, grayscale=False, observation_dtype='uint8', action_mode='touch', pipeline_depth=1,
+                 frame_skip=1, frame_stack=1, trajectory_path=None, recording_queue_size=DEFAULT_RECORDING_QUEUE_SIZE,
+                 recording_policy=RECORDING_POLICY_BLOCK, recording_sink=RECORDING_SINK_VIDEO,
+                 progress_callback=None, observation_callback=None, redis_socket_path=None):
         """
         Initialize the Multivac. This involves,
           1. Open a redis client and setting up an action and observation buffer. This establishes an exchange
@@ -40,21 +62,63 @@ class Multivac:
         :param redis_port: Port number that the redis server is running on. This is used to set up buffer objects.
         :param video_fps: frame per second of the output video. Each frame will be one observation image.
         :param display_video: Boolean flag indicating whether or not to display the video of the Gym environment during
-                              execution.
+                              execution, in a viewer process of its own.
+        :param observation_transport: How observations are handed over by the ConnectionClient, one of
+                                      OBSERVATION_TRANSPORTS.
+        :param ring_path: Path to the ring file used by the shared memory observation transport.
+        :param buffer_backend: Redis data structure backing the buffers, one of BUFFER_BACKENDS.
+        :param observation_capacity: Max number of observations held by the observation buffer, 0 for unbounded.
+        :param overflow_policy: Policy applied when the observation buffer is full, one of OVERFLOW_POLICIES.
+        :param session_id: Id of the session, scoping its buffers so that many sessions can share one redis server.
+        :param crop_box: (left, top, right, bottom) box observations are cropped to, None to keep the whole screen.
+        :param resize_factor: Integer factor observations are shrunk by.
+        :param grayscale: Whether to convert observations to grayscale.
+        :param observation_dtype: Name of the dtype of observations, one of DTYPES.
+        :param action_mode: Name of the action mode defining the action space, one of ACTION_MODES.
+        :param pipeline_depth: Max number of actions in flight. With more than one, the agent picks actions from
+                               observations that are up to pipeline_depth - 1 steps old, while rewards are computed
+                               and frames recorded as the device works through the actions ahead.
+        :param frame_skip: Number of times every action of the agent is taken, summing the rewards.
+        :param frame_stack: Number of latest observations stacked into every observation the agent sees.
+        :param trajectory_path: Path to the directory the trajectory of the session is recorded into, None to not
+                                record it. Recordings can be replayed by a ReplayAndroidDeviceEnv.
+        :param recording_queue_size: Number of video frames held in memory waiting to be encoded.
+        :param recording_policy: What happens to video frames while the encoder falls behind, one of
+                                 RECORDING_POLICIES.
+        :param recording_sink: Where the session is recorded to, one of RECORDING_SINKS. An archive goes to
+                               trajectory_path if given.
+        :param progress_callback: Function called with a dict of the progress of the session after every step, see
+                                  report_progress(). None to not report progress.
+        :param observation_callback: Function called with every raw Observation read from the device, before any
+                                     preprocessing, e.g. to stream the screen. None to not pass them on.
+        :param redis_socket_path: Path to the unix domain socket of the redis server, None to connect over TCP.
         """
 
-        self.logger = logging.getLogger("Multivac")
+        self.logger = logging.getLogger("Multivac" if session_id is None else "Multivac-{}".format(session_id))
         self.logger.addHandler(logging.StreamHandler())
         self.logger.setLevel(logging.DEBUG)
 
         assert environment_name in ENVIRONMENTS, "{} is not a valid environment name".format(environment_name)
         assert agent_name in AGENTS, "{} is not a valid agent name".format(agent_name)
-
-        # Start Redis connection on specified port.
-        self.redis_client = redis.Redis(port=redis_port)
-
-        action_buffer = ActionBuffer(self.redis_client)
-        observation_buffer = ObservationBuffer(self.redis_client)
+        assert action_mode in ACTION_MODES, "{} is not a valid action mode".format(action_mode)
+        assert type(pipeline_depth) == int and pipeline_depth >= 1, "Pipeline depth must be a positive integer"
+        assert type(frame_skip) == int and frame_skip >= 1, "Frame skip must be a positive integer"
+        assert type(frame_stack) == int and frame_stack >= 1, "Frame stack must be a positive integer"
+        assert recording_sink in RECORDING_SINKS, "{} is not a valid recording sink".format(recording_sink)
+
+        # Start Redis connection on specified port or socket.
+        self.redis_client = create_redis_client(redis_port, socket_path=redis_socket_path)
+
+        action_buffer, observation_buffer = create_buffers(
+            self.redis_client,
+            observation_transport,
+            ring_path,
+            buffer_backend,
+            observation_capacity,
+            overflow_policy,
+            session_id
+        )
+        self.observation_buffer = observation_buffer
 
         # Stall until we get the first observation from the observation buffer to collect metadata
         self.logger.debug("Gathering initial image from observation buffer")
@@ -70,32 +134,62 @@ class Multivac:
             action_buffer,
             observation_buffer,
             image_height,
-            image_width
+            image_width,
+            preprocessor=ObservationPreprocessor(crop_box, resize_factor, grayscale, observation_dtype),
+            action_mode=ACTION_MODES[action_mode](image_height, image_width)
         )
 
-        self.agent = AGENTS[agent_name](self.environment)
+        if not os.path.exists(OUTPUT_RECORDING_BASE_PATH):
+            os.mkdir(OUTPUT_RECORDING_BASE_PATH)
 
-        self.num_steps = num_steps
+        recording_name = "{}-{}".format(agent_name, environment_name)
+        if session_id is not None:
+            recording_name = "{}-{}".format(recording_name, session_id)
 
-        self.display_video = display_video
+        # An archive is a trajectory, so it is recorded by the environment along with every step. Like videos, an
+        # archive at the default path is replaced.
+        if recording_sink == RECORDING_SINK_ARCHIVE and trajectory_path is None:
+            trajectory_path = os.path.join(OUTPUT_RECORDING_BASE_PATH, "{}-archive".format(recording_name))
+            if os.path.exists(trajectory_path):
+                shutil.rmtree(trajectory_path)
 
-        # Set up the video recorder.
-        fourcc = cv2.VideoWriter_fourcc(*'mp4v')
+        self.trajectory_recorder = None
+        if trajectory_path is not None:
+            self.trajectory_recorder = TrajectoryRecorder(trajectory_path)
+            self.environment.trajectory_recorder = self.trajectory_recorder
+        self.environment.observation_callback = observation_callback
 
-        if not os.path.exists(OUTPUT_RECORDING_BASE_PATH):
-            os.mkdir(OUTPUT_RECORDING_BASE_PATH)
+        if frame_skip > 1:
+            self.environment = FrameSkipWrapper(self.environment, frame_skip)
+        if frame_stack > 1:
+            self.environment = FrameStackWrapper(self.environment, frame_stack)
 
-        output_recording_path = os.path.join(
-            OUTPUT_RECORDING_BASE_PATH,
-            "{}-{}.mp4".format(agent_name, environment_name)
-        )
+        self.agent = AGENTS[agent_name](self.environment)
 
-        self.video_writer = cv2.VideoWriter(
-            output_recording_path,
-            fourcc,
-            float(video_fps),
-            (image_width, image_height + TEXT_HEIGHT)
-        )
+        self.num_steps = num_steps
+        self.pipeline_depth = pipeline_depth
+        self.progress_callback = progress_callback
+
+        # Frames are displayed by a separate viewer process, so that the GUI never holds up the steps.
+        self.live_viewer = None
+        if display_video:
+            frame_height, frame_width, _ = self.environment.unwrapped.observation_space.shape
+            self.live_viewer = LiveViewer(frame_height, frame_width)
+
+        # Set up the video recorder. Frames are the preprocessed observations the agent sees.
+        self.video_recorder = None
+        if recording_sink == RECORDING_SINK_VIDEO:
+            frame_height, frame_width, _ = self.environment.unwrapped.observation_space.shape
+            output_recording_path = os.path.join(OUTPUT_RECORDING_BASE_PATH, "{}.mp4".format(recording_name))
+
+            self.video_recorder = VideoRecorder(
+                output_recording_path,
+                video_fps,
+                frame_height,
+                frame_width,
+                recording_queue_size,
+                recording_policy
+            )
 
     def launch(self):
         """
@@ -104,6 +198,13 @@ class Multivac:
         First, we reset the environment back to its original state and gather an initial observation.
         Once this is complete, the agent carries out num_steps actions on the environment. After each action,
         we record the observation image and render it to the user. At the end, we write the resulting video to disk.
+
+        Steps are pipelined: as soon as the observation of a step arrives, the agent picks the next actions, keeping
+        up to pipeline_depth actions in flight, and only then is the step recorded. Recording, and with a depth above
+        one also the agent and the reward computation, thereby overlap with the device carrying out actions.
+
+        At the end, the throughput in steps/sec and the latencies from sending an action to completing its step are
+        logged, e.g. to load test the pipeline against simulated devices.
         """
 
         # Reset the environment to its initial state. This also allows us to get an initial observation image.
@@ -115,16 +216,94 @@ class Multivac:
         total_reward = 0.0
         self.process_rendered_img(0, total_reward)
 
+        # Times the actions in flight were sent at, oldest first, and the latencies of the completed steps.
+        send_times = deque()
+        step_latencies = []
+
+        start_time = time.time()
+        num_actions_sent = 0
         for step in range(1, self.num_steps + 1):
-            action = self.agent.take_action(curr_obs)
-            curr_obs, reward, info = self.environment.step(action)
+            # Fill the pipeline with actions based on the newest observation.
+            while self.environment.num_actions_in_flight() < self.pipeline_depth and \
+                    num_actions_sent < self.num_steps:
+                self.environment.step_async(self.agent.take_action(curr_obs))
+                send_times.append(time.time())
+                num_actions_sent += 1
+
+            curr_obs, reward, info = self.environment.step_wait()
+            step_latencies.append(time.time() - send_times.popleft())
             total_reward += reward
+
+            # Send the next action before recording, so that the device does not sit idle meanwhile.
+            if num_actions_sent < self.num_steps:
+                self.environment.step_async(self.agent.take_action(curr_obs))
+                send_times.append(time.time())
+                num_actions_sent += 1
+
             self.process_rendered_img(step, total_reward / step)
+            self.report_progress(step, total_reward, time.time() - start_time, step_latencies[-1])
+
+            if step % BUFFER_STATS_LOG_INTERVAL == 0:
+                self.log_buffer_stats()
 
         self.logger.info("FINAL TOTAL REWARD: {}".format(total_reward))
         self.logger.info("FINAL AVERAGE REWARD: {}".format(total_reward / self.num_steps))
 
-        self.video_writer.release()
+        self.log_step_stats(step_latencies, time.time() - start_time)
+        self.log_buffer_stats()
+
+        if self.video_recorder is not None:
+            self.video_recorder.close()
+
+        if self.live_viewer is not None:
+            self.live_viewer.close()
+
+        if self.trajectory_recorder is not None:
+            self.trajectory_recorder.close()
+
+        self.observation_buffer.close()
+
+    def report_progress(self, step, total_reward, elapsed, step_latency):
+        """
+        Hand the progress of the session to the progress callback, if any.
+        :param step: number of steps completed.
+        :param total_reward: sum of the rewards so far.
+        :param elapsed: time in seconds since the first step was sent.
+        :param step_latency: time in seconds from sending the action of the latest step to completing it.
+        """
+
+        if self.progress_callback is None:
+            return
+
+        self.progress_callback({
+            'step': step,
+            'num_steps': self.num_steps,
+            'total_reward': total_reward,
+            'average_reward': total_reward / step,
+            'steps_per_sec': step / elapsed if elapsed > 0 else 0.0,
+            'step_latency': step_latency
+        })
+
+    def log_step_stats(self, step_latencies, elapsed):
+        """
+        Log the throughput of the session and the median and tail latencies of its steps.
+        :param step_latencies: list of the times in seconds from sending an action to completing its step.
+        :param elapsed: time in seconds the steps took in total.
+        """
+
+        p50, p90, p99 = np.percentile(step_latencies, [50, 90, 99]) * 1000
+        self.logger.info("Steps/sec: {:.2f}; step latency p50: {:.1f} ms, p90: {:.1f} ms, p99: {:.1f} ms, max: {:.1f} "
+                         "ms".format(len(step_latencies) / elapsed, p50, p90, p99, max(step_latencies) * 1000))
+
+    def log_buffer_stats(self):
+        """
+        Log the current depth of the observation buffer and the number of observations it dropped.
+        """
+
+        self.logger.debug("Observation buffer depth: {}; dropped observations: {}".format(
+            self.observation_buffer.depth(),
+            self.observation_buffer.num_dropped()
+        ))
 
     def process_rendered_img(self, step_no, average_reward):
         """
@@ -133,38 +312,19 @@ class Multivac:
         :param average_reward: average reward so far.
         """
 
+        if self.live_viewer is None and self.video_recorder is None:
+            return
+
         # Gather rendered image.
         rendered_img = self.environment.render(mode='rgb_array')
 
         # Construct informational text.
         text_to_display = "{} | Step: {} | Average Reward: {:.2f}".format("MULTIVAC", step_no, average_reward)
 
-        if self.display_video:
-            # Display to user.
-            plt.figure(3)
-            plt.clf()
-            plt.imshow(rendered_img)
-            plt.title(text_to_display)
-            plt.axis('off')
-            plt.pause(0.05)
-
-        # Write image as a single frame with informational text added on.
-        text_img = np.full(shape=(TEXT_HEIGHT, rendered_img.shape[1], 3), fill_value=255, dtype=np.uint8)
-
-        cv2.putText(
-            img=text_img,
-            text=text_to_display,
-            org=(0, int(TEXT_HEIGHT / 2)),
-            fontFace=cv2.FONT_HERSHEY_SIMPLEX,
-            fontScale=1,
-            color=(0, 0, 0),
-            thickness=2,
-            lineType=2
-        )
-
-        full_img = np.concatenate([text_img, rendered_img])
-
-        # OpenCV video writer requires image in BGR format
-        full_img_bgr = cv2.cvtColor(full_img, cv2.COLOR_RGB2BGR)
+        # Display to user.
+        if self.live_viewer is not None:
+            self.live_viewer.show(rendered_img, text_to_display)
 
-        self.video_writer.write(full_img_bgr)
+        # Hand the frame to the recorder, which encodes it with the informational text added on in the background.
+        if self.video_recorder is not None:
+            self.video_recorder.record(rendered_img, text_to_display)
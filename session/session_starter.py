@@ -11,16 +11,32 @@ import argparse
 import json
 import logging
 import os
+import redis
 import signal
 import subprocess
+import sys
 import threading
 import time
+import uuid
 
 from agents.agent_registry import AGENTS
+from buffers.buffer import OVERFLOW_DROP_OLDEST, OVERFLOW_POLICIES, SESSION_KEY_PREFIX, delete_session_keys, \
+    overflow_evicts
+from buffers.buffer_factory import BUFFER_BACKENDS, LIST_BACKEND, OBSERVATION_TRANSPORTS, REDIS_TRANSPORT, \
+    SHARED_MEMORY_TRANSPORT, session_ring_path
+from buffers.redis_connection import DEFAULT_REDIS_SOCKET_PATH, create_redis_client
+from buffers.shared_memory_observation_buffer import DEFAULT_RING_PATH
+from device.observation_codecs import AUTO_CODEC_NAME, CODECS, DEFAULT_CODEC_NAME, LZ4_CODEC_NAMES, \
+    TILE_DELTA_CODEC_NAMES
+from device.screen_settle import CAPTURE_MODE_SLEEP, CAPTURE_MODES, DEFAULT_SETTLE_FRAMES, DEFAULT_SETTLE_TIMEOUT
+from device.simulated_connection_client import DEFAULT_LATENCY_DISTRIBUTION, LATENCY_DISTRIBUTIONS
+from environment.action_modes import ACTION_MODES
 from environment.environment_registry import ENVIRONMENTS
+from environment.observation_preprocessing import DTYPES
 from session import static_configs
-from session.multivac import Multivac
+from session.multivac import Multivac, RECORDING_SINK_VIDEO, RECORDING_SINKS
 from session.session_status_enum import SessionStatusEnum
+from session.video_recorder import DEFAULT_RECORDING_QUEUE_SIZE, RECORDING_POLICIES, RECORDING_POLICY_BLOCK
 
 logger = logging.getLogger("Multivac Session Starter")
 logger.addHandler(logging.StreamHandler())
@@ -38,48 +54,242 @@ ENVIRONMENT_NAME = "environment-name"
 AGENT_NAME = "agent-name"
 VIDEO_FPS = "video-fps"
 DISPLAY_VIDEO = "display-video"
+OBSERVATION_CODEC = "observation-codec"
+OBSERVATION_TRANSPORT = "observation-transport"
+RING_PATH = "ring-path"
+BUFFER_BACKEND = "buffer-backend"
+OBSERVATION_CAPACITY = "observation-capacity"
+OVERFLOW_POLICY = "overflow-policy"
+SESSION_ID = "session-id"
+DEVICE_ID = "device-id"
+REDIS_SOCKET_PATH = "redis-socket-path"
+CROP_BOX = "crop-box"
+RESIZE_FACTOR = "resize-factor"
+GRAYSCALE = "grayscale"
+OBSERVATION_DTYPE = "observation-dtype"
+CAPTURE_MODE = "capture-mode"
+SETTLE_FRAMES = "settle-frames"
+SETTLE_TIMEOUT = "settle-timeout"
+ACTION_MODE = "action-mode"
+PIPELINE_DEPTH = "pipeline-depth"
+FRAME_SKIP = "frame-skip"
+FRAME_STACK = "frame-stack"
+RECORD_TRAJECTORY = "record-trajectory"
+RECORDING_QUEUE_SIZE = "recording-queue-size"
+RECORDING_POLICY = "recording-policy"
+RECORDING_SINK = "recording-sink"
+SIMULATED_DEVICE = "simulated-device"
+SIMULATED_SCREEN_SIZE = "simulated-screen-size"
+SIMULATED_LATENCY_DISTRIBUTION = "simulated-latency-distribution"
+SIMULATED_LATENCY = "simulated-latency"
+SIMULATED_LATENCY_JITTER = "simulated-latency-jitter"
+SIMULATED_SCREENSHOT_FAILURE_RATE = "simulated-screenshot-failure-rate"
+
+# Time in seconds to wait for a started redis server to accept connections.
+REDIS_STARTUP_TIMEOUT = 10
 
 # Fixed paths
 CFG_FILE_PATH = "run_config.json"
 CONNECTION_CLIENT_STARTER_SCRIPT_PATH = "device/connection_client_starter.py"
+SIMULATED_CONNECTION_CLIENT_STARTER_SCRIPT_PATH = "device/simulated_connection_client_starter.py"
 
+# Redis keys shared by all sessions: the number of sessions using the redis server, and a flag set if a session started
+# the server. Such a server is shut down by the last session to end, whichever session started it.
+NUM_SESSIONS_KEY = SESSION_KEY_PREFIX + "num_sessions"
+SERVER_STARTED_BY_SESSION_KEY = SESSION_KEY_PREFIX + "server_started_by_session"
 
-def flush_redis_db():
+
+def clear_session(session_id, redis_port, redis_socket_path=None):
+    """
+    Delete the pending actions and observations of a session from redis. Other sessions sharing the redis server are
+    left untouched.
+    :param session_id: Id of the session.
+    :param redis_port: Port that the redis server is running in.
+    :param redis_socket_path: Path to the unix domain socket of the redis server, None to connect over TCP.
+    """
+
+    try:
+        delete_session_keys(create_redis_client(redis_port, socket_path=redis_socket_path), session_id)
+    except redis.ConnectionError:
+        logger.error("Could not connect to redis to clear the keys of session {}".format(session_id))
+
+
+def register_session(redis_port, redis_socket_path=None, started_server=False):
+    """
+    Count a session among the users of the redis server.
+    :param redis_port: Port that the redis server is running in.
+    :param redis_socket_path: Path to the unix domain socket of the redis server, None to connect over TCP.
+    :param started_server: Whether the session has started the redis server.
+    """
+
+    redis_client = create_redis_client(redis_port, socket_path=redis_socket_path)
+    if started_server:
+        # Counts left over by an earlier server, e.g. one loading a snapshot, do not apply to the new one.
+        redis_client.set(NUM_SESSIONS_KEY, 0)
+        redis_client.set(SERVER_STARTED_BY_SESSION_KEY, 1)
+    redis_client.incr(NUM_SESSIONS_KEY)
+
+
+def unregister_session(redis_port, redis_socket_path=None):
     """
-    Flush all existing data from redis to remove any pending actions and observations.
+    Stop counting a session among the users of the redis server, and shut the server down if the session was its last
+    user and a session started it. Servers started otherwise, e.g. by hand or by the frontend, are left running.
+    :param redis_port: Port that the redis server is running in.
+    :param redis_socket_path: Path to the unix domain socket of the redis server, None to connect over TCP.
     """
 
-    subprocess.run(["redis-cli", "flushall"])
+    try:
+        redis_client = create_redis_client(redis_port, socket_path=redis_socket_path)
+        if redis_client.decr(NUM_SESSIONS_KEY) <= 0 and redis_client.exists(SERVER_STARTED_BY_SESSION_KEY):
+            logger.info("Last session using redis has ended, shutting down the redis server")
+            redis_client.shutdown()
+    except redis.ConnectionError:
+        # The server is gone already, or has just been shut down.
+        pass
 
 
-def start_redis_db():
+def is_redis_db_running(redis_port, redis_socket_path=None):
+    """
+    Check whether a redis server is listening, e.g. one shared by several sessions.
+    :param redis_port: Port of the redis server.
+    :param redis_socket_path: Path to the unix domain socket of the redis server, None to connect over TCP.
+    :return: True if the server responds.
     """
-    Starts the redis DB at the default port.
+
+    try:
+        return create_redis_client(redis_port, socket_path=redis_socket_path).ping()
+    except redis.ConnectionError:
+        return False
+
+
+def start_redis_db(redis_port, redis_socket_path=None):
+    """
+    Starts the redis DB and waits for it to accept connections. The server does not save snapshots, as the buffers
+    and the session counts only make sense while it runs.
+    :param redis_port: Port for the redis server to listen on.
+    :param redis_socket_path: Path to the unix domain socket for the redis server to listen on as well, None for TCP
+    only.
     :return Popen object corresponding to the child process running the redis server.
     """
 
-    redis_server_process = subprocess.Popen(["redis-server"])
+    args = ["redis-server", "--port", str(redis_port), "--save", ""]
+    if redis_socket_path:
+        args += ["--unixsocket", redis_socket_path, "--unixsocketperm", "700"]
+
+    redis_server_process = subprocess.Popen(args)
+
+    deadline = time.time() + REDIS_STARTUP_TIMEOUT
+    while redis_server_process.poll() is None and not is_redis_db_running(redis_port, redis_socket_path) and \
+            time.time() < deadline:
+        time.sleep(0.1)
+
+    if redis_server_process.poll() is not None:
+        raise Exception("The redis server exited with code {} on startup, see its output for the cause".format(
+            redis_server_process.returncode))
+    if not is_redis_db_running(redis_port, redis_socket_path):
+        redis_server_process.terminate()
+        raise Exception("The redis server did not accept connections on port {} within {} seconds".format(
+            redis_port, REDIS_STARTUP_TIMEOUT))
+
     return redis_server_process
 
 
-def start_connection_client(monkeyrunner_path, redispy_path, redis_port, observation_delta):
+def start_connection_client(monkeyrunner_path, redispy_path, redis_port, observation_delta, redis_socket_path=None,
+                            observation_codec=DEFAULT_CODEC_NAME, observation_transport=REDIS_TRANSPORT,
+                            ring_path=DEFAULT_RING_PATH, buffer_backend=LIST_BACKEND, observation_capacity=0,
+                            overflow_policy=OVERFLOW_DROP_OLDEST, session_id=None, device_id=None,
+                            capture_mode=CAPTURE_MODE_SLEEP, settle_frames=DEFAULT_SETTLE_FRAMES,
+                            settle_timeout=DEFAULT_SETTLE_TIMEOUT):
     """
     Starts the connection client by invoking the starter script with appropriate parameters.
     :param monkeyrunner_path: Local path to the monkeyrunner bin.
     :param redispy_path: Local path to modified redis py library that is compatible with jython 2.5.
     :param redis_port: Port that the redis server is running in.
     :param observation_delta: Time interval between observations.
+    :param redis_socket_path: Path to the unix domain socket of the redis server, None to connect over TCP.
+    :param observation_codec: Name of the codec the connection client encodes screenshots with.
+    :param observation_transport: How observations are handed to the Multivac.
+    :param ring_path: Path to the ring file used by the shared memory observation transport.
+    :param buffer_backend: Redis data structure backing the buffers.
+    :param observation_capacity: Max number of observations held by the observation buffer, 0 for unbounded.
+    :param overflow_policy: Policy applied when the observation buffer is full.
+    :param session_id: Id of the session scoping its redis keys.
+    :param device_id: Serial of the device to connect to, None for any device.
+    :param capture_mode: When the connection client takes the screenshot after an action.
+    :param settle_frames: Number of successive identical screenshots a settled screen takes.
+    :param settle_timeout: Max time in milliseconds to wait for the screen to settle.
     :return Popen object corresponding to the process running the connection client.
     """
 
-    connection_client_process = subprocess.Popen(
-        [monkeyrunner_path, CONNECTION_CLIENT_STARTER_SCRIPT_PATH, redispy_path, str(redis_port),
-         str(observation_delta)]
-    )
+    args = [monkeyrunner_path, CONNECTION_CLIENT_STARTER_SCRIPT_PATH, redispy_path, str(redis_port),
+            str(observation_delta), '--' + OBSERVATION_CODEC, observation_codec,
+            '--' + OBSERVATION_TRANSPORT, observation_transport, '--' + RING_PATH, ring_path,
+            '--' + BUFFER_BACKEND, buffer_backend, '--' + OBSERVATION_CAPACITY, str(observation_capacity),
+            '--' + OVERFLOW_POLICY, overflow_policy, '--' + CAPTURE_MODE, capture_mode,
+            '--' + SETTLE_FRAMES, str(settle_frames), '--' + SETTLE_TIMEOUT, str(settle_timeout)]
+
+    if redis_socket_path:
+        args += ['--' + REDIS_SOCKET_PATH, redis_socket_path]
+    if session_id is not None:
+        args += ['--' + SESSION_ID, session_id]
+    if device_id is not None:
+        args += ['--' + DEVICE_ID, device_id]
+
+    connection_client_process = subprocess.Popen(args)
 
     return connection_client_process
 
 
+def start_simulated_connection_client(redis_port, observation_delta, redis_socket_path=None,
+                                      observation_codec=DEFAULT_CODEC_NAME, observation_transport=REDIS_TRANSPORT,
+                                      ring_path=DEFAULT_RING_PATH, buffer_backend=LIST_BACKEND,
+                                      observation_capacity=0, overflow_policy=OVERFLOW_DROP_OLDEST, session_id=None,
+                                      capture_mode=CAPTURE_MODE_SLEEP, settle_frames=DEFAULT_SETTLE_FRAMES,
+                                      settle_timeout=DEFAULT_SETTLE_TIMEOUT, screen_size=(1920, 1080),
+                                      latency_distribution=DEFAULT_LATENCY_DISTRIBUTION, latency=100,
+                                      latency_jitter=50, screenshot_failure_rate=0.0):
+    """
+    Starts a simulated connection client in place of the connection client, running on the python interpreter of
+    this process instead of monkeyrunner.
+    :param redis_port: Port that the redis server is running in.
+    :param observation_delta: Time interval between observations.
+    :param redis_socket_path: Path to the unix domain socket of the redis server, None to connect over TCP.
+    :param observation_codec: Name of the codec the connection client encodes screenshots with.
+    :param observation_transport: How observations are handed to the Multivac.
+    :param ring_path: Path to the ring file used by the shared memory observation transport.
+    :param buffer_backend: Redis data structure backing the buffers.
+    :param observation_capacity: Max number of observations held by the observation buffer, 0 for unbounded.
+    :param overflow_policy: Policy applied when the observation buffer is full.
+    :param session_id: Id of the session scoping its redis keys.
+    :param capture_mode: When the connection client takes the screenshot after an action.
+    :param settle_frames: Number of successive identical screenshots a settled screen takes.
+    :param settle_timeout: Max time in milliseconds to wait for the screen to settle.
+    :param screen_size: (height, width) of the simulated screen in pixels.
+    :param latency_distribution: Name of the distribution of screenshot latencies.
+    :param latency: Mean screenshot latency in milliseconds.
+    :param latency_jitter: Standard deviation of the screenshot latency in milliseconds.
+    :param screenshot_failure_rate: Probability of a screenshot failing.
+    :return Popen object corresponding to the process running the simulated connection client.
+    """
+
+    args = [sys.executable, SIMULATED_CONNECTION_CLIENT_STARTER_SCRIPT_PATH, str(redis_port), str(observation_delta),
+            '--' + OBSERVATION_CODEC, observation_codec, '--' + OBSERVATION_TRANSPORT, observation_transport,
+            '--' + RING_PATH, ring_path, '--' + BUFFER_BACKEND, buffer_backend,
+            '--' + OBSERVATION_CAPACITY, str(observation_capacity), '--' + OVERFLOW_POLICY, overflow_policy,
+            '--' + CAPTURE_MODE, capture_mode, '--' + SETTLE_FRAMES, str(settle_frames),
+            '--' + SETTLE_TIMEOUT, str(settle_timeout), '--image-height', str(screen_size[0]),
+            '--image-width', str(screen_size[1]), '--latency-distribution', latency_distribution,
+            '--latency', str(latency), '--latency-jitter', str(latency_jitter),
+            '--screenshot-failure-rate', str(screenshot_failure_rate)]
+
+    if redis_socket_path:
+        args += ['--' + REDIS_SOCKET_PATH, redis_socket_path]
+    if session_id is not None:
+        args += ['--' + SESSION_ID, session_id]
+
+    return subprocess.Popen(args)
+
+
 def parse_config_file():
     """
     Parse the config file located at CFG_FILE_PATH; raise exception if the file does not exist.
@@ -122,13 +332,114 @@ def parse_args():
                              "Each frame will be one observation image.")
     parser.add_argument('--' + DISPLAY_VIDEO, default=False, action='store_true',
                         help="Flag to determine whether or not to manually display session in a window separate from "
-                             "the device/emulator or UI.")
+                             "the device/emulator or UI. The window is drawn by a viewer process of its own, which "
+                             "skips frames when it falls behind.")
+    parser.add_argument('--' + OBSERVATION_CODEC, type=str, required=False, default=DEFAULT_CODEC_NAME,
+                        choices=sorted(CODECS.keys()) + [AUTO_CODEC_NAME],
+                        help="Codec used to encode screenshots on the device side. '{}' measures all codecs and "
+                             "picks the one with the lowest latency. The lz4 codecs are only available to a "
+                             "simulated device.".format(AUTO_CODEC_NAME))
+    parser.add_argument('--' + OBSERVATION_TRANSPORT, type=str, required=False, default=REDIS_TRANSPORT,
+                        choices=OBSERVATION_TRANSPORTS,
+                        help="How observations are handed from the device side to the Multivac. Shared memory "
+                             "requires both to run on the same host.")
+    parser.add_argument('--' + RING_PATH, type=str, required=False, default=DEFAULT_RING_PATH,
+                        help="Path to the ring file of the shared memory observation transport.")
+    parser.add_argument('--' + BUFFER_BACKEND, type=str, required=False, default=LIST_BACKEND,
+                        choices=BUFFER_BACKENDS,
+                        help="Redis data structure backing the action and observation buffers. Streams are read in "
+                             "order and bounded in length.")
+    parser.add_argument('--' + OBSERVATION_CAPACITY, type=int, required=False, default=0,
+                        help="Max number of observations held by the observation buffer, 0 for unbounded. Bounding "
+                             "it keeps redis memory in check when the environment stalls.")
+    parser.add_argument('--' + OVERFLOW_POLICY, type=str, required=False, default=OVERFLOW_DROP_OLDEST,
+                        choices=OVERFLOW_POLICIES,
+                        help="What happens to observations sent while the observation buffer is full: block the "
+                             "connection client, drop the oldest or the newest observations, or keep only the latest.")
+    parser.add_argument('--' + SESSION_ID, type=str, required=False, default=None,
+                        help="Id of the session scoping its redis keys, so that many sessions can share one redis "
+                             "server. A random id is used if not given.")
+    parser.add_argument('--' + DEVICE_ID, type=str, required=False, default=None,
+                        help="Serial of the device to connect to, e.g. emulator-5554. Required to run several "
+                             "sessions against different devices at once.")
+    parser.add_argument('--' + REDIS_SOCKET_PATH, type=str, required=False, default=DEFAULT_REDIS_SOCKET_PATH,
+                        help="Path to the unix domain socket redis is reached through, which is faster than TCP for "
+                             "large observations. Pass an empty string to connect over TCP.")
+    parser.add_argument('--' + CROP_BOX, type=int, nargs=4, required=False, default=None,
+                        metavar=('LEFT', 'TOP', 'RIGHT', 'BOTTOM'),
+                        help="Pixel box observations are cropped to, e.g. to drop the status bar.")
+    parser.add_argument('--' + RESIZE_FACTOR, type=int, required=False, default=1,
+                        help="Integer factor the height and width of observations are divided by.")
+    parser.add_argument('--' + GRAYSCALE, default=False, action='store_true',
+                        help="Convert observations to single channel grayscale images.")
+    parser.add_argument('--' + OBSERVATION_DTYPE, type=str, required=False, default='uint8', choices=DTYPES.keys(),
+                        help="Dtype of the observations handed to the environment and agent.")
+    parser.add_argument('--' + CAPTURE_MODE, type=str, required=False, default=CAPTURE_MODE_SLEEP,
+                        choices=CAPTURE_MODES,
+                        help="When to take the screenshot after an action: after the fixed observation delta, or "
+                             "once the screen has settled, i.e. stopped changing.")
+    parser.add_argument('--' + SETTLE_FRAMES, type=int, required=False, default=DEFAULT_SETTLE_FRAMES,
+                        help="Number of successive identical screenshots a settled screen takes, in settle mode.")
+    parser.add_argument('--' + SETTLE_TIMEOUT, type=int, required=False, default=DEFAULT_SETTLE_TIMEOUT,
+                        help="Max time in milliseconds to wait for the screen to settle, in settle mode.")
+    parser.add_argument('--' + ACTION_MODE, type=str, required=False, default='touch', choices=ACTION_MODES.keys(),
+                        help="Action space of the agent: single taps, or single gestures such as swipes and long "
+                             "presses.")
+    parser.add_argument('--' + PIPELINE_DEPTH, type=int, required=False, default=1,
+                        help="Max number of actions in flight. Above one, the agent picks actions from observations "
+                             "up to that many steps minus one old, in exchange for keeping the device busy.")
+    parser.add_argument('--' + FRAME_SKIP, type=int, required=False, default=1,
+                        help="Number of times every action of the agent is taken, summing the rewards.")
+    parser.add_argument('--' + FRAME_STACK, type=int, required=False, default=1,
+                        help="Number of latest observations stacked into every observation the agent sees.")
+    parser.add_argument('--' + RECORD_TRAJECTORY, type=str, required=False, default=None, metavar='PATH',
+                        help="Directory to record the actions, rewards and observations of the session into, for "
+                             "replaying them without a device.")
+    parser.add_argument('--' + RECORDING_QUEUE_SIZE, type=int, required=False, default=DEFAULT_RECORDING_QUEUE_SIZE,
+                        help="Number of video frames held in memory while waiting to be encoded in the background.")
+    parser.add_argument('--' + RECORDING_POLICY, type=str, required=False, default=RECORDING_POLICY_BLOCK,
+                        choices=RECORDING_POLICIES,
+                        help="What happens to video frames while the encoder falls behind: block the session, drop "
+                             "them from the video, or spill them to disk until the encoder catches up.")
+    parser.add_argument('--' + RECORDING_SINK, type=str, required=False, default=RECORDING_SINK_VIDEO,
+                        choices=RECORDING_SINKS,
+                        help="Where the session is recorded to: an mp4 video encoded during the session, or an archive "
+                             "of the observations as sent by the device, which session/transcode_recording.py turns "
+                             "into a video afterwards. The archive goes to --record-trajectory if given.")
+    parser.add_argument('--' + SIMULATED_DEVICE, default=False, action='store_true',
+                        help="Run the session against a simulated device instead of a real one, e.g. to load test "
+                             "the pipeline. Neither monkeyrunner nor run_config.json is needed then.")
+    parser.add_argument('--' + SIMULATED_SCREEN_SIZE, type=int, nargs=2, required=False, default=[1920, 1080],
+                        metavar=('HEIGHT', 'WIDTH'),
+                        help="Size in pixels of the screen of the simulated device.")
+    parser.add_argument('--' + SIMULATED_LATENCY_DISTRIBUTION, type=str, required=False,
+                        default=DEFAULT_LATENCY_DISTRIBUTION, choices=sorted(LATENCY_DISTRIBUTIONS.keys()),
+                        help="Distribution of the screenshot latencies of the simulated device.")
+    parser.add_argument('--' + SIMULATED_LATENCY, type=float, required=False, default=100,
+                        help="Mean screenshot latency of the simulated device in milliseconds.")
+    parser.add_argument('--' + SIMULATED_LATENCY_JITTER, type=float, required=False, default=50,
+                        help="Standard deviation of the screenshot latency of the simulated device in milliseconds.")
+    parser.add_argument('--' + SIMULATED_SCREENSHOT_FAILURE_RATE, type=float, required=False, default=0.0,
+                        help="Probability of a screenshot of the simulated device failing and being retried.")
 
     return parser.parse_args()
 
 
 def start_multivac_session(environment_name, agent_name, num_steps, observation_delta=250, video_fps=1,
-                           display_video=False):
+                           display_video=False, observation_codec=DEFAULT_CODEC_NAME,
+                           observation_transport=REDIS_TRANSPORT, ring_path=DEFAULT_RING_PATH,
+                           buffer_backend=LIST_BACKEND, observation_capacity=0, overflow_policy=OVERFLOW_DROP_OLDEST,
+                           session_id=None, device_id=None, redis_socket_path=DEFAULT_REDIS_SOCKET_PATH,
+                           crop_box=None, resize_factor=1, grayscale=False, observation_dtype='uint8',
+                           capture_mode=CAPTURE_MODE_SLEEP, settle_frames=DEFAULT_SETTLE_FRAMES,
+                           settle_timeout=DEFAULT_SETTLE_TIMEOUT, action_mode='touch', pipeline_depth=1,
+                           frame_skip=1, frame_stack=1, trajectory_path=None,
+                           recording_queue_size=DEFAULT_RECORDING_QUEUE_SIZE, recording_policy=RECORDING_POLICY_BLOCK,
+                           recording_sink=RECORDING_SINK_VIDEO, simulated_device=False,
+                           simulated_screen_size=(1920, 1080),
+                           simulated_latency_distribution=DEFAULT_LATENCY_DISTRIBUTION, simulated_latency=100,
+                           simulated_latency_jitter=50, simulated_screenshot_failure_rate=0.0, progress_callback=None,
+                           observation_callback=None):
     """
     Start the Multivac session which includes:
       1. Starting a connection client with an Android device
@@ -141,6 +452,42 @@ def start_multivac_session(environment_name, agent_name, num_steps, observation_
     :param video_fps: Frame per second of the output recording of the gym environment.
     :param display_video: Flag to determine whether or not to manually display session in a window separate from the
                           device/emulator or UI.
+    :param observation_codec: Name of the codec used to encode screenshots on the device side.
+    :param observation_transport: How observations are handed from the device side to the Multivac.
+    :param ring_path: Path to the ring file used by the shared memory observation transport.
+    :param buffer_backend: Redis data structure backing the action and observation buffers.
+    :param observation_capacity: Max number of observations held by the observation buffer, 0 for unbounded.
+    :param overflow_policy: Policy applied when the observation buffer is full.
+    :param session_id: Id of the session scoping its redis keys, so that many sessions can share one redis server. A
+    random id is used if None.
+    :param device_id: Serial of the device to connect to, None for any device.
+    :param redis_socket_path: Path to the unix domain socket redis is reached through, None to connect over TCP.
+    :param crop_box: (left, top, right, bottom) box observations are cropped to, None to keep the whole screen.
+    :param resize_factor: Integer factor the height and width of observations are divided by.
+    :param grayscale: Whether to convert observations to grayscale.
+    :param observation_dtype: Name of the dtype of observations.
+    :param capture_mode: When to take the screenshot after an action, one of CAPTURE_MODES.
+    :param settle_frames: Number of successive identical screenshots a settled screen takes, in settle mode.
+    :param settle_timeout: Max time in milliseconds to wait for the screen to settle, in settle mode.
+    :param action_mode: Name of the action mode defining the action space of the agent.
+    :param pipeline_depth: Max number of actions in flight.
+    :param frame_skip: Number of times every action of the agent is taken.
+    :param frame_stack: Number of latest observations stacked into every observation the agent sees.
+    :param trajectory_path: Directory to record the trajectory of the session into, None to not record it.
+    :param recording_queue_size: Number of video frames held in memory while waiting to be encoded.
+    :param recording_policy: What happens to video frames while the encoder falls behind, one of RECORDING_POLICIES.
+    :param recording_sink: Where the session is recorded to, one of RECORDING_SINKS.
+    :param simulated_device: Whether to run the session against a simulated device instead of a real one.
+    :param simulated_screen_size: (height, width) of the screen of the simulated device in pixels.
+    :param simulated_latency_distribution: Name of the distribution of screenshot latencies of the simulated device.
+    :param simulated_latency: Mean screenshot latency of the simulated device in milliseconds.
+    :param simulated_latency_jitter: Standard deviation of the screenshot latency of the simulated device in
+    milliseconds.
+    :param simulated_screenshot_failure_rate: Probability of a screenshot of the simulated device failing.
+    :param progress_callback: Function called with a dict of the progress of the session after every step, None to not
+    report progress.
+    :param observation_callback: Function called with every raw Observation read from the device, None to not pass them
+    on.
     :return SessionStatusEnum indicating how the session concluded.
     """
 
@@ -154,29 +501,118 @@ def start_multivac_session(environment_name, agent_name, num_steps, observation_
     assert type(video_fps) == int and 1 <= video_fps <= static_configs.MAX_VIDEO_FPS, \
         "Specify an integer video fps >= 1 and <= {}".format(static_configs.MAX_VIDEO_FPS)
     assert type(display_video) == bool, "display_video parameter should be a boolean"
-
-    # Gather information from config file
-    monkeyrunner_path, redispy_path = parse_config_file()
-
-    # Flush DB
-    flush_redis_db()
-
-    # Start Redis DB
-    redis_process = start_redis_db()
+    assert observation_codec == AUTO_CODEC_NAME or observation_codec in CODECS, \
+        "{} is not a valid observation codec".format(observation_codec)
+    assert simulated_device or observation_codec not in LZ4_CODEC_NAMES, \
+        "The {} observation codec is only available to a simulated device".format(observation_codec)
+    assert observation_transport in OBSERVATION_TRANSPORTS, \
+        "{} is not a valid observation transport".format(observation_transport)
+    assert buffer_backend in BUFFER_BACKENDS, "{} is not a valid buffer backend".format(buffer_backend)
+    assert observation_capacity >= 0, "Observation capacity must be non-negative"
+    assert overflow_policy in OVERFLOW_POLICIES, "{} is not a valid overflow policy".format(overflow_policy)
+    assert observation_codec not in TILE_DELTA_CODEC_NAMES or \
+        not overflow_evicts(observation_capacity, overflow_policy), \
+        "The {} observation codec needs an observation buffer that does not evict observations, e.g. with the " \
+        "drop-newest overflow policy".format(observation_codec)
+    assert crop_box is None or len(crop_box) == 4, "Specify the crop box as (left, top, right, bottom)"
+    assert type(resize_factor) == int and resize_factor >= 1, "Specify an integer resize factor >= 1"
+    assert type(grayscale) == bool, "grayscale parameter should be a boolean"
+    assert observation_dtype in DTYPES, "{} is not a valid observation dtype".format(observation_dtype)
+    assert capture_mode in CAPTURE_MODES, "{} is not a valid capture mode".format(capture_mode)
+    assert type(settle_frames) == int and settle_frames >= 2, "Specify an integer number of settle frames >= 2"
+    assert type(settle_timeout) == int and settle_timeout >= 0, "Specify an integer settle timeout >= 0"
+    assert action_mode in ACTION_MODES, "{} is not a valid action mode".format(action_mode)
+    assert type(pipeline_depth) == int and pipeline_depth >= 1, "Specify an integer pipeline depth >= 1"
+    assert type(frame_skip) == int and frame_skip >= 1, "Specify an integer frame skip >= 1"
+    assert type(frame_stack) == int and frame_stack >= 1, "Specify an integer frame stack >= 1"
+    assert type(recording_queue_size) == int and recording_queue_size >= 1, \
+        "Specify an integer recording queue size >= 1"
+    assert recording_policy in RECORDING_POLICIES, "{} is not a valid recording policy".format(recording_policy)
+    assert recording_sink in RECORDING_SINKS, "{} is not a valid recording sink".format(recording_sink)
+    assert type(simulated_device) == bool, "simulated_device parameter should be a boolean"
+    assert len(simulated_screen_size) == 2 and min(simulated_screen_size) > 0, \
+        "Specify the simulated screen size as positive (height, width)"
+    assert simulated_latency_distribution in LATENCY_DISTRIBUTIONS, \
+        "{} is not a valid latency distribution".format(simulated_latency_distribution)
+    assert simulated_latency >= 0 and simulated_latency_jitter >= 0, "Specify non-negative simulated latencies"
+    assert 0 <= simulated_screenshot_failure_rate < 1, "Specify a simulated screenshot failure rate in [0, 1)"
+
+    if session_id is None:
+        session_id = uuid.uuid4().hex[:8]
+    logger.info("Session id: {}".format(session_id))
+
+    # Gather information from config file, which only the connection client of a real device needs.
+    if not simulated_device:
+        monkeyrunner_path, redispy_path = parse_config_file()
+
+    # Start Redis DB, unless it is running already, e.g. for another session. Remove anything left over from an earlier
+    # run of this session.
+    started_redis = False
+    if is_redis_db_running(static_configs.DEFAULT_REDIS_PORT, redis_socket_path):
+        clear_session(session_id, static_configs.DEFAULT_REDIS_PORT, redis_socket_path)
+    else:
+        start_redis_db(static_configs.DEFAULT_REDIS_PORT, redis_socket_path)
+        started_redis = True
+    register_session(static_configs.DEFAULT_REDIS_PORT, redis_socket_path, started_server=started_redis)
 
     # Start connection client
-    device_process = start_connection_client(
-        monkeyrunner_path=monkeyrunner_path,
-        redispy_path=redispy_path,
-        redis_port=static_configs.DEFAULT_REDIS_PORT,
-        observation_delta=observation_delta
-    )
+    if simulated_device:
+        device_process = start_simulated_connection_client(
+            redis_port=static_configs.DEFAULT_REDIS_PORT,
+            observation_delta=observation_delta,
+            redis_socket_path=redis_socket_path,
+            observation_codec=observation_codec,
+            observation_transport=observation_transport,
+            ring_path=ring_path,
+            buffer_backend=buffer_backend,
+            observation_capacity=observation_capacity,
+            overflow_policy=overflow_policy,
+            session_id=session_id,
+            capture_mode=capture_mode,
+            settle_frames=settle_frames,
+            settle_timeout=settle_timeout,
+            screen_size=simulated_screen_size,
+            latency_distribution=simulated_latency_distribution,
+            latency=simulated_latency,
+            latency_jitter=simulated_latency_jitter,
+            screenshot_failure_rate=simulated_screenshot_failure_rate
+        )
+    else:
+        device_process = start_connection_client(
+            monkeyrunner_path=monkeyrunner_path,
+            redispy_path=redispy_path,
+            redis_port=static_configs.DEFAULT_REDIS_PORT,
+            observation_delta=observation_delta,
+            redis_socket_path=redis_socket_path,
+            observation_codec=observation_codec,
+            observation_transport=observation_transport,
+            ring_path=ring_path,
+            buffer_backend=buffer_backend,
+            observation_capacity=observation_capacity,
+            overflow_policy=overflow_policy,
+            session_id=session_id,
+            device_id=device_id,
+            capture_mode=capture_mode,
+            settle_frames=settle_frames,
+            settle_timeout=settle_timeout
+        )
+
+    # Once this script terminates in any way, device_process should terminate as well. Only the keys of this session are
+    # removed, and the redis server is left to the sessions still using it.
+    terminated = []
 
-    # Once this script terminates in any way, redis_process and device_process should terminate as well.
     def terminate():
-        redis_process.terminate()
+        if terminated:
+            return
+        terminated.append(True)
+
         device_process.terminate()
-        flush_redis_db()
+        clear_session(session_id, static_configs.DEFAULT_REDIS_PORT, redis_socket_path)
+        unregister_session(static_configs.DEFAULT_REDIS_PORT, redis_socket_path)
+
+        ring_file_path = session_ring_path(ring_path, session_id)
+        if observation_transport == SHARED_MEMORY_TRANSPORT and os.path.exists(ring_file_path):
+            os.remove(ring_file_path)
 
     # Termination function on a signal.
     # Add signal handlers when executed from the main thread, e.g. command line
@@ -196,8 +632,29 @@ def start_multivac_session(environment_name, agent_name, num_steps, observation_
             agent_name,
             num_steps,
             redis_port=static_configs.DEFAULT_REDIS_PORT,
+            redis_socket_path=redis_socket_path,
             video_fps=video_fps,
-            display_video=display_video
+            display_video=display_video,
+            observation_transport=observation_transport,
+            ring_path=ring_path,
+            buffer_backend=buffer_backend,
+            observation_capacity=observation_capacity,
+            overflow_policy=overflow_policy,
+            session_id=session_id,
+            crop_box=crop_box,
+            resize_factor=resize_factor,
+            grayscale=grayscale,
+            observation_dtype=observation_dtype,
+            action_mode=action_mode,
+            pipeline_depth=pipeline_depth,
+            frame_skip=frame_skip,
+            frame_stack=frame_stack,
+            trajectory_path=trajectory_path,
+            recording_queue_size=recording_queue_size,
+            recording_policy=recording_policy,
+            recording_sink=recording_sink,
+            progress_callback=progress_callback,
+            observation_callback=observation_callback
         )
 
         multivac.launch()
@@ -224,7 +681,37 @@ if __name__ == '__main__':
         num_steps=params.num_steps,
         observation_delta=params.observation_delta,
         video_fps=params.video_fps,
-        display_video=params.display_video
+        display_video=params.display_video,
+        observation_codec=params.observation_codec,
+        observation_transport=params.observation_transport,
+        ring_path=params.ring_path,
+        buffer_backend=params.buffer_backend,
+        observation_capacity=params.observation_capacity,
+        overflow_policy=params.overflow_policy,
+        session_id=params.session_id,
+        device_id=params.device_id,
+        redis_socket_path=params.redis_socket_path or None,
+        crop_box=params.crop_box,
+        resize_factor=params.resize_factor,
+        grayscale=params.grayscale,
+        observation_dtype=params.observation_dtype,
+        capture_mode=params.capture_mode,
+        settle_frames=params.settle_frames,
+        settle_timeout=params.settle_timeout,
+        action_mode=params.action_mode,
+        pipeline_depth=params.pipeline_depth,
+        frame_skip=params.frame_skip,
+        frame_stack=params.frame_stack,
+        trajectory_path=params.record_trajectory,
+        recording_queue_size=params.recording_queue_size,
+        recording_policy=params.recording_policy,
+        recording_sink=params.recording_sink,
+        simulated_device=params.simulated_device,
+        simulated_screen_size=tuple(params.simulated_screen_size),
+        simulated_latency_distribution=params.simulated_latency_distribution,
+        simulated_latency=params.simulated_latency,
+        simulated_latency_jitter=params.simulated_latency_jitter,
+        simulated_screenshot_failure_rate=params.simulated_screenshot_failure_rate
     )
 
     if status == SessionStatusEnum.SUCCESS:
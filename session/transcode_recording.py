@@ -0,0 +1,100 @@
+"""
+The transcode_recording script turns a recording archived by a session with `--recording-sink archive` into an mp4
+video, with the same informational text as the videos recorded live. Frames are the screenshots as sent by the device,
+before any preprocessing of the session.
+
+Run from the Multivac project directory:
+```bash
+export PYTHONPATH="${PYTHONPATH}:$(pwd)" &&
+python session/transcode_recording.py out/random-MeanPixelDifferenceEnv-archive out/random-MeanPixelDifferenceEnv.mp4
+```
+"""
+
+import argparse
+
+from environment.observation_decoding import TileDeltaAssembler, decode_observation
+from environment.trajectory import RECORD_RESET, TrajectoryReader
+from session.video_recorder import RECORDING_POLICY_BLOCK, VideoRecorder
+
+# Cmd line parameters
+ARCHIVE_PATH = "archive_path"
+OUTPUT_PATH = "output_path"
+VIDEO_FPS = "video-fps"
+
+
+def annotated_frames(reader):
+    """
+    Decode the observations of an archive in order, along with their informational text. Steps are counted and
+    rewards averaged from the start of every episode.
+    :param reader: TrajectoryReader of the archive.
+    :return: generator of (RGB np array, text) tuples. An array is only valid until the next one is generated.
+    """
+
+    tile_delta_assembler = TileDeltaAssembler()
+
+    step_no = 0
+    total_reward = 0.0
+    for index in range(len(reader)):
+        kind, _, reward, _, observation = reader.read(index)
+
+        if kind == RECORD_RESET:
+            tile_delta_assembler.reset()
+            step_no = 0
+            total_reward = 0.0
+        else:
+            step_no += 1
+            total_reward += reward
+
+        average_reward = total_reward / step_no if step_no > 0 else 0.0
+        text = "{} | Step: {} | Average Reward: {:.2f}".format("MULTIVAC", step_no, average_reward)
+
+        yield decode_observation(observation, tile_delta_assembler), text
+
+
+def transcode_recording(archive_path, output_path, video_fps=1):
+    """
+    Transcode an archived recording into an mp4 video.
+    :param archive_path: path to the directory of the archive.
+    :param output_path: path of the mp4 file to write.
+    :param video_fps: frames per second of the video.
+    :return: number of frames written.
+    """
+
+    reader = TrajectoryReader(archive_path)
+    assert len(reader) > 0, "{} holds no recorded observations".format(archive_path)
+
+    video_recorder = None
+    for frame, text in annotated_frames(reader):
+        if video_recorder is None:
+            frame_height, frame_width, _ = frame.shape
+            video_recorder = VideoRecorder(output_path, video_fps, frame_height, frame_width,
+                                           policy=RECORDING_POLICY_BLOCK)
+
+        video_recorder.record(frame, text)
+
+    video_recorder.close()
+
+    return len(reader)
+
+
+def parse_args():
+    """
+    Parse cmd line arguments.
+    :return: arguments that are accessible as args.PARAM_NAME
+    """
+
+    parser = argparse.ArgumentParser()
+
+    parser.add_argument(ARCHIVE_PATH, type=str, help="Directory of the archived recording.")
+    parser.add_argument(OUTPUT_PATH, type=str, help="Path of the mp4 file to write.")
+    parser.add_argument('--' + VIDEO_FPS, type=int, required=False, default=1,
+                        help="Frame per second of the video.")
+
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    params = parse_args()
+
+    num_frames = transcode_recording(params.archive_path, params.output_path, params.video_fps)
+    print("Wrote {} frames to {}".format(num_frames, params.output_path))
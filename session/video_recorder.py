@@ -0,0 +1,235 @@
+"""
+File that contains the recorder writing the frames of a session to a video off the step loop.
+"""
+
+import cv2
+import logging
+import numpy as np
+import os
+import queue
+import tempfile
+import threading
+
+# Height for text portion of the video frame.
+TEXT_HEIGHT = 100
+
+# Policies for frames recorded while all frame slots are waiting to be encoded, i.e. the encoder falls behind. Blocking
+# waits for a slot to free up, dropping leaves the frame out of the video and spilling parks it in a file on disk until
+# the encoder gets to it.
+RECORDING_POLICY_BLOCK = "block"
+RECORDING_POLICY_DROP = "drop"
+RECORDING_POLICY_SPILL = "spill"
+
+RECORDING_POLICIES = [RECORDING_POLICY_BLOCK, RECORDING_POLICY_DROP, RECORDING_POLICY_SPILL]
+
+# Default number of frames held in memory waiting to be encoded.
+DEFAULT_RECORDING_QUEUE_SIZE = 32
+
+
+class VideoRecorder(object):
+    """
+    The VideoRecorder encodes frames into an mp4 video on a background thread, so that recording a step costs the step
+    loop a copy of the frame into a free slot and a queue put.
+
+    Frames are held in a fixed number of preallocated slots until the encoder thread gets to them. The encoder composes
+    every frame into a single preallocated BGR canvas: the frame is converted into its lower part, and only the banner
+    strip above it is redrawn with the text of the frame. Once all slots are taken, the recording policy applies.
+    """
+
+    def __init__(self, output_path, fps, frame_height, frame_width, queue_size=DEFAULT_RECORDING_QUEUE_SIZE,
+                 policy=RECORDING_POLICY_BLOCK):
+        """
+        Initialize the recorder and start its encoder thread.
+        :param output_path: path of the mp4 file to write.
+        :param fps: frames per second of the video.
+        :param frame_height: height of the frames in pixels.
+        :param frame_width: width of the frames in pixels.
+        :param queue_size: number of frames held in memory waiting to be encoded.
+        :param policy: what happens to frames recorded while all slots are taken, one of RECORDING_POLICIES.
+        """
+
+        assert queue_size >= 1, "The recording queue must hold at least one frame"
+        assert policy in RECORDING_POLICIES, "{} is not a valid recording policy".format(policy)
+
+        self.logger = logging.getLogger("VideoRecorder")
+        self.logger.addHandler(logging.StreamHandler())
+        self.logger.setLevel(logging.DEBUG)
+
+        self.policy = policy
+        self.frame_shape = (frame_height, frame_width, 3)
+
+        self.video_writer = cv2.VideoWriter(
+            output_path,
+            cv2.VideoWriter_fourcc(*'mp4v'),
+            float(fps),
+            (frame_width, frame_height + TEXT_HEIGHT)
+        )
+        self.canvas = np.full((TEXT_HEIGHT + frame_height, frame_width, 3), 255, dtype=np.uint8)
+
+        self.slots = [np.empty(self.frame_shape, dtype=np.uint8) for _ in range(queue_size)]
+        self.free_slots = queue.Queue()
+        for slot in range(queue_size):
+            self.free_slots.put(slot)
+
+        # Frames spilled to disk, of fixed size, in the order they were recorded. The step loop appends to the file and
+        # the encoder thread reads them back through a handle of its own. Once the encoder has caught up with all
+        # spilled frames, the file is truncated, so that it only grows for as long as the encoder stays behind.
+        self.spill_path = None
+        self.spill_file = None
+        self.spill_reader = None
+        self.spill_frame = np.empty(self.frame_shape, dtype=np.uint8)
+        self.unspill_frame = np.empty(self.frame_shape, dtype=np.uint8)
+        self.spill_lock = threading.Lock()
+        self.spill_length = 0
+        self.num_unencoded_spills = 0
+        self.num_spilled = 0
+
+        self.num_dropped = 0
+
+        # Recorded frames in order, as (slot, spill index, banner text) tuples with either a slot or a spill index.
+        # None stops the encoder thread.
+        self.frames = queue.Queue()
+
+        self.error = None
+        self.encoder_thread = threading.Thread(target=self.encode_frames, daemon=True)
+        self.encoder_thread.start()
+
+    def record(self, frame, text):
+        """
+        Hand a frame to the encoder thread.
+        :param frame: H x W x C np array of the frame, C being 1 or 3. Other dtypes than uint8 are rounded. The frame is
+        copied, so it may be reused once this returns.
+        :param text: text of the banner above the frame.
+        """
+
+        if self.error is not None:
+            raise Exception("Encoding the recording failed: {}".format(self.error))
+
+        try:
+            slot = self.free_slots.get(block=self.policy == RECORDING_POLICY_BLOCK)
+        except queue.Empty:
+            if self.policy == RECORDING_POLICY_DROP:
+                self.num_dropped += 1
+            else:
+                self.spill(frame, text)
+            return
+
+        self.copy_frame(self.slots[slot], frame)
+        self.frames.put((slot, None, text))
+
+    @staticmethod
+    def copy_frame(destination, frame):
+        """
+        Copy a frame into an 8 bit RGB array, repeating a single channel.
+        :param destination: H x W x 3 uint8 np array.
+        :param frame: H x W x C np array of the frame.
+        """
+
+        if frame.dtype != np.uint8:
+            frame = np.rint(frame)
+        np.copyto(destination, frame, casting='unsafe')
+
+    def spill(self, frame, text):
+        """
+        Append a frame to the spill file.
+        :param frame: H x W x C np array of the frame.
+        :param text: text of the banner above the frame.
+        """
+
+        if self.spill_file is None:
+            spill_fd, self.spill_path = tempfile.mkstemp(prefix="multivac_recording_", suffix=".spill")
+            self.spill_file = os.fdopen(spill_fd, 'wb')
+            self.spill_reader = open(self.spill_path, 'rb')
+
+        self.copy_frame(self.spill_frame, frame)
+        with self.spill_lock:
+            self.spill_file.write(self.spill_frame.data)
+            self.spill_file.flush()
+
+            self.frames.put((None, self.spill_length, text))
+            self.spill_length += 1
+            self.num_unencoded_spills += 1
+        self.num_spilled += 1
+
+    def encode_frames(self):
+        """
+        Encode recorded frames in order, until None is received.
+        """
+
+        while True:
+            item = self.frames.get()
+            if item is None:
+                return
+
+            slot, spill_index, text = item
+            try:
+                if slot is not None:
+                    self.write_frame(self.slots[slot], text)
+                else:
+                    self.spill_reader.seek(spill_index * self.unspill_frame.nbytes)
+                    self.spill_reader.readinto(self.unspill_frame.data)
+                    self.write_frame(self.unspill_frame, text)
+            except Exception as e:
+                self.error = e
+                self.logger.exception("Encoding a frame failed")
+            finally:
+                if slot is not None:
+                    self.free_slots.put(slot)
+                else:
+                    self.unspill()
+
+    def unspill(self):
+        """
+        Account for a spilled frame having been encoded, and truncate the spill file once no spilled frame is waiting.
+        """
+
+        with self.spill_lock:
+            self.num_unencoded_spills -= 1
+            if self.num_unencoded_spills == 0:
+                self.spill_file.seek(0)
+                self.spill_file.truncate()
+                self.spill_length = 0
+
+    def write_frame(self, frame, text):
+        """
+        Compose a frame and its banner in the canvas and encode it.
+        :param frame: H x W x 3 uint8 RGB np array of the frame.
+        :param text: text of the banner above the frame.
+        """
+
+        # OpenCV video writer requires image in BGR format
+        np.copyto(self.canvas[TEXT_HEIGHT:], frame[:, :, ::-1])
+
+        banner = self.canvas[:TEXT_HEIGHT]
+        banner.fill(255)
+        cv2.putText(
+            img=banner,
+            text=text,
+            org=(0, int(TEXT_HEIGHT / 2)),
+            fontFace=cv2.FONT_HERSHEY_SIMPLEX,
+            fontScale=1,
+            color=(0, 0, 0),
+            thickness=2,
+            lineType=2
+        )
+
+        self.video_writer.write(self.canvas)
+
+    def close(self):
+        """
+        Encode the frames still waiting, finish the video and remove the spill file.
+        """
+
+        self.frames.put(None)
+        self.encoder_thread.join()
+
+        self.video_writer.release()
+
+        if self.spill_file is not None:
+            self.spill_file.close()
+            self.spill_reader.close()
+            os.remove(self.spill_path)
+            self.spill_file = None
+
+        if self.num_dropped or self.num_spilled:
+            self.logger.info("Recording dropped {} and spilled {} frames".format(self.num_dropped, self.num_spilled))
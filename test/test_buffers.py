@@ -1,14 +1,39 @@
+import asyncio
+import pytest
 import redis
 import time
 
 from buffers.action_buffer import ActionBuffer
+from buffers.async_buffer import AsyncBuffer, create_async_redis_client
+from buffers.buffer import OVERFLOW_DROP_NEWEST, OVERFLOW_DROP_OLDEST, OVERFLOW_KEEP_LATEST, delete_session_keys
 from buffers.observation_buffer import ObservationBuffer
+from buffers.redis_connection import DEFAULT_SOCKET_CONNECT_TIMEOUT, TcpConnection, UnixSocketConnection, \
+    create_connection_pool, create_redis_client
+from buffers.shared_memory_observation_buffer import SharedMemoryObservationBuffer
+from buffers.stream_buffer import StreamActionBuffer
 from eventobjects.action import Action
 from eventobjects.observation import Observation
 
 
+def test_redis_connection_pool():
+    socket_pool = create_connection_pool(socket_path="/tmp/redis.sock", max_connections=4, socket_buffer_size=1024)
+    assert(socket_pool.connection_class == UnixSocketConnection)
+    assert(socket_pool.max_connections == 4)
+
+    connection = socket_pool.make_connection()
+    assert(connection.path == "/tmp/redis.sock")
+    assert(connection.socket_buffer_size == 1024)
+    # Unix domain socket connections of the pinned redispy reject a connect timeout.
+    assert('socket_connect_timeout' not in socket_pool.connection_kwargs)
+
+    tcp_pool = create_connection_pool(port=6380)
+    assert(tcp_pool.connection_class == TcpConnection)
+    assert(tcp_pool.make_connection().port == 6380)
+    assert(tcp_pool.connection_kwargs['socket_connect_timeout'] == DEFAULT_SOCKET_CONNECT_TIMEOUT)
+
+
 def test_action_buffer():
-    redis_client = redis.Redis()
+    redis_client = create_redis_client()
 
     action_buffer = ActionBuffer(redis_client)
 
@@ -16,32 +41,233 @@ def test_action_buffer():
     action_buffer.put_elem(Action((10, 70)))
     action_buffer.put_elem(Action((90, 10)))
 
-    assert(action_buffer.read_elem().click_coordinate == (90, 10))
+    assert(action_buffer.read_elem().click_coordinate == (40, 10))
 
     action_buffer.put_elem(Action((2, 4)))
 
-    assert(action_buffer.read_elem().click_coordinate == (2, 4))
+    # Actions are read in the order they were put.
     assert(action_buffer.read_elem().click_coordinate == (10, 70))
-    assert(action_buffer.read_elem().click_coordinate == (40, 10))
+    assert(action_buffer.read_elem().click_coordinate == (90, 10))
+    assert(action_buffer.read_elem().click_coordinate == (2, 4))
 
     redis_client.shutdown()
     time.sleep(1)  # Allow time for the redis client to shut down
 
 
 def test_observation_buffer():
-    redis_client = redis.Redis()
+    redis_client = create_redis_client()
 
     obs_buffer = ObservationBuffer(redis_client)
 
     obs_buffer.put_elem(Observation("img1"))
     obs_buffer.put_elem(Observation("img2"))
 
-    assert(obs_buffer.read_elem().image_bytes == "img2")
+    assert(obs_buffer.read_elem().image_bytes == "img1")
 
     obs_buffer.put_elem(Observation("img3"))
 
+    assert(obs_buffer.read_elem().image_bytes == "img2")
     assert(obs_buffer.read_elem().image_bytes == "img3")
-    assert(obs_buffer.read_elem().image_bytes == "img1")
+
+    redis_client.shutdown()
+    time.sleep(1)  # Allow time for the redis client to shut down
+
+
+def test_batched_buffer_operations():
+    redis_client = create_redis_client()
+
+    action_buffer = ActionBuffer(redis_client)
+
+    action_buffer.put_elems([Action((40, 10)), Action((10, 70)), Action((90, 10))])
+    action_buffer.put_elem(Action((2, 4)))
+
+    # Batched reads return elements in the same order as successive read_elem() calls.
+    assert([action.click_coordinate for action in action_buffer.read_elems(2)] == [(40, 10), (10, 70)])
+    assert([action.click_coordinate for action in action_buffer.blocking_read_elems(5, timeout=1)] ==
+           [(90, 10), (2, 4)])
+
+    # Draining an empty buffer times out with no elements.
+    assert(action_buffer.read_elems(3) == [])
+    assert(action_buffer.blocking_read_elems(3, timeout=1) == [])
+
+    redis_client.shutdown()
+    time.sleep(1)  # Allow time for the redis client to shut down
+
+
+def test_bounded_buffers():
+    redis_client = create_redis_client()
+
+    # Drop oldest: the newest elements are kept.
+    action_buffer = ActionBuffer(redis_client, capacity=2, overflow_policy=OVERFLOW_DROP_OLDEST)
+    assert(action_buffer.put_elems([Action((1, 1)), Action((2, 2))]) == 0)
+    assert(action_buffer.put_elem(Action((3, 3))) == 1)
+    assert(action_buffer.depth() == 2)
+    assert(action_buffer.num_dropped() == 1)
+    assert([action.click_coordinate for action in action_buffer.read_elems(5)] == [(2, 2), (3, 3)])
+
+    action_buffer.clearall()
+    assert(action_buffer.num_dropped() == 0)
+
+    # Drop newest: the elements being put into a full buffer are discarded.
+    action_buffer = ActionBuffer(redis_client, capacity=2, overflow_policy=OVERFLOW_DROP_NEWEST)
+    assert(action_buffer.put_elems([Action((1, 1)), Action((2, 2)), Action((3, 3))]) == 1)
+    assert(action_buffer.put_elem(Action((4, 4))) == 1)
+    assert(action_buffer.num_dropped() == 2)
+    assert([action.click_coordinate for action in action_buffer.read_elems(5)] == [(1, 1), (2, 2)])
+
+    action_buffer.clearall()
+
+    # Keep latest: only the latest element is held.
+    observation_buffer = ObservationBuffer(redis_client, capacity=10, overflow_policy=OVERFLOW_KEEP_LATEST)
+    observation_buffer.put_elems([Observation("img1"), Observation("img2")])
+    observation_buffer.put_elem(Observation("img3"))
+    assert(observation_buffer.depth() == 1)
+    assert(observation_buffer.num_dropped() == 2)
+    assert(observation_buffer.read_elem().image_bytes == "img3")
+
+    redis_client.shutdown()
+    time.sleep(1)  # Allow time for the redis client to shut down
+
+
+def test_session_buffers():
+    redis_client = create_redis_client()
+
+    unscoped_buffer = ActionBuffer(redis_client)
+    first_session_buffer = ActionBuffer(redis_client, session_id="first")
+    second_session_buffer = ActionBuffer(redis_client, session_id="second", capacity=1)
+
+    unscoped_buffer.put_elem(Action((1, 1)))
+    first_session_buffer.put_elem(Action((2, 2)))
+    second_session_buffer.put_elems([Action((3, 3)), Action((4, 4))])
+
+    # Sessions sharing a redis server do not see each other's elements.
+    assert(first_session_buffer.read_elem().click_coordinate == (2, 2))
+    assert(first_session_buffer.read_elems(5) == [])
+
+    # Deleting the keys of a session leaves other sessions untouched.
+    first_session_buffer.put_elem(Action((5, 5)))
+    assert(delete_session_keys(redis_client, "second") == 2)  # The buffer and its drop counter
+    assert(second_session_buffer.depth() == 0)
+    assert(second_session_buffer.num_dropped() == 0)
+    assert(first_session_buffer.depth() == 1)
+    assert(unscoped_buffer.read_elem().click_coordinate == (1, 1))
+
+    # Session ids are matched literally, even when they look like patterns.
+    assert(delete_session_keys(redis_client, "f*") == 0)
+    assert(delete_session_keys(redis_client, "[f]irst") == 0)
+    assert(first_session_buffer.depth() == 1)
+
+    redis_client.shutdown()
+    time.sleep(1)  # Allow time for the redis client to shut down
+
+
+def test_async_buffer():
+    redis_client = create_redis_client()
+
+    action_buffer = ActionBuffer(redis_client, capacity=2)
+    async_action_buffer = AsyncBuffer(action_buffer, create_async_redis_client(redis_client))
+
+    async def exercise_buffer():
+        assert(await async_action_buffer.put_elems([Action((1, 1)), Action((2, 2)), Action((3, 3))]) == 1)
+        assert(await async_action_buffer.depth() == 2)
+        assert(await async_action_buffer.num_dropped() == 1)
+        assert((await async_action_buffer.read_elem()).click_coordinate == (2, 2))
+
+        # Elements put through the sync buffer are read through the async one and vice versa.
+        action_buffer.put_elem(Action((4, 4)))
+        assert([action.click_coordinate for action in await async_action_buffer.blocking_read_elems(5, timeout=1)] ==
+               [(3, 3), (4, 4)])
+        assert(await async_action_buffer.blocking_read_elems(5, timeout=1) == [])
+
+        await async_action_buffer.put_elem(Action((5, 5)))
+        assert(action_buffer.read_elem().click_coordinate == (5, 5))
+
+        await async_action_buffer.clearall()
+        assert(action_buffer.num_dropped() == 0)
+
+        # The overflow policy is the one of the sync buffer.
+        newest_action_buffer = ActionBuffer(redis_client, session_id="newest", capacity=1,
+                                            overflow_policy=OVERFLOW_DROP_NEWEST)
+        newest_buffer = AsyncBuffer(newest_action_buffer, async_action_buffer.redis_client)
+        assert(await newest_buffer.put_elems([Action((6, 6)), Action((7, 7))]) == 1)
+        assert((await newest_buffer.read_elem()).click_coordinate == (6, 6))
+
+        await async_action_buffer.aclose()
+
+    asyncio.new_event_loop().run_until_complete(exercise_buffer())
+
+    redis_client.shutdown()
+    time.sleep(1)  # Allow time for the redis client to shut down
+
+
+def test_shared_memory_observation_buffer(tmpdir):
+    redis_client = create_redis_client()
+
+    ring_path = str(tmpdir.join('ring'))
+    writer_buffer = SharedMemoryObservationBuffer(redis_client, ring_path, num_slots=2, slot_size=64)
+    reader_buffer = SharedMemoryObservationBuffer(redis_client, ring_path, num_slots=2, slot_size=64)
+
+    writer_buffer.put_elem(Observation(b'img1', step_id=1))
+    writer_buffer.put_elem(Observation(b'img2' * 100, step_id=2))  # Larger than a slot, sent through redis as is
+
+    observation = reader_buffer.read_elem()
+    assert(observation.image_bytes == b'img1')
+    assert(observation.step_id == 1)
+    assert(reader_buffer.read_elem().image_bytes == b'img2' * 100)
+
+    # Only a small reference is held in redis for observations in the ring.
+    writer_buffer.put_elem(Observation(b'img3'))
+    assert(len(redis_client.lindex(reader_buffer.buffer_name, 0)) < len(Observation(b'img3').serialize()))
+    assert(reader_buffer.blocking_read_elem().image_bytes == b'img3')
+
+    # Observations read are copies, which the writer coming around the ring leaves untouched.
+    writer_buffer.put_elem(Observation(b'img4'))
+    observation = reader_buffer.read_elem()
+    writer_buffer.put_elems([Observation(b'img5'), Observation(b'img6'), Observation(b'img7')])
+    assert(bytes(observation.image_bytes) == b'img4')
+
+    # Slots reused before they were read are detected.
+    with pytest.raises(Exception):
+        for _ in range(3):
+            reader_buffer.read_elem()
+
+    writer_buffer.close()
+    reader_buffer.close()
+    redis_client.shutdown()
+    time.sleep(1)  # Allow time for the redis client to shut down
+
+
+def test_stream_buffer():
+    redis_client = create_redis_client()
+
+    action_buffer = StreamActionBuffer(redis_client, max_len=0)
+    recorder_buffer = StreamActionBuffer(redis_client)
+
+    action_buffer.put_elems([Action((40, 10)), Action((10, 70))])
+    action_buffer.put_elem(Action((90, 10)))
+
+    # Elements are read in the order they were put.
+    assert(action_buffer.read_elem().click_coordinate == (40, 10))
+    assert([action.click_coordinate for action in action_buffer.blocking_read_elems(5, timeout=1)] ==
+           [(10, 70), (90, 10)])
+    assert(action_buffer.read_elem() is None)
+    assert(action_buffer.blocking_read_elems(3, timeout=1) == [])
+    assert(action_buffer.last_read_timestamp() is not None)
+
+    # An independent reader sees all elements as well.
+    assert([action.click_coordinate for action in recorder_buffer.read_elems(5)] == [(40, 10), (10, 70), (90, 10)])
+
+    # Readers in one consumer group split the elements between them.
+    first_consumer = StreamActionBuffer(redis_client, group_name="learners", consumer_name="first")
+    second_consumer = StreamActionBuffer(redis_client, group_name="learners", consumer_name="second")
+    assert(first_consumer.read_elem().click_coordinate == (40, 10))
+    assert([action.click_coordinate for action in second_consumer.read_elems(5)] == [(10, 70), (90, 10)])
+
+    # Only the error of a group created already is ignored.
+    broken_consumer = StreamActionBuffer(redis_client, session_id="broken", group_name="learners")
+    redis_client.set(broken_consumer.buffer_name, "not a stream")
+    with pytest.raises(redis.exceptions.ResponseError):
+        broken_consumer.read_elem()
 
     redis_client.shutdown()
     time.sleep(1)  # Allow time for the redis client to shut down
@@ -0,0 +1,212 @@
+import numpy as np
+import pytest
+import threading
+import time
+
+from buffers.buffer import OVERFLOW_DROP_NEWEST, OVERFLOW_DROP_OLDEST
+from buffers.observation_buffer import ObservationBuffer
+from buffers.redis_connection import create_redis_client
+from device.observation_codecs import AUTO_CODEC_NAME, CODECS, create_codec, select_fastest_codec
+from device.screen_settle import ScreenSettleDetector
+from device.simulated_connection_client import SimulatedConnectionClient, lognormal_latency
+from device.simulated_screen import SimulatedScreen, SimulatedSnapshot
+from environment.mean_pixel_difference_env import MeanPixelDifferenceEnv
+from environment.observation_decoding import TileDeltaAssembler, decode_observation
+from eventobjects.action import swipe
+from eventobjects.observation import COMPRESSION_NONE, IMAGE_FORMAT_RAW_RGB, Observation
+
+
+class FakeScreen(object):
+    """
+    Screen replaying a list of frames, one per screenshot, each taking frame_time seconds on a fake clock.
+    """
+
+    def __init__(self, frames, frame_time):
+        self.frames = frames
+        self.frame_time = frame_time
+        self.now = 0.0
+        self.num_snapshots = 0
+
+    def clock(self):
+        return self.now
+
+    def take_snapshot(self):
+        frame = self.frames[min(self.num_snapshots, len(self.frames) - 1)]
+        self.num_snapshots += 1
+        self.now += self.frame_time
+        return frame
+
+
+def test_screen_settles_after_identical_frames():
+    # An animation over the first three frames, then a still screen.
+    screen = FakeScreen(['a', 'b', 'c', 'd', 'd', 'd', 'e'], 0.1)
+    detector = ScreenSettleDetector(screen.take_snapshot, lambda frame: frame, num_settle_frames=3,
+                                    settle_timeout=2000, clock=screen.clock)
+
+    snapshot, settle_time, settled = detector.wait_for_settle()
+
+    assert(settled)
+    assert(snapshot == 'd')
+    assert(screen.num_snapshots == 6)
+    assert(abs(settle_time - 0.6) < 1e-9)
+
+
+def test_screen_settle_timeout():
+    # A screen that never stops changing.
+    screen = FakeScreen([str(i) for i in range(100)], 0.1)
+    detector = ScreenSettleDetector(screen.take_snapshot, lambda frame: frame, num_settle_frames=2,
+                                    settle_timeout=500, clock=screen.clock)
+
+    snapshot, settle_time, settled = detector.wait_for_settle()
+
+    assert(not settled)
+    assert(snapshot == '4')
+    assert(0.5 <= settle_time < 0.6)
+
+
+def test_simulated_screen():
+    screen = SimulatedScreen(40, 30, tile_size=10, seed=0)
+    initial_pixels = screen.snapshot().pixels
+
+    assert(initial_pixels.shape == (40, 30, 3))
+
+    # A tap changes the tile under it only.
+    screen.tap((15, 25))
+    changed = np.any(screen.snapshot().pixels != initial_pixels, axis=2)
+    assert(changed[20:30, 10:20].all())
+    assert(changed.sum() == 100)
+
+    # Earlier snapshots are left unchanged, and resetting restores the generated grid.
+    assert(screen.snapshot().signature() != SimulatedSnapshot(initial_pixels).signature())
+    screen.reset()
+    assert(np.array_equal(screen.snapshot().pixels, initial_pixels))
+
+    # A swipe over two rows scrolls the grid by two rows.
+    screen.take_gesture(swipe((5, 5), (5, 25), 100))
+    assert(np.array_equal(screen.snapshot().pixels[20:], initial_pixels[:20]))
+
+
+def test_simulated_connection_client():
+    redis_client = create_redis_client()
+    client = SimulatedConnectionClient(6379, observation_delta=0, observation_codec='raw', session_id="simulated",
+                                       image_height=40, image_width=30, tile_size=10, latency_distribution='constant',
+                                       latency=0, seed=0)
+    env = MeanPixelDifferenceEnv(client.action_buffer, client.observation_buffer, 40, 30)
+
+    device = threading.Thread(target=client.start, daemon=True)
+    device.start()
+
+    initial_observation = env.reset()
+    assert(np.array_equal(initial_observation, client.screen.snapshot().pixels))
+
+    # Every tap changes the 10 x 10 tile it hits.
+    for step in range(1, 4):
+        observation, reward, info = env.step([5, 5 + 10 * step])
+        assert(info['num_steps'] == step)
+        assert(np.any(observation != initial_observation, axis=2).sum() == 100 * step)
+        assert(reward > 0)
+
+    redis_client.shutdown()
+    time.sleep(1)  # Allow time for the redis client to shut down
+
+
+def test_simulated_screenshot_failures():
+    client = SimulatedConnectionClient(6379, session_id="failing", image_height=8, image_width=8,
+                                       latency_distribution='constant', latency=0, screenshot_failure_rate=0.5, seed=1)
+
+    num_snapshots = 0
+    try:
+        for _ in range(100):
+            client.take_snapshot()
+            num_snapshots += 1
+    except Exception:
+        pass
+
+    # Failures are retried, and taking a snapshot only fails once all retries failed.
+    assert(client.num_failed_screenshots >= num_snapshots // 2)
+    assert(num_snapshots < 100)
+
+    # Log-normal latencies have the requested mean.
+    latencies = [lognormal_latency(client.rng, 0.1, 0.05) for _ in range(10000)]
+    assert(abs(np.mean(latencies) - 0.1) < 0.005)
+
+
+def test_codec_selection_includes_decoding():
+    snapshot = SimulatedScreen(40, 30, 10, 0).snapshot()
+    decoded_codecs = []
+
+    # Decoding is slow for all but uncompressed raw images, which makes them the fastest end to end.
+    def decode(serialized_observation):
+        observation = Observation.deserialize(serialized_observation)
+        assert(np.array_equal(decode_observation(observation), snapshot.pixels))
+        decoded_codecs.append((observation.image_format, observation.compression))
+        if (observation.image_format, observation.compression) != (IMAGE_FORMAT_RAW_RGB, COMPRESSION_NONE):
+            time.sleep(0.05)
+
+    codec_name, latencies = select_fastest_codec(snapshot, lambda serialized_observation: serialized_observation,
+                                                 decode)
+    assert(codec_name == 'raw')
+    assert(len(decoded_codecs) == len(CODECS) and sorted(latencies.keys()) == sorted(CODECS.keys()))
+    assert(all(latencies[name] >= 0.05 for name in latencies if name != 'raw'))
+
+
+def test_tile_deltas_overflowing_bounded_buffers():
+    screen = SimulatedScreen(40, 30, 10, 0)
+    codec = create_codec('delta')
+    codec.tile_size = 10
+
+    # Dropping the oldest observations evicts the delta the later ones build on, which the assembler rejects.
+    observation_buffer = ObservationBuffer(create_redis_client(), session_id="delta_overflow", capacity=2,
+                                           overflow_policy=OVERFLOW_DROP_OLDEST)
+    observation_buffer.clearall()
+    assembler = TileDeltaAssembler()
+    observation_buffer.put_elem(codec.encode(screen.snapshot()))
+    assert(np.array_equal(decode_observation(observation_buffer.read_elem(), assembler), screen.snapshot().pixels))
+
+    for step in range(3):
+        screen.tap((5, 5 + 10 * step))
+        observation_buffer.put_elem(codec.encode(screen.snapshot()))
+    assert(observation_buffer.num_dropped() == 1)
+
+    with pytest.raises(Exception, match="does not build on frame 0"):
+        decode_observation(observation_buffer.read_elem(), assembler)
+
+    # Delta codecs are refused for buffers that evict observations, picked explicitly or automatically.
+    with pytest.raises(AssertionError):
+        SimulatedConnectionClient(6379, observation_codec='delta', observation_capacity=2,
+                                  overflow_policy=OVERFLOW_DROP_OLDEST, session_id="delta_overflow",
+                                  image_height=40, image_width=30, tile_size=10, latency_distribution='constant',
+                                  latency=0, seed=0)
+
+    client = SimulatedConnectionClient(6379, observation_codec=AUTO_CODEC_NAME, observation_capacity=2,
+                                       overflow_policy=OVERFLOW_DROP_OLDEST, session_id="delta_overflow",
+                                       image_height=40, image_width=30, tile_size=10,
+                                       latency_distribution='constant', latency=0, seed=0)
+    client.select_observation_codec()
+    assert(not client.observation_codec_name.startswith('delta'))
+
+    # Dropping the newest observations keeps the frames intact, and the codec resyncs with a keyframe.
+    client = SimulatedConnectionClient(6379, observation_codec='delta', observation_capacity=2,
+                                       overflow_policy=OVERFLOW_DROP_NEWEST, session_id="delta_overflow",
+                                       image_height=40, image_width=30, tile_size=10,
+                                       latency_distribution='constant', latency=0, seed=0)
+    client.observation_buffer.clearall()
+    client.observation_codec.tile_size = 10
+    assembler = TileDeltaAssembler()
+
+    frames = []
+    for step in range(4):
+        client.screen.tap((5, 5 + 10 * step))
+        frames.append(client.screen.snapshot().pixels.copy())
+        client.gather_observation()
+    assert(client.observation_buffer.num_dropped() == 2)
+
+    client.screen.tap((15, 5))
+    frames.append(client.screen.snapshot().pixels.copy())
+    observations = client.observation_buffer.read_elems(2)
+    client.gather_observation()
+    observations += client.observation_buffer.read_elems(1)
+
+    assert([observation.step_id for observation in observations] == [0, 1, 4])
+    for observation in observations:
+        assert(np.array_equal(decode_observation(observation, assembler), frames[observation.step_id]))
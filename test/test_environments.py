@@ -1,6 +1,47 @@
+import glob
 import numpy as np
+import os
+import shutil
+import tempfile
+import threading
+import time
 
+from io import BytesIO
+from PIL import Image
+
+from buffers.redis_connection import create_redis_client
+from device.observation_codecs import create_codec
+from environment.action_modes import GestureActionMode, MacroActionMode
+from environment.android_device_env import AndroidDeviceEnv
+from environment.environment_registry import ENVIRONMENTS
 from environment.mean_pixel_difference_env import MeanPixelDifferenceEnv
+from environment.observation_decoding import decode_observation
+from environment.observation_preprocessing import LUMA_WEIGHTS, ObservationPreprocessor
+from environment.replay_android_device_env import ReplayAndroidDeviceEnv
+from environment.trajectory import RECORD_RESET, RECORD_STEP, TrajectoryReader, TrajectoryRecorder
+from environment.vec_android_device_env import create_vec_environment
+from environment.wrappers import FrameSkipWrapper, FrameStackWrapper
+from eventobjects.action import Action, GESTURE_SWIPE, GESTURE_TAP, GESTURE_WAIT, swipe, tap, wait
+from eventobjects.observation import Observation, IMAGE_FORMAT_RAW_ARGB, IMAGE_FORMAT_RAW_RGB
+
+
+class ArraySnapshot(object):
+    """
+    Snapshot of an RGB numpy image exposing the interface the observation codecs expect.
+    """
+
+    def __init__(self, image):
+        self.image = image
+
+    def png_bytes(self, _):
+        output = BytesIO()
+        Image.fromarray(self.image).save(output, format='png')
+        return output.getvalue()
+
+    def raw_pixels(self):
+        height, width, _ = self.image.shape
+        argb = np.concatenate([np.full((height, width, 1), 255, dtype=np.uint8), self.image], axis=2)
+        return argb.tobytes(), IMAGE_FORMAT_RAW_ARGB, height, width
 
 
 def test_mean_pixel_difference_reward():
@@ -24,3 +65,453 @@ def test_mean_pixel_difference_reward():
     reward = env.compute_reward(new_obs)
 
     assert(reward == 24)
+
+
+def test_reward_kernels():
+    black = np.zeros(shape=(192, 108, 3), dtype=np.uint8)
+    white = np.full(shape=(192, 108, 3), fill_value=255, dtype=np.uint8)
+    screen = np.random.randint(0, 256, size=(192, 108, 3), dtype=np.uint8)
+    other_screen = np.random.randint(0, 256, size=(192, 108, 3), dtype=np.uint8)
+
+    for environment_name in ENVIRONMENTS:
+        env = ENVIRONMENTS[environment_name](None, None, 192, 108)
+
+        env.reset_state()
+        env.finish_reset(screen)
+        _, reward, _ = env.finish_step(screen.copy())
+        assert(reward == 0)
+
+        # Rewards are symmetric.
+        env.reset_state()
+        env.finish_reset(screen)
+        _, forward_reward, _ = env.finish_step(other_screen)
+        _, backward_reward, _ = env.finish_step(screen)
+        assert(np.isclose(forward_reward, backward_reward) and forward_reward > 0)
+
+    # Differences of uint8 images do not wrap around.
+    env = ENVIRONMENTS['MeanPixelDifferenceEnv'](None, None, 192, 108)
+    env.most_recent_observation = black
+    assert(env.compute_reward(white) == 255)
+    env.most_recent_observation = white
+    assert(env.compute_reward(black) == 255)
+
+    env = ENVIRONMENTS['BlockHistogramEnv'](None, None, 192, 108)
+    env.most_recent_observation = black
+    assert(env.compute_reward(white) == 1)
+
+    env = ENVIRONMENTS['SsimEnv'](None, None, 192, 108)
+    env.most_recent_observation = screen
+    assert(0 < env.compute_reward(np.random.randint(0, 256, size=(192, 108, 3), dtype=np.uint8)) <= 1)
+
+
+def test_observation_codecs_round_trip():
+    image = np.random.randint(0, 256, size=(40, 30, 3), dtype=np.uint8)
+
+    for codec_name in ['png', 'raw', 'raw-zlib']:
+        observation = create_codec(codec_name).encode(ArraySnapshot(image))
+        observation_prime = Observation.deserialize(observation.serialize())
+
+        decoded = AndroidDeviceEnv.process_image_from_observation(observation_prime)
+
+        assert(decoded.shape == (40, 30, 3))
+        assert(np.array_equal(decoded, image))
+
+    # Uncompressed raw pixels are decoded without copying the payload.
+    observation = Observation.deserialize(create_codec('raw').encode(ArraySnapshot(image)).serialize())
+    decoded = AndroidDeviceEnv.process_image_from_observation(observation)
+    assert(not decoded.flags.owndata)
+
+
+def test_tile_delta_observations():
+    env = MeanPixelDifferenceEnv(None, None, 100, 70)
+    codec = create_codec('delta-zlib')
+    codec.tile_size = 32
+
+    image = np.random.randint(0, 256, size=(100, 70, 3), dtype=np.uint8)
+
+    observation = Observation.deserialize(codec.encode(ArraySnapshot(image)).serialize())
+    env.most_recent_observation = decode_observation(observation, env.tile_delta_assembler)
+    assert(np.array_equal(env.most_recent_observation, image))
+
+    for _ in range(3):
+        previous_image = image.copy()
+        image[np.random.randint(0, 100), np.random.randint(0, 70)] += 1
+
+        observation = Observation.deserialize(codec.encode(ArraySnapshot(image)).serialize())
+        new_obs = decode_observation(observation, env.tile_delta_assembler)
+
+        # Only the tile containing the changed pixel is sent, and the rebuilt frame matches the device screen.
+        assert(env.tile_delta_assembler.changed_tile_mask.shape == (4, 3))
+        assert(env.tile_delta_assembler.changed_tile_mask.sum() == 1)
+        assert(np.array_equal(new_obs, image))
+        assert(np.array_equal(env.most_recent_observation, previous_image))
+
+        # Skipping unchanged tiles yields the same reward as the full image difference.
+        expected_reward = np.mean(np.absolute(image.astype(int) - previous_image))
+        assert(np.isclose(env.compute_reward(new_obs), expected_reward))
+
+        env.most_recent_observation = new_obs
+
+
+def test_frame_pool_decoding():
+    # Large enough for raw images to be decompressed in several pieces.
+    env = MeanPixelDifferenceEnv(None, None, 600, 300)
+    frame_addresses = set(frame.ctypes.data for frame in env.frame_pool.frames)
+
+    images = [np.random.randint(0, 256, size=(600, 300, 3), dtype=np.uint8) for _ in range(3)]
+
+    for codec_name in ['png', 'raw-zlib']:
+        codec = create_codec(codec_name)
+        observations = [Observation.deserialize(codec.encode(ArraySnapshot(image)).serialize()) for image in images]
+
+        env.finish_reset(env.process_observation(observations[0]))
+
+        for i in range(1, 3):
+            previous_observation = env.most_recent_observation
+            new_obs, reward, _ = env.finish_step(env.process_observation(observations[i]))
+
+            # Frames alternate between the two pool frames, leaving the previous observation intact.
+            assert(new_obs.ctypes.data in frame_addresses)
+            assert(new_obs.ctypes.data != previous_observation.ctypes.data)
+            assert(np.array_equal(new_obs, images[i]))
+            assert(np.array_equal(previous_observation, images[i - 1]))
+            assert(reward == np.mean(np.absolute(images[i].astype(int) - images[i - 1])))
+
+
+def test_observation_preprocessing():
+    # Crop to rows 2-10 and columns 1-7, then average 2x2 blocks: a 4x3 grayscale image.
+    preprocessor = ObservationPreprocessor(crop_box=(1, 2, 7, 10), resize_factor=2, grayscale=True)
+    env = MeanPixelDifferenceEnv(None, None, 12, 8, preprocessor=preprocessor)
+
+    assert(env.observation_space.shape == (4, 3, 1))
+    assert(env.observation_space.dtype == np.uint8)
+
+    image = np.zeros(shape=(12, 8, 3), dtype=np.uint8)
+    image[2:4, 1:3] = [200, 100, 50]
+    image[2, 1] = [100, 100, 100]
+
+    expected = np.zeros(shape=(4, 3, 1), dtype=np.uint8)
+    expected[0, 0, 0] = np.rint(np.dot([175, 100, 62.5], LUMA_WEIGHTS))
+
+    for codec_name in ['png', 'raw', 'raw-zlib']:
+        observation = Observation.deserialize(create_codec(codec_name).encode(ArraySnapshot(image)).serialize())
+        processed = env.process_observation(observation)
+
+        assert(processed.shape == env.observation_space.shape)
+        assert(processed.dtype == np.uint8)
+        # PIL rounds block means and luma separately, so allow an off by one.
+        assert(np.abs(processed.astype(int) - expected).max() <= 1)
+
+    # Float observations keep the block means unrounded.
+    preprocessor = ObservationPreprocessor(resize_factor=2, dtype='float32')
+    observation = create_codec('raw').encode(ArraySnapshot(image))
+    processed = preprocessor.process(observation)
+
+    assert(processed.shape == preprocessor.output_shape(12, 8) == (6, 4, 3))
+    assert(processed.dtype == np.float32)
+    assert(np.allclose(processed[1, 0], [75, 50, 37.5]))
+    assert(np.allclose(processed[1, 1], [100, 50, 25]))
+
+
+def test_action_modes():
+    redis_client = create_redis_client()
+    env = create_vec_environment('MeanPixelDifferenceEnv', redis_client, ["modes"], 100, 50).environments[0]
+    env.action_buffer.clearall()
+
+    # Single taps by default, in device coordinates.
+    assert(env.action_space.shape == (2,))
+    env.action_buffer.put_elem(env.action_mode.to_action([20, 30]))
+    assert(env.action_buffer.blocking_read_elem().click_coordinate == (20, 30))
+
+    # Gesture kinds are rounded and values are clipped to the action space.
+    action = GestureActionMode(100, 50, max_duration=1000).to_action([0.8, 10, 90, 10, 120, 5000])
+    assert(action.click_coordinate is None and len(action.gestures) == 1)
+    assert(action.gestures[0].kind == GESTURE_SWIPE)
+    assert((action.gestures[0].start, action.gestures[0].end) == ((10, 90), (10, 100)))
+    assert(action.gestures[0].duration == 1000)
+
+    # Macro-actions reach the device side as one action.
+    macros = [Action((1, 2)), Action(None, gestures=[tap((5, 5)), wait(100), swipe((5, 5), (5, 50), 200)])]
+    env.action_mode = MacroActionMode(macros)
+    assert(env.action_mode.action_space.n == 2)
+
+    env.action_buffer.put_elem(env.action_mode.to_action(np.int64(1)))
+    action = env.action_buffer.blocking_read_elem()
+    assert([gesture.kind for gesture in action.gestures] == [GESTURE_TAP, GESTURE_WAIT, GESTURE_SWIPE])
+
+    redis_client.shutdown()
+    time.sleep(1)  # Allow time for the redis client to shut down
+
+
+def simulate_device(action_buffer, observation_buffer, reset_value, step_value, stop_event, executed_actions=None):
+    """
+    Answer reset actions with an image filled with reset_value and other actions with one filled with step_value. A
+    step_value of None answers clicks with an image filled with their x coordinate instead. Observations carry the
+    sequence ids of the actions they answer. Actions are appended to executed_actions, if given, as they are run.
+    """
+
+    while not stop_event.is_set():
+        for action in action_buffer.blocking_read_elems(1, timeout=1):
+            if executed_actions is not None:
+                executed_actions.append(action)
+            if action.is_reset_action:
+                value = reset_value
+            else:
+                value = action.click_coordinate[0] if step_value is None else step_value
+            image = np.full((4, 6, 3), value, dtype=np.uint8)
+            observation_buffer.put_elem(Observation(image.tobytes(), IMAGE_FORMAT_RAW_RGB, height=4, width=6,
+                                                    step_id=action.sequence_id or 0))
+
+
+def test_split_phase_step():
+    redis_client = create_redis_client()
+    env = create_vec_environment('MeanPixelDifferenceEnv', redis_client, ["split"], 4, 6).environments[0]
+
+    # Observations of actions sent before the reset are skipped.
+    env.action_buffer.clearall()
+    env.observation_buffer.clearall()
+    for step_id in [0, 1]:
+        env.observation_buffer.put_elem(Observation(np.full((4, 6, 3), 99, dtype=np.uint8).tobytes(),
+                                                    IMAGE_FORMAT_RAW_RGB, height=4, width=6, step_id=step_id))
+
+    stop_event = threading.Event()
+    device = threading.Thread(target=simulate_device, args=(env.action_buffer, env.observation_buffer, 7, None,
+                                                            stop_event))
+    device.start()
+
+    # The stale observations stand for ones that arrive after reset() clears the buffers.
+    env.next_sequence_id = 2
+    env.observation_buffer.clearall = lambda: None
+    assert(np.all(env.reset() == 7))
+
+    # Three actions in flight complete in order.
+    for x in [10, 20, 30]:
+        env.step_async([x, 0])
+    assert(env.num_actions_in_flight() == 3)
+
+    for x, previous_x in [(10, 7), (20, 10), (30, 20)]:
+        observation, reward, info = env.step_wait()
+        assert(np.all(observation == x))
+        assert(reward == x - previous_x)
+    assert(env.num_actions_in_flight() == 0)
+
+    observation, reward, info = env.step([40, 0])
+    assert(np.all(observation == 40) and reward == 10 and info['num_steps'] == 4)
+
+    stop_event.set()
+    device.join()
+
+    redis_client.shutdown()
+    time.sleep(1)  # Allow time for the redis client to shut down
+
+
+def test_pipelined_actions_run_in_order():
+    redis_client = create_redis_client()
+    env = create_vec_environment('MeanPixelDifferenceEnv', redis_client, ["ordered"], 4, 6).environments[0]
+
+    stop_event = threading.Event()
+    device = threading.Thread(target=simulate_device, args=(env.action_buffer, env.observation_buffer, 0, None,
+                                                            stop_event))
+    device.start()
+    env.reset()
+    stop_event.set()
+    device.join()
+
+    # All actions are queued before the device takes any of them, so their order is up to the buffer alone.
+    for x in [10, 20, 30, 40]:
+        env.step_async([x, 0])
+    assert(env.action_buffer.depth() == 4)
+
+    executed_actions = []
+    stop_event = threading.Event()
+    device = threading.Thread(target=simulate_device, args=(env.action_buffer, env.observation_buffer, 0, None,
+                                                            stop_event, executed_actions))
+    device.start()
+
+    for x in [10, 20, 30, 40]:
+        observation, reward, _ = env.step_wait()
+        assert(np.all(observation == x) and reward == 10)
+    assert([action.click_coordinate[0] for action in executed_actions] == [10, 20, 30, 40])
+
+    stop_event.set()
+    device.join()
+
+    redis_client.shutdown()
+    time.sleep(1)  # Allow time for the redis client to shut down
+
+
+def test_frame_skip_and_stack():
+    redis_client = create_redis_client()
+    env = create_vec_environment('MeanPixelDifferenceEnv', redis_client, ["wrapped"], 4, 6).environments[0]
+    env.action_buffer.clearall()
+    env.observation_buffer.clearall()
+
+    executed_actions = []
+    stop_event = threading.Event()
+    device = threading.Thread(target=simulate_device, args=(env.action_buffer, env.observation_buffer, 0, None,
+                                                            stop_event, executed_actions))
+    device.start()
+
+    wrapped_env = FrameStackWrapper(FrameSkipWrapper(env, 3), 3)
+    assert(wrapped_env.observation_space.shape == (3, 4, 6, 3))
+    assert(len(wrapped_env.frame_pool.frames) == 18)
+
+    # The initial observation fills the stack.
+    stack = wrapped_env.reset()
+    assert(np.asarray(stack).shape == (3, 4, 6, 3))
+    assert(np.all(np.asarray(stack) == 0))
+
+    stacks = []
+    for x in [10, 20, 30, 40]:
+        stack, reward, _ = wrapped_env.step([x, 0])
+        stacks.append(stack)
+
+        # Later repeats of every action leave the screen as it is.
+        assert(reward == x - (x - 10 if x > 10 else 0))
+
+    # The device carries out the repeats in the order they were sent.
+    sequence_ids = [action.sequence_id for action in executed_actions]
+    assert(sequence_ids == sorted(sequence_ids) and len(sequence_ids) == 1 + 4 * 3)
+    assert([action.click_coordinate[0] for action in executed_actions[1:]] == [10] * 3 + [20] * 3 + [30] * 3 + [40] * 3)
+
+    # Stacks refer to the frames in the ring, so they are only copied when materialized.
+    assert(all(np.may_share_memory(stacks[-1][i], wrapped_env.frame_pool.storage) for i in range(3)))
+    materialized = np.asarray(stacks[-1])
+    assert([materialized[i, 0, 0, 0] for i in range(3)] == [20, 30, 40])
+    assert([stacks[0][i][0, 0, 0] for i in range(3)] == [0, 0, 10])
+
+    # Stacks are overwritten once the ring wraps around their oldest frame, the initial observation for the first two.
+    for x in [50, 60]:
+        wrapped_env.step([x, 0])
+    assert(stacks[2].is_valid() and not stacks[1].is_valid())
+
+    stop_event.set()
+    device.join()
+
+    redis_client.shutdown()
+    time.sleep(1)  # Allow time for the redis client to shut down
+
+
+def test_trajectory_replay():
+    trajectory_path = tempfile.mkdtemp()
+
+    redis_client = create_redis_client()
+    env = create_vec_environment('MeanPixelDifferenceEnv', redis_client, ["recorded"], 4, 6).environments[0]
+    env.action_buffer.clearall()
+    env.observation_buffer.clearall()
+
+    stop_event = threading.Event()
+    device = threading.Thread(target=simulate_device, args=(env.action_buffer, env.observation_buffer, 5, None,
+                                                            stop_event))
+    device.start()
+
+    # Two episodes, spread over several chunks.
+    env.trajectory_recorder = TrajectoryRecorder(trajectory_path, chunk_size=200)
+    recorded_rewards = []
+    for xs in [[10, 30, 20], [50, 40]]:
+        env.reset()
+        recorded_rewards.append([env.step([x, 0])[1] for x in xs])
+    env.trajectory_recorder.close()
+
+    stop_event.set()
+    device.join()
+    redis_client.shutdown()
+
+    reader = TrajectoryReader(trajectory_path)
+    assert(len(reader.maps) > 1)
+    assert(len(reader) == 7 and reader.num_episodes() == 2)
+    assert(reader.episode_range(1) == (4, 7))
+
+    kind, action, reward, _, observation = reader.read(2)
+    assert(kind == RECORD_STEP and action.click_coordinate == (30, 0) and reward == 20)
+    assert(np.all(np.frombuffer(observation.image_bytes, dtype=np.uint8) == 30))
+    assert(reader.read(4)[0] == RECORD_RESET)
+
+    # Without the index files, and with one lagging behind its chunk, the chunks are scanned to the same records.
+    index_paths = sorted(glob.glob(os.path.join(trajectory_path, "*.idx")))
+    with open(index_paths[0], 'r+b') as fp:
+        fp.truncate(os.path.getsize(index_paths[0]) - 1)
+    assert(TrajectoryReader(trajectory_path).records == reader.records)
+    for index_path in index_paths:
+        os.remove(index_path)
+    assert(TrajectoryReader(trajectory_path).records == reader.records)
+
+    # Replays compute the rewards anew, with the recorded observations whatever the actions.
+    replay_env = ReplayAndroidDeviceEnv('MeanPixelDifferenceEnv', trajectory_path)
+    assert(replay_env.observation_space.shape == (4, 6, 3))
+
+    for episode_rewards in recorded_rewards + recorded_rewards[:1]:
+        assert(np.all(replay_env.reset() == 5))
+
+        for i, recorded_reward in enumerate(episode_rewards):
+            _, reward, info = replay_env.step([0, 0])
+            assert(reward == recorded_reward == info['recorded_reward'])
+            assert(info['episode_done'] == (i == len(episode_rewards) - 1))
+
+    shutil.rmtree(trajectory_path)
+    time.sleep(1)  # Allow time for the redis client to shut down
+
+
+def test_vec_android_device_env():
+    redis_client = create_redis_client()
+
+    vec_env = create_vec_environment('MeanPixelDifferenceEnv', redis_client, ["vec-0", "vec-1"], 4, 6,
+                                     max_episode_steps=2, auto_reset=True)
+
+    stop_event = threading.Event()
+    devices = [
+        threading.Thread(target=simulate_device, args=(env.action_buffer, env.observation_buffer, 10 * i, 10 * i + 4,
+                                                       stop_event))
+        for i, env in enumerate(vec_env.environments)
+    ]
+    for device in devices:
+        device.start()
+
+    received_observations = [[], []]
+    for i, env in enumerate(vec_env.environments):
+        env.observation_callback = received_observations[i].append
+
+    observations = vec_env.reset()
+    assert(observations.shape == (2, 4, 6, 3))
+    assert(np.all(observations[0] == 0) and np.all(observations[1] == 10))
+
+    # Actions are numbered per environment, and observations of earlier actions are skipped.
+    vec_env.environments[0].observation_buffer.put_elem(Observation(np.full((4, 6, 3), 99, dtype=np.uint8).tobytes(),
+                                                                    IMAGE_FORMAT_RAW_RGB, height=4, width=6,
+                                                                    step_id=1))
+    observations, rewards, dones, infos = vec_env.step(np.zeros((2, 2)))
+    assert(np.all(observations[0] == 4) and np.all(observations[1] == 14))
+    assert(list(rewards) == [4, 4])
+    assert(not dones.any())
+
+    # Every observation completes the step or reset of its environment, passing it to the observation callback.
+    assert([[observation.step_id for observation in env_observations] for env_observations in received_observations] ==
+           [[1, 2], [1, 2]])
+
+    # The episodes end with the second step, so the environments are reset right away.
+    observations, rewards, dones, infos = vec_env.step(np.zeros((2, 2)))
+    assert(dones.all())
+    assert(np.all(infos[1]['terminal_observation'] == 14))
+    assert(np.all(observations[0] == 0) and np.all(observations[1] == 10))
+    assert([env.num_steps for env in vec_env.environments] == [0, 0])
+
+    # Without auto-reset, done environments are left as they are until the next reset.
+    vec_env.auto_reset = False
+    vec_env.reset()
+    vec_env.environments[1].num_steps = 1
+    observations, rewards, dones, infos = vec_env.step(np.zeros((2, 2)))
+    assert(list(dones) == [False, True])
+
+    observations, rewards, dones, infos = vec_env.step(np.zeros((2, 2)))
+    assert(dones.all())
+    assert([env.num_steps for env in vec_env.environments] == [2, 2])
+    assert(list(rewards) == [0, 0] and infos[1] == {})
+    assert(np.all(observations[1] == 14))
+    assert(vec_env.environments[1].action_buffer.depth() == 0)
+
+    stop_event.set()
+    for device in devices:
+        device.join()
+
+    redis_client.shutdown()
+    time.sleep(1)  # Allow time for the redis client to shut down
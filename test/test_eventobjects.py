@@ -1,5 +1,9 @@
-from eventobjects.action import Action
-from eventobjects.observation import Observation
+import pickle
+import struct
+
+from eventobjects.action import Action, ENCODING_SIZE, GESTURE_DRAG, GESTURE_LONG_PRESS, GESTURE_SWIPE, GESTURE_TAP, \
+    GESTURE_WAIT, RESET_ACTION, drag, long_press, swipe, tap, wait
+from eventobjects.observation import Observation, ENVELOPE_HEADER_SIZE, ENVELOPE_MAGIC, IMAGE_FORMAT_PNG
 
 
 def test_action():
@@ -14,6 +18,79 @@ def test_observation():
     helper_test_observation_with_ground_truth("34324324324121jkjlkf23k4h24hlkl2k3h4lkh324lh24lkj2")
 
 
+def test_action_encodings():
+    action_str = Action((3.5, 7.25)).serialize()
+    assert Action.deserialize(action_str).click_coordinate == (3.5, 7.25)
+
+    reset_action = Action.deserialize(RESET_ACTION.serialize())
+    assert reset_action.is_reset_action
+    assert reset_action.click_coordinate is None
+
+    # Legacy pickled actions are still understood.
+    legacy_str = Action((12, 20)).serialize(use_pickle=True)
+    assert Action.deserialize(legacy_str).click_coordinate == (12, 20)
+
+    # Clicks keep the version 1 encoding.
+    assert len(action_str) == ENCODING_SIZE
+    assert Action.deserialize(action_str).gestures is None
+
+
+def test_macro_action_encodings():
+    gestures = [
+        tap((10, 20)),
+        swipe((100, 800), (100, 200), 300),
+        long_press((50, 60), 1000),
+        drag((5, 5), (300.5, 400.25), 750),
+        wait(250)
+    ]
+
+    action_prime = Action.deserialize(Action(None, gestures=gestures).serialize())
+    assert action_prime.click_coordinate is None
+    assert not action_prime.is_reset_action
+
+    assert [gesture.kind for gesture in action_prime.gestures] == \
+        [GESTURE_TAP, GESTURE_SWIPE, GESTURE_LONG_PRESS, GESTURE_DRAG, GESTURE_WAIT]
+    assert [gesture.start for gesture in action_prime.gestures] == [(10, 20), (100, 800), (50, 60), (5, 5), (0, 0)]
+    assert [gesture.end for gesture in action_prime.gestures] == \
+        [(10, 20), (100, 200), (50, 60), (300.5, 400.25), (0, 0)]
+    assert [gesture.duration for gesture in action_prime.gestures] == [0, 300, 1000, 750, 250]
+
+    assert Action.deserialize(Action(None, gestures=gestures).serialize(use_pickle=True)).gestures[3].end == \
+        (300.5, 400.25)
+
+
+def test_observation_envelope():
+    image_bytes = b'\x89PNG' + bytes(range(256)) * 4
+    observation = Observation(image_bytes, height=20, width=10, step_id=7, timestamp=1234.5, settle_time=0.25)
+
+    observation_str = observation.serialize()
+    assert len(observation_str) == ENVELOPE_HEADER_SIZE + len(image_bytes)
+
+    observation_prime = Observation.deserialize(observation_str)
+    assert observation_prime.image_bytes == image_bytes
+    assert observation_prime.image_format == IMAGE_FORMAT_PNG
+    assert (observation_prime.height, observation_prime.width) == (20, 10)
+    assert observation_prime.step_id == 7
+    assert observation_prime.timestamp == 1234.5
+    assert observation_prime.settle_time == 0.25
+
+    # The payload is a view into the serialized string, not a copy.
+    assert type(observation_prime.image_bytes) == memoryview
+    assert observation_prime.image_bytes.obj is observation_str
+
+    # Version 1 envelopes, which predate the settle time, are still understood.
+    version_1_header = struct.pack('>IBBBIIId', ENVELOPE_MAGIC, 1, IMAGE_FORMAT_PNG, 0, 20, 10, 7, 1234.5)
+    observation_prime = Observation.deserialize(version_1_header + image_bytes)
+    assert observation_prime.image_bytes == image_bytes
+    assert observation_prime.step_id == 7
+    assert observation_prime.settle_time == 0.0
+
+    # Legacy pickled observations are still understood.
+    legacy_str = pickle.dumps(image_bytes, protocol=2)
+    assert Observation.deserialize(legacy_str).image_bytes == image_bytes
+    assert Observation.deserialize(observation.serialize(use_pickle=True)).image_bytes == image_bytes
+
+
 def helper_test_action_with_ground_truth(click_coordinate):
     action = Action(click_coordinate)
     assert type(action.click_coordinate) == tuple
@@ -0,0 +1,108 @@
+import threading
+
+import frontend.session_jobs as session_jobs
+
+from eventobjects.observation import IMAGE_FORMAT_RAW_RGB, Observation
+from frontend.live_stream import LatestFrame, stream_frames
+from frontend.session_jobs import JOB_FAILED, JOB_QUEUED, JOB_RUNNING, JOB_SUCCEEDED, SessionJobManager
+from session.session_status_enum import SessionStatusEnum
+
+
+def test_live_stream():
+    latest_frame = LatestFrame()
+
+    # Nothing is published while nobody watches.
+    latest_frame.publish(Observation(b'unwatched'))
+    assert(latest_frame.frame[0] == 0)
+
+    # Streams send the latest frame published once they start.
+    latest_frame.add_viewer()
+    png_bytes = bytearray(b'first png')
+    latest_frame.publish(Observation(memoryview(png_bytes)))
+
+    finished = []
+    stream = stream_frames(latest_frame, 1000, lambda: len(finished) > 0)
+    assert(next(stream) == b'--frame\r\nContent-Type: image/png\r\nContent-Length: 9\r\n\r\n')
+    assert(latest_frame.num_viewers == 2)
+
+    # Views into buffers that may be reused are copied on publishing.
+    png_bytes[:] = b'overwrite'
+    assert(next(stream) == b'first png')
+    assert(next(stream) == b'\r\n')
+
+    # Payloads other than PNG screenshots are not published, and skipped frames are never sent.
+    latest_frame.publish(Observation(b'\0' * 12, image_format=IMAGE_FORMAT_RAW_RGB, height=2, width=2))
+    latest_frame.publish(Observation(b'second png'))
+    latest_frame.publish(Observation(b'third png'))
+    assert(latest_frame.frame[0] == 3)
+    assert(next(stream) == b'--frame\r\nContent-Type: image/png\r\nContent-Length: 9\r\n\r\n')
+    assert(next(stream) == b'third png')
+
+    # All viewers share the bytes of a frame.
+    other_stream = stream_frames(latest_frame, 1000, lambda: len(finished) > 0)
+    next(other_stream)
+    assert(next(other_stream) is latest_frame.frame[2])
+    assert(latest_frame.num_viewers == 3)
+
+    finished.append(True)
+    assert(list(stream) == [b'\r\n'])
+    other_stream.close()
+    latest_frame.remove_viewer()
+    assert(latest_frame.num_viewers == 0)
+
+
+def wait_until_finished(job):
+    while not job.is_finished():
+        job.wait_for_update(job.version, timeout=5)
+
+
+def test_session_jobs(monkeypatch):
+    # Sessions of the stub report their first step, then wait for the gate named after their agent.
+    gates = {agent_name: threading.Event() for agent_name in ["first", "second", "failing", "third"]}
+
+    def session_fn(progress_callback, observation_callback, environment_name, agent_name, num_steps):
+        progress_callback({'num_steps': 1})
+        gates[agent_name].wait()
+        if agent_name == "failing":
+            raise Exception("Session failed")
+        progress_callback({'num_steps': num_steps})
+        return SessionStatusEnum.SUCCESS
+
+    manager = SessionJobManager(max_concurrent_sessions=1, session_fn=session_fn)
+
+    first_job = manager.submit(environment_name='MeanPixelDifferenceEnv', agent_name="first", num_steps=10)
+    second_job = manager.submit(environment_name='MeanPixelDifferenceEnv', agent_name="second", num_steps=20)
+    assert(manager.get(first_job.job_id) is first_job and manager.get("missing") is None)
+
+    # Jobs wait in the queue while the sessions before them run.
+    snapshot = first_job.wait_for_update(1, timeout=5)
+    assert(snapshot['status'] == JOB_RUNNING and snapshot['progress'] == {'num_steps': 1})
+    assert(snapshot['version'] == 2 and snapshot['agent_name'] == "first" and snapshot['num_steps'] == 10)
+    assert(second_job.snapshot()['status'] == JOB_QUEUED and second_job.version == 0)
+    assert(first_job.wait_for_update(2, timeout=0.1) is None)
+
+    # Updates made while nobody waits are coalesced into the latest state.
+    gates["first"].set()
+    assert(second_job.wait_for_update(1, timeout=5)['status'] == JOB_RUNNING)
+    snapshot = first_job.wait_for_update(2, timeout=0)
+    assert(snapshot['version'] == 4 and snapshot['status'] == JOB_SUCCEEDED)
+    assert(snapshot['progress'] == {'num_steps': 10})
+
+    # Sessions that throw fail their job.
+    gates["second"].set()
+    gates["failing"].set()
+    failing_job = manager.submit(environment_name='MeanPixelDifferenceEnv', agent_name="failing", num_steps=30)
+    wait_until_finished(failing_job)
+    assert(failing_job.status == JOB_FAILED and failing_job.progress == {'num_steps': 1})
+    assert(second_job.status == JOB_SUCCEEDED)
+
+    # Only the latest finished jobs are kept around.
+    monkeypatch.setattr(session_jobs, 'MAX_FINISHED_JOBS', 1)
+    gates["third"].set()
+    third_job = manager.submit(environment_name='MeanPixelDifferenceEnv', agent_name="third", num_steps=40)
+    assert(manager.get(first_job.job_id) is None and manager.get(second_job.job_id) is None)
+    assert(manager.get(failing_job.job_id) is failing_job and manager.get(third_job.job_id) is third_job)
+
+    wait_until_finished(third_job)
+    assert(third_job.status == JOB_SUCCEEDED)
+    manager.shutdown()
@@ -0,0 +1,161 @@
+import cv2
+import numpy as np
+import os
+import threading
+import time
+
+from buffers.redis_connection import create_redis_client
+from session.live_viewer import SharedFrameBuffer
+from session.session_starter import NUM_SESSIONS_KEY, register_session, unregister_session
+from session.video_recorder import RECORDING_POLICY_BLOCK, RECORDING_POLICY_DROP, RECORDING_POLICY_SPILL, \
+    VideoRecorder
+
+
+def test_shared_frame_buffer():
+    frame_buffer = SharedFrameBuffer(4, 6)
+    out = np.zeros((4, 6, 3), dtype=np.uint8)
+
+    assert(frame_buffer.read(out) is None)
+
+    # Single channel and float frames are converted to 8 bit RGB.
+    frame_buffer.write(np.full((4, 6, 1), 7, dtype=np.uint8), "first")
+    frame_buffer.write(np.full((4, 6, 3), 8.6), "second")
+    assert(frame_buffer.read(out) == (2, "second"))
+    assert(np.all(out == 9))
+
+    # Readers only see frames newer than the last one they read, skipping any in between.
+    assert(frame_buffer.read(out, last_sequence=2) is None)
+    for value in range(10, 15):
+        frame_buffer.write(np.full((4, 6, 3), value, dtype=np.uint8), "frame {}".format(value))
+    assert(frame_buffer.read(out, last_sequence=2) == (7, "frame 14"))
+    assert(np.all(out == 14))
+
+    # A copy during which the writer came around to the slot read from is discarded.
+    frame_buffer.write(np.full((4, 6, 3), 15, dtype=np.uint8), "frame 15")
+    frame_slots = frame_buffer.frame_slots()
+
+    def frame_slots_while_writing():
+        frame_buffer.sequence.value += frame_buffer.num_slots - 1
+        return frame_slots
+
+    frame_buffer.frame_slots = frame_slots_while_writing
+    assert(frame_buffer.read(out, last_sequence=7) is None)
+
+
+def create_gated_recorder(output_path, policy):
+    """
+    Create a recorder of 16 x 16 frames holding two of them in memory, whose encoder waits for the returned gate to be
+    set before encoding every frame. The values of the encoded frames are appended to the returned list.
+    """
+
+    recorder = VideoRecorder(output_path, 10, 16, 16, queue_size=2, policy=policy)
+    gate = threading.Event()
+    encoded_values = []
+
+    write_frame = recorder.write_frame
+
+    def gated_write_frame(frame, text):
+        gate.wait()
+        encoded_values.append(int(frame[0, 0, 0]))
+        write_frame(frame, text)
+
+    recorder.write_frame = gated_write_frame
+
+    return recorder, gate, encoded_values
+
+
+def count_video_frames(video_path):
+    video = cv2.VideoCapture(video_path)
+    num_frames = 0
+    while video.read()[0]:
+        num_frames += 1
+    video.release()
+
+    return num_frames
+
+
+def test_video_recorder_block(tmpdir):
+    video_path = str(tmpdir.join('block.mp4'))
+    recorder, gate, encoded_values = create_gated_recorder(video_path, RECORDING_POLICY_BLOCK)
+
+    for value in range(2):
+        recorder.record(np.full((16, 16, 3), value, dtype=np.uint8), str(value))
+
+    # Once both slots are taken, recording waits for the encoder.
+    recording = threading.Thread(target=recorder.record, args=(np.full((16, 16, 1), 2, dtype=np.uint8), "2"))
+    recording.start()
+    recording.join(timeout=0.5)
+    assert(recording.is_alive())
+
+    gate.set()
+    recording.join()
+
+    # Closing encodes the frames still waiting.
+    recorder.record(np.full((16, 16, 3), 3.4), "3")
+    recorder.close()
+    assert(encoded_values == [0, 1, 2, 3])
+    assert(recorder.num_dropped == 0 and recorder.num_spilled == 0)
+    assert(count_video_frames(video_path) == 4)
+
+
+def test_video_recorder_drop(tmpdir):
+    video_path = str(tmpdir.join('drop.mp4'))
+    recorder, gate, encoded_values = create_gated_recorder(video_path, RECORDING_POLICY_DROP)
+
+    # Frames recorded while both slots are taken are left out of the video.
+    for value in range(5):
+        recorder.record(np.full((16, 16, 3), value, dtype=np.uint8), str(value))
+    assert(recorder.num_dropped == 3)
+
+    gate.set()
+    recorder.close()
+    assert(encoded_values == [0, 1])
+    assert(count_video_frames(video_path) == 2)
+
+
+def test_video_recorder_spill(tmpdir):
+    video_path = str(tmpdir.join('spill.mp4'))
+    recorder, gate, encoded_values = create_gated_recorder(video_path, RECORDING_POLICY_SPILL)
+    frame_size = 16 * 16 * 3
+
+    # Frames recorded while both slots are taken are spilled to disk, and encoded in the order they were recorded.
+    for value in range(5):
+        recorder.record(np.full((16, 16, 3), value, dtype=np.uint8), str(value))
+    assert(recorder.num_spilled == 3 and recorder.num_dropped == 0)
+    assert(os.path.getsize(recorder.spill_path) == 3 * frame_size)
+
+    gate.set()
+    while recorder.spill_length > 0:
+        time.sleep(0.01)
+    assert(encoded_values == [0, 1, 2, 3, 4])
+
+    # The spill file is truncated once the encoder caught up with it, and spilling starts over at its beginning.
+    assert(os.path.getsize(recorder.spill_path) == 0)
+    gate.clear()
+    for value in range(5, 8):
+        recorder.record(np.full((16, 16, 3), value, dtype=np.uint8), str(value))
+    assert(recorder.num_spilled == 4)
+    assert(os.path.getsize(recorder.spill_path) == frame_size)
+
+    gate.set()
+    recorder.close()
+    assert(encoded_values == list(range(8)))
+    assert(not os.path.exists(recorder.spill_path))
+    assert(count_video_frames(video_path) == 8)
+
+
+def test_session_counts_of_a_started_server():
+    redis_client = create_redis_client()
+
+    # Counts left over by an earlier server are dropped when a session starts the server.
+    redis_client.set(NUM_SESSIONS_KEY, 3)
+    register_session(6379, started_server=True)
+    assert(int(redis_client.get(NUM_SESSIONS_KEY)) == 1)
+
+    register_session(6379)
+    unregister_session(6379)
+    assert(int(redis_client.get(NUM_SESSIONS_KEY)) == 1)
+
+    # The last session to end shuts the server down.
+    unregister_session(6379)
+    time.sleep(1)  # Allow time for the redis client to shut down